@@ -0,0 +1,160 @@
+"""Benchmark do join de get_main_data com dados sintéticos no formato Focco.
+
+Uso: python -m benchmarks.bench_main_data [--volumes 50000] [--estoque 200000]
+"""
+import argparse
+import random
+from time import perf_counter
+
+from visualizacao_de_dados.join import join_main_data
+
+
+def gerar_dados(volumes, estoque, seed=42):
+    rnd = random.Random(seed)
+    itens = max(1, volumes // 3)
+    mascaras = [f'COR {i}#COR {i % 7}' for i in range(40)]
+
+    def chave():
+        return str(10000 + rnd.randrange(itens)), rnd.choice(mascaras)
+
+    volume_data = []
+    for i in range(volumes):
+        cod_item, mascara = chave()
+        volume_data.append(
+            {
+                'codigo_empresa': 1,
+                'codigo_produto': cod_item,
+                'produto': f'PRODUTO {cod_item}',
+                'mascara': mascara,
+                'vol': f'VOL {i % 3 + 1}/3',
+                'tmasc_item_id': 300000 + i,
+                'em_linha': rnd.choice('JN'),
+            }
+        )
+
+    def linhas(total, **campos):
+        dados = []
+        for _ in range(total):
+            cod_item, mascara = chave()
+            linha = {'cod_item': cod_item, 'mascara': mascara}
+            for nome, gerar in campos.items():
+                linha[nome] = gerar()
+            dados.append(linha)
+        return dados
+
+    stock_data = linhas(
+        estoque,
+        almox15=lambda: str(rnd.randrange(50)),
+        almox5=lambda: str(rnd.randrange(50)),
+        almoxtodos=lambda: str(rnd.randrange(50)),
+    )
+    pdv_data = linhas(estoque // 4, qtde=lambda: float(rnd.randrange(20)))
+    order_data = linhas(estoque // 4, qtde_pendente=lambda: rnd.randrange(30))
+    nfs_data = linhas(estoque // 4, media=lambda: rnd.randrange(40) / 4)
+    return volume_data, pdv_data, stock_data, order_data, nfs_data
+
+
+def join_linear(volume_data, pdv_data, stock_data, order_data, nfs_data):
+    """Implementação original (varreduras lineares), usada só para conferência."""
+    result = []
+    for item in volume_data:
+        def match(d):
+            return (
+                d['cod_item'] == item['codigo_produto']
+                and d['mascara'] == item['mascara']
+            )
+
+        fat_stock = sum([int(d['almox15']) for d in stock_data if match(d)])
+        emp_1 = sum(int(d['almox5']) for d in stock_data if match(d))
+        emp_2 = sum(int(d['almoxtodos']) for d in stock_data if match(d))
+        general_stock = fat_stock + emp_1 + emp_2
+        pdv_amount = sum([d['qtde'] for d in pdv_data if match(d)])
+        order_amount = sum([d['qtde_pendente'] for d in order_data if match(d)])
+        monthly_average = sum([d['media'] for d in nfs_data if match(d)])
+        result.append(
+            {
+                'COD EMP': item['codigo_empresa'],
+                'COD ITEM': item['codigo_produto'],
+                'DESC TECNICA': item['produto'],
+                'CONFIGURACAO': item['mascara'],
+                'VOLUME': item['vol'],
+                'ID MASCARA': item['tmasc_item_id'],
+                'EM LINHA': item['em_linha'],
+                'QTDE PDV': pdv_amount,
+                'ESTOQUE FAT': fat_stock,
+                'ESTOQUE GERAL': general_stock,
+                'DISPONIVEL': general_stock - pdv_amount,
+                'QTDE ORDEM': order_amount,
+                'DISPONIVEL PREVISTO': general_stock
+                - pdv_amount
+                + order_amount,
+                'MEDIA MENSAL': monthly_average,
+                'NECESSIDADE': general_stock
+                - pdv_amount
+                + order_amount
+                - monthly_average,
+                'SUGESTÃO': 'Produzir'
+                if general_stock - pdv_amount + order_amount - monthly_average
+                < 0
+                else '',
+                'PRODUZIR CALCULADO': '',
+            }
+        )
+    return result
+
+
+def com_floats_nao_diadicos(dados, seed):
+    """Os mesmos volumes com dezenas de linhas por item e quantidades como
+    0.1 e 0.7, sem representação exata em binário: aqui a ordem e o
+    algoritmo da soma mudam o resultado."""
+    rnd = random.Random(seed)
+    volume_data = dados[0]
+    chaves = [(v['codigo_produto'], v['mascara']) for v in volume_data[:20]]
+
+    def linhas(campo, valores):
+        return [
+            {'cod_item': cod_item, 'mascara': mascara, campo: rnd.choice(valores)}
+            for cod_item, mascara in (rnd.choice(chaves) for _ in range(1000))
+        ]
+
+    return (
+        volume_data,
+        linhas('qtde', (0.1, 0.7, 2.3, 1e16, -1e16)),
+        dados[2],
+        dados[3],
+        linhas('media', (0.1, 0.7, 0.3)),
+    )
+
+
+def conferir(seed):
+    dados = gerar_dados(300, 1200, seed=seed)
+    for caso in (dados, com_floats_nao_diadicos(dados, seed)):
+        esperado = join_linear(*caso)
+        obtido = join_main_data(*caso)
+        # repr também compara tipos (int x float) e a ordem das colunas
+        if repr(esperado) != repr(obtido):
+            raise SystemExit('Resultado do join difere da implementação original')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--volumes', type=int, default=50_000)
+    parser.add_argument('--estoque', type=int, default=200_000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    conferir(args.seed)
+    print('Conferência com a implementação original: OK')
+
+    dados = gerar_dados(args.volumes, args.estoque, seed=args.seed)
+    inicio = perf_counter()
+    resultado = join_main_data(*dados)
+    duracao = perf_counter() - inicio
+    print(
+        f'{args.volumes} volumes x {args.estoque} linhas de estoque: '
+        f'{duracao:.3f}s ({len(resultado)} linhas)'
+    )
+
+
+if __name__ == '__main__':
+    main()
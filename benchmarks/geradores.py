@@ -0,0 +1,91 @@
+"""Geradores de dados sintéticos (com semente) no formato da API Focco e das
+tabelas do inventário, para os benchmarks rodarem sem rede."""
+import json
+import random
+
+from benchmarks.bench_main_data import gerar_dados
+
+# Tamanho dos pedaços de texto entregues ao parser, como no iter_text do httpx
+TAMANHO_PEDACO = 64 * 1024
+
+
+def dados_main(linhas, seed=42):
+    """Exportações de get_main_data: `linhas` de estoque e 1/4 disso em volumes."""
+    return gerar_dados(max(1, linhas // 4), linhas, seed=seed)
+
+
+def payload_json(registros, chave='value'):
+    """Corpo da resposta Focco já serializado, como chega pela rede."""
+    return json.dumps({chave: registros}, ensure_ascii=False)
+
+
+def em_pedacos(texto, tamanho=TAMANHO_PEDACO):
+    for inicio in range(0, len(texto), tamanho):
+        yield texto[inicio:inicio + tamanho]
+
+
+def estoque_focco(linhas, seed=42):
+    """Registros da exportação de estoque (uma linha por empresa x item x máscara)."""
+    rnd = random.Random(seed)
+    itens = max(1, linhas // 6)
+    registros = []
+    for i in range(linhas):
+        cod_item = 10000 + i // 6
+        registros.append({
+            'cod_emp': 1 + i % 2,
+            'cod_item': str(cod_item),
+            'mascara': f'COR {i % 40}#COR {i % 7}',
+            'id_mascara': 300000 + i // 2,
+            'almox15': str(rnd.randrange(-2, 60)),
+            'desc_tecnica': f'PRODUTO {cod_item} {rnd.randrange(itens)}',
+        })
+    return registros
+
+
+def estoque_anterior(registros, seed=42):
+    """Estado da sincronização anterior: ~10% dos saldos mudaram, ~5% das
+    linhas saíram da API desde então e ~5% ainda não existiam."""
+    rnd = random.Random(seed + 1)
+    anterior = []
+    for registro in registros:
+        sorteio = rnd.random()
+        if sorteio < 0.05:
+            continue
+        linha = dict(registro)
+        if sorteio < 0.15:
+            linha['almox15'] = str(int(linha['almox15']) + rnd.randrange(1, 10))
+        anterior.append(linha)
+    for i in range(len(registros) // 20):
+        anterior.append({
+            'cod_emp': 1,
+            'cod_item': f'ANTIGO{i}',
+            'mascara': '',
+            'id_mascara': i,
+            'almox15': '1',
+            'desc_tecnica': f'PRODUTO FORA DE LINHA {i}',
+        })
+    return anterior
+
+
+def leituras(registros, linhas, inventario_id=1, seed=42):
+    """Linhas de itens_inventario: etiquetas lidas de itens do estoque (~90%)
+    e de itens fora dele, com repetição de item entre etiquetas."""
+    rnd = random.Random(seed + 2)
+    resultado = []
+    for i in range(linhas):
+        if rnd.random() < 0.9:
+            base = rnd.choice(registros)
+            cod_item, id_mascara, mascara = base['cod_item'], base['id_mascara'], base['mascara']
+        else:
+            cod_item, id_mascara, mascara = f'NOVO{rnd.randrange(linhas // 10 + 1)}', 0, ''
+        resultado.append({
+            'inventario_id': inventario_id,
+            'cod_barra_ord': f'{i:012d}',
+            'cod_item': cod_item,
+            'etiq_id': i,
+            'desc_tecnica': f'PRODUTO {cod_item}',
+            'mascara': mascara,
+            'tmasc_item_id': id_mascara,
+            'quantidade': rnd.randrange(1, 6),
+        })
+    return resultado
@@ -0,0 +1,339 @@
+"""Benchmarks dos caminhos quentes, com dados sintéticos e sem rede.
+
+Mede tempo (melhor de N execuções) e pico de memória Python (tracemalloc,
+numa execução à parte para não distorcer o tempo) de cada caso, em cada
+volume, e compara com benchmarks/baseline.json. Sai com código 1 se algum
+caso piorar além do limite.
+
+Uso:
+    python -m benchmarks.suite                        # 10k e 100k, compara
+    python -m benchmarks.suite --tamanhos 10k,100k,1M
+    python -m benchmarks.suite --casos comparativo,exportar_comparativo
+    python -m benchmarks.suite --salvar-baseline      # grava os resultados
+
+A baseline depende da máquina: grave-a de novo ao trocar de ambiente.
+O pico de memória não inclui o que o SQLite aloca em C.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import tracemalloc
+import warnings
+from datetime import datetime
+from time import perf_counter
+
+import openpyxl
+from sqlalchemy import delete, insert
+from sqlalchemy.orm import sessionmaker
+
+import contagens
+from benchmarks import geradores
+from comparativo import comparar, iter_comparativo
+from database import criar_engine
+from exportacao import gerar_arquivo
+from models import Base, EstoqueInventario, Inventario, ItemInventario
+from sincronizacao import aplicar_diff, carregar_staging, normalizar_item
+from visualizacao_de_dados.join import (
+    build_rows,
+    group_nfs,
+    group_orders,
+    group_pdv,
+    group_stock,
+)
+from visualizacao_de_dados.stream import iter_json_array
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+TAMANHOS_PADRAO = '10k,100k'
+
+# Piora tolerada em relação à baseline, e o mínimo absoluto que conta como
+# piora (abaixo disso é ruído de medição)
+LIMITE = 0.25
+PISO_SEGUNDOS = 0.05
+PISO_MB = 1.0
+
+COLUNAS_COMPARATIVO = {
+    'cod_item': 'Código',
+    'mascara': 'Máscara',
+    'descricao': 'Descrição',
+    'qtd_sistema': 'Qtd Sistema',
+    'qtd_lida': 'Qtd Lida',
+    'diferenca': 'Diferença',
+    'status': 'Status',
+}
+
+# Mesmas reduções de visualizacao_de_dados.api.MAIN_REDUCERS (o módulo da
+# API exige o .config.toml com as credenciais, então não é importado aqui)
+REDUCOES_MAIN = (list, group_pdv, group_stock, group_orders, group_nfs)
+
+
+class Ambiente:
+    """Banco SQLite temporário e dados gerados para um volume."""
+
+    def __init__(self, linhas, seed):
+        self.linhas = linhas
+        self.diretorio = tempfile.mkdtemp(prefix='olivar-bench-')
+        self.engine = criar_engine(f"sqlite:///{os.path.join(self.diretorio, 'bench.db')}")
+        self.Session = sessionmaker(bind=self.engine)
+        Base.metadata.create_all(self.engine)
+
+        self.main = [geradores.payload_json(d) for d in geradores.dados_main(linhas, seed)]
+        registros = geradores.estoque_focco(linhas, seed)
+        self.estoque_payload = geradores.payload_json(registros)
+        self.estoque_atual = [normalizar_item(r) for r in registros]
+        self.estoque_anterior = [normalizar_item(r) for r in geradores.estoque_anterior(registros, seed)]
+
+        with self.engine.begin() as conn:
+            conn.execute(insert(Inventario), [{'id': 1, 'nome': 'Benchmark'}])
+            conn.execute(insert(ItemInventario), geradores.leituras(registros, linhas, seed=seed))
+            conn.execute(insert(EstoqueInventario), self.estoque_atual)
+        db = self.Session()
+        contagens.recalcular(db, 1)
+        db.commit()
+        db.close()
+
+    def restaurar_estoque(self, linhas):
+        with self.engine.begin() as conn:
+            conn.execute(delete(EstoqueInventario))
+            conn.execute(insert(EstoqueInventario), linhas)
+
+    def fechar(self):
+        self.engine.dispose()
+        shutil.rmtree(self.diretorio, ignore_errors=True)
+
+
+# ============ CASOS ============
+# Cada caso recebe o ambiente e devolve (preparar, executar): só `executar`
+# entra na medição.
+
+def caso_main_data(amb):
+    """get_main_data: parse em streaming das 5 exportações + reduções + join."""
+    def executar():
+        dados = [
+            reduzir(iter_json_array(geradores.em_pedacos(texto)))
+            for reduzir, texto in zip(REDUCOES_MAIN, amb.main)
+        ]
+        return len(build_rows(*dados))
+    return None, executar
+
+
+def caso_sincronizar_estoque(amb):
+    """Sincronização do estoque: parse em streaming, staging e diff."""
+    def preparar():
+        amb.restaurar_estoque(amb.estoque_anterior)
+
+    def executar():
+        registros = iter_json_array(geradores.em_pedacos(amb.estoque_payload), ('value', 'data'))
+        carregar_staging(amb.engine, registros)
+        return aplicar_diff(amb.engine)['total']
+    return preparar, executar
+
+
+def caso_recalcular_contagens(amb):
+    """Reconstrução das contagens do inventário a partir das leituras."""
+    def executar():
+        db = amb.Session()
+        try:
+            contagens.recalcular(db, 1)
+            db.commit()
+        finally:
+            db.close()
+    return None, executar
+
+
+def caso_comparativo(amb):
+    """Primeira página do comparativo, com o resumo por status."""
+    def executar():
+        db = amb.Session()
+        try:
+            return comparar(db, 1)['total']
+        finally:
+            db.close()
+    return None, executar
+
+
+def caso_exportar_comparativo(amb):
+    """Exportação do comparativo inteiro em .xlsx."""
+    def executar():
+        db = amb.Session()
+        try:
+            arquivo = gerar_arquivo('xlsx', COLUNAS_COMPARATIVO, iter_comparativo(db, 1), 'Comparativo')
+            return sum(len(pedaco) for pedaco in arquivo)
+        finally:
+            db.close()
+    return None, executar
+
+
+CASOS = {
+    'main_data': caso_main_data,
+    'sincronizar_estoque': caso_sincronizar_estoque,
+    'recalcular_contagens': caso_recalcular_contagens,
+    'comparativo': caso_comparativo,
+    'exportar_comparativo': caso_exportar_comparativo,
+}
+
+
+# ============ CONFERÊNCIA ============
+
+# Números em todas as formas que podem ser cortadas entre dois pedaços
+# (1. | 1e | 1e+ | -), além de strings, literais e objetos aninhados
+PAYLOAD_CONFERENCIA = (
+    '{"outro": {"value": [9]}, "value": [1.5, -2.25e-3, 1E+10, 0, -7, 123456, '
+    '{"qtde": 0.1, "desc": "a,b]", "x": null, "ok": true, "n": [1e5, -0.0]}, 3.14159]}'
+)
+
+
+def conferir_stream():
+    """iter_json_array com o texto cortado em cada posição possível (e de
+    caractere em caractere) deve dar o mesmo que json.loads."""
+    esperado = repr(json.loads(PAYLOAD_CONFERENCIA)['value'])
+    cortes = [[PAYLOAD_CONFERENCIA[:i], PAYLOAD_CONFERENCIA[i:]] for i in range(len(PAYLOAD_CONFERENCIA))]
+    cortes.append(list(PAYLOAD_CONFERENCIA))
+    for pedacos in cortes:
+        try:
+            obtido = repr(list(iter_json_array(pedacos)))
+        except ValueError as e:
+            obtido = f'erro: {e}'
+        if obtido != esperado:
+            raise SystemExit(f'Parser em streaming difere do json.loads com os pedaços {pedacos[:2]!r}...')
+
+
+def conferir_xlsx():
+    """Textos com caracteres de controle e floats não finitos (NaN, inf)
+    devem sair numa planilha que o openpyxl consegue abrir."""
+    linhas = [
+        {'a': 'ctrl\x0b', 'b': 1.5, 'c': float('nan')},
+        {'a': 'a\x00b\ufffe', 'b': float('inf'), 'c': -float('inf')},
+    ]
+    arquivo = b''.join(gerar_arquivo('xlsx', {'a': 'A', 'b': 'B', 'c': 'C'}, linhas, 'Conferência'))
+    try:
+        with warnings.catch_warnings():
+            # A planilha não tem o estilo padrão que o openpyxl espera (inofensivo)
+            warnings.simplefilter('ignore', UserWarning)
+            valores = list(openpyxl.load_workbook(io.BytesIO(arquivo)).active.values)
+    except Exception as e:
+        raise SystemExit(f'Planilha gerada não abre: {e}')
+    if valores[1:] != [('ctrl', 1.5, None), ('ab', None, None)]:
+        raise SystemExit(f'Planilha gerada com valores inesperados: {valores[1:]!r}')
+
+
+# ============ MEDIÇÃO ============
+
+def medir(preparar, executar, repeticoes):
+    tempos = []
+    for _ in range(repeticoes):
+        if preparar:
+            preparar()
+        inicio = perf_counter()
+        executar()
+        tempos.append(perf_counter() - inicio)
+
+    if preparar:
+        preparar()
+    tracemalloc.start()
+    try:
+        executar()
+        pico = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'segundos': round(min(tempos), 4), 'pico_mb': round(pico / 2**20, 2)}
+
+
+def regressoes(resultado, base, limite):
+    """Métricas de um caso que pioraram além do limite em relação à baseline."""
+    problemas = []
+    for campo, piso in (('segundos', PISO_SEGUNDOS), ('pico_mb', PISO_MB)):
+        antes, agora = base.get(campo), resultado[campo]
+        if antes is not None and agora > antes * (1 + limite) and agora - antes > piso:
+            problemas.append(f'{campo} {antes} -> {agora} (+{(agora / antes - 1) * 100:.0f}%)')
+    return problemas
+
+
+def ler_tamanho(texto):
+    texto = texto.strip().lower()
+    multiplicador = {'k': 1_000, 'm': 1_000_000}.get(texto[-1:], 1)
+    return int(float(texto.rstrip('km')) * multiplicador)
+
+
+def rotulo(linhas):
+    if linhas % 1_000_000 == 0:
+        return f'{linhas // 1_000_000}M'
+    if linhas % 1_000 == 0:
+        return f'{linhas // 1_000}k'
+    return str(linhas)
+
+
+def carregar_baseline(caminho):
+    if not os.path.exists(caminho):
+        return {}
+    with open(caminho, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tamanhos', default=TAMANHOS_PADRAO, help='ex.: 10k,100k,1M')
+    parser.add_argument('--casos', default=','.join(CASOS), help='padrão: todos')
+    parser.add_argument('--repeticoes', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--limite', type=float, default=LIMITE, help='piora tolerada (0.25 = 25%%)')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--salvar-baseline', action='store_true')
+    args = parser.parse_args()
+
+    casos = [c.strip() for c in args.casos.split(',') if c.strip()]
+    desconhecidos = set(casos) - set(CASOS)
+    if desconhecidos:
+        parser.error(f"casos desconhecidos: {', '.join(sorted(desconhecidos))}")
+
+    conferir_stream()
+    print('Conferência do parser em streaming: OK')
+    conferir_xlsx()
+    print('Conferência da planilha .xlsx: OK')
+
+    baseline = carregar_baseline(args.baseline)
+    resultados = {}
+    piorou = []
+    for linhas in map(ler_tamanho, args.tamanhos.split(',')):
+        nome = rotulo(linhas)
+        inicio = perf_counter()
+        amb = Ambiente(linhas, args.seed)
+        print(f'== {nome} linhas (dados gerados em {perf_counter() - inicio:.1f}s)')
+        try:
+            for caso in casos:
+                resultado = medir(*CASOS[caso](amb), args.repeticoes)
+                resultados.setdefault(nome, {})[caso] = resultado
+                base = baseline.get('resultados', {}).get(nome, {}).get(caso, {})
+                problemas = regressoes(resultado, base, args.limite)
+                marca = 'PIOROU' if problemas else ('ok' if base else 'sem baseline')
+                print(
+                    f"   {caso:<22} {resultado['segundos']:>9.3f}s {resultado['pico_mb']:>9.1f} MB  "
+                    f"{marca}{': ' + '; '.join(problemas) if problemas else ''}"
+                )
+                piorou.extend(f'{nome}/{caso}: {p}' for p in problemas)
+        finally:
+            amb.fechar()
+
+    if args.salvar_baseline:
+        # Mescla: volumes e casos que não rodaram agora mantêm os valores antigos
+        for nome, casos_medidos in resultados.items():
+            baseline.setdefault('resultados', {}).setdefault(nome, {}).update(casos_medidos)
+        baseline['gerada_em'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        baseline['ambiente'] = f'Python {platform.python_version()} / {platform.platform()}'
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, ensure_ascii=False, indent=2)
+            f.write('\n')
+        print(f'Baseline gravada em {args.baseline}')
+    elif piorou:
+        print(f'\n{len(piorou)} regressão(ões) acima de {args.limite:.0%}:')
+        for linha in piorou:
+            print(f'  - {linha}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+import json
+import os
+import sqlite3
+import threading
+from time import time
+
+# Acumula contadores em memória e grava no SQLite a cada N operações,
+# para não transformar cada leitura do cache numa escrita.
+FLUSH_ESTATISTICAS = 50
+# A cada N gravações verifica se o cache passou do limite de itens
+INTERVALO_LIMPEZA = 100
+# Estatísticas acumuladas (tabela `estatisticas`)
+CONTADORES = ("hits", "misses", "evictions", "vencidos_servidos")
+
+
+class CacheCodigos:
+    """Cache das consultas de código de barras em um arquivo SQLite.
+
+    Compartilhado por todos os workers e preservado entre reinícios. Cada
+    entrada tem validade própria; códigos desconhecidos ficam guardados como
+    entradas negativas (valor nulo) por um tempo menor. Quando passa de
+    `max_itens`, as entradas mais antigas são descartadas.
+
+    Respostas positivas vencidas são mantidas por mais `retencao_vencidos`
+    segundos: não valem para `obter`, mas `obter_vencido` as devolve quando a
+    API está fora do ar, desde que tenham vencido há menos desse tempo.
+    """
+
+    def __init__(self, caminho, max_itens=50000, ttl=6 * 3600, ttl_negativo=60,
+                 retencao_vencidos=24 * 3600):
+        self.caminho = caminho
+        self.max_itens = max_itens
+        self.ttl = ttl
+        self.ttl_negativo = ttl_negativo
+        self.retencao_vencidos = retencao_vencidos
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pendentes = dict.fromkeys(CONTADORES, 0)
+        self._operacoes = 0
+        self._gravacoes = 0
+        with self._conexao() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS codigos (
+                    codigo TEXT PRIMARY KEY,
+                    valor TEXT,
+                    criado_em REAL NOT NULL,
+                    expira_em REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_codigos_criado_em ON codigos (criado_em)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS estatisticas (
+                    nome TEXT PRIMARY KEY,
+                    valor INTEGER NOT NULL
+                )
+            """)
+
+    def _conexao(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.caminho, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _contar(self, nome, quantidade=1):
+        with self._lock:
+            self._pendentes[nome] += quantidade
+            self._operacoes += 1
+            if self._operacoes < FLUSH_ESTATISTICAS:
+                return
+        self._gravar_estatisticas()
+
+    def _gravar_estatisticas(self):
+        with self._lock:
+            pendentes = {k: v for k, v in self._pendentes.items() if v}
+            self._pendentes = dict.fromkeys(self._pendentes, 0)
+            self._operacoes = 0
+        if not pendentes:
+            return
+        with self._conexao() as conn:
+            conn.executemany(
+                "INSERT INTO estatisticas (nome, valor) VALUES (?, ?) "
+                "ON CONFLICT(nome) DO UPDATE SET valor = valor + excluded.valor",
+                pendentes.items(),
+            )
+
+    def obter(self, codigo):
+        """Retorna (encontrado, valor). `valor` None é uma entrada negativa."""
+        row = self._conexao().execute(
+            "SELECT valor FROM codigos WHERE codigo = ? AND expira_em > ?",
+            (codigo, time()),
+        ).fetchone()
+        if row is None:
+            self._contar("misses")
+            return False, None
+        self._contar("hits")
+        return True, json.loads(row[0]) if row[0] is not None else None
+
+    def obter_vencido(self, codigo):
+        """Última resposta positiva do código, mesmo vencida há até
+        `retencao_vencidos` segundos; None se não houver."""
+        row = self._conexao().execute(
+            "SELECT valor FROM codigos WHERE codigo = ? AND valor IS NOT NULL AND expira_em > ?",
+            (codigo, time() - self.retencao_vencidos),
+        ).fetchone()
+        if row is None:
+            return None
+        self._contar("vencidos_servidos")
+        return json.loads(row[0])
+
+    def gravar(self, codigo, valor):
+        agora = time()
+        ttl = self.ttl if valor is not None else self.ttl_negativo
+        with self._conexao() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO codigos (codigo, valor, criado_em, expira_em) "
+                "VALUES (?, ?, ?, ?)",
+                (codigo, json.dumps(valor) if valor is not None else None, agora, agora + ttl),
+            )
+        with self._lock:
+            self._gravacoes += 1
+            limpar = self._gravacoes % INTERVALO_LIMPEZA == 0
+        if limpar:
+            self.limpar()
+
+    def invalidar(self, codigo):
+        with self._conexao() as conn:
+            conn.execute("DELETE FROM codigos WHERE codigo = ?", (codigo,))
+
+    def limpar(self):
+        """Remove entradas vencidas e, se preciso, as mais antigas além do limite."""
+        with self._conexao() as conn:
+            agora = time()
+            vencidas = conn.execute(
+                "DELETE FROM codigos WHERE expira_em <= ? AND (valor IS NULL OR expira_em <= ?)",
+                (agora, agora - self.retencao_vencidos),
+            ).rowcount
+            excesso = conn.execute("SELECT COUNT(*) FROM codigos").fetchone()[0] - self.max_itens
+            if excesso > 0:
+                conn.execute(
+                    "DELETE FROM codigos WHERE codigo IN "
+                    "(SELECT codigo FROM codigos ORDER BY criado_em LIMIT ?)",
+                    (excesso,),
+                )
+        despejadas = vencidas + max(excesso, 0)
+        if despejadas:
+            self._contar("evictions", despejadas)
+
+    def estatisticas(self):
+        self._gravar_estatisticas()
+        conn = self._conexao()
+        stats = dict.fromkeys(CONTADORES, 0)
+        stats.update(conn.execute("SELECT nome, valor FROM estatisticas").fetchall())
+        entradas, negativas = conn.execute(
+            "SELECT COUNT(*), COUNT(*) - COUNT(valor) FROM codigos WHERE expira_em > ?",
+            (time(),),
+        ).fetchone()
+        total = stats["hits"] + stats["misses"]
+        stats.update({
+            "entradas": entradas,
+            "negativas": negativas,
+            "max_itens": self.max_itens,
+            "hit_ratio": round(stats["hits"] / total, 4) if total else None,
+        })
+        return stats
+
+
+def criar_cache(basedir):
+    return CacheCodigos(
+        os.getenv("CACHE_CODIGOS_PATH", os.path.join(basedir, "cache_codigos.db")),
+        max_itens=int(os.getenv("CACHE_CODIGOS_MAX", "50000")),
+        ttl=float(os.getenv("CACHE_CODIGOS_TTL", str(6 * 3600))),
+        ttl_negativo=float(os.getenv("CACHE_CODIGOS_TTL_NEGATIVO", "60")),
+        retencao_vencidos=float(os.getenv("CACHE_CODIGOS_RETENCAO_VENCIDOS", str(24 * 3600))),
+    )
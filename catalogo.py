@@ -0,0 +1,290 @@
+"""Espelho local do catálogo de etiquetas (cod_barra_ord -> item).
+
+A leitura de uma etiqueta consulta primeiro a tabela `catalogo_codigos`
+(busca pela chave primária, sem rede); a API fica só para códigos que o
+espelho ainda não conhece.
+"""
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+from time import perf_counter
+
+from sqlalchemy import bindparam, delete, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+import logs
+from models import CargaCatalogo, CatalogoCodigo, StatusSincronizacao
+
+TAMANHO_PAGINA = 1000
+PAGINAS_PARALELAS = 4
+# Abaixo desta fração do espelho atual a carga é tratada como incompleta e
+# não remove nada (API devolvendo menos que o catálogo inteiro)
+PROPORCAO_MINIMA = 0.5
+
+# Campos do item guardados no espelho (além da chave cod_barra_ord)
+CAMPOS = ('cod_emp', 'etiq_id', 'cod_item', 'desc_tecnica', 'mascara', 'tmasc_item_id', 'qtde')
+
+codigos = CatalogoCodigo.__table__
+cargas = CargaCatalogo.__table__
+
+log = logs.obter("catalogo")
+
+
+def normalizar_codigo(item):
+    """Converte um registro da API de códigos de barras no item usado nas leituras."""
+    t_id = item.get('tmasc_item_id')
+    return {
+        'cod_emp': item.get('cod_emp'),
+        'etiq_id': item.get('etiq_id'),
+        'cod_barra_ord': item.get('cod_barra_ord'),
+        'cod_item': str(item.get('cod_item', '')).strip(),
+        'desc_tecnica': item.get('desc_tecnica'),
+        'mascara': item.get('mascara'),
+        'tmasc_item_id': int(t_id) if t_id is not None else 0,
+        'qtde': item.get('qtde'),
+    }
+
+
+def _linha_espelho(item):
+    """Linha de catalogo_codigos; None para registros que o espelho não guarda
+    (sem etiqueta ou com quantidade ilegível: esses seguem indo à API)."""
+    linha = normalizar_codigo(item)
+    if not linha['cod_barra_ord'] or not linha['cod_item']:
+        return None
+    linha['cod_barra_ord'] = str(linha['cod_barra_ord']).strip()
+    if linha['qtde'] is not None:
+        try:
+            linha['qtde'] = float(linha['qtde'])
+        except (TypeError, ValueError):
+            return None
+    return linha
+
+
+def estado(carga, registros=None):
+    return {
+        'id': carga.id,
+        'status': carga.status.value,
+        'paginas': carga.paginas,
+        'recebidos': carga.recebidos,
+        'inseridos': carga.inseridos,
+        'atualizados': carga.atualizados,
+        'removidos': carga.removidos,
+        'erro': carga.erro,
+        'registros_no_espelho': registros,
+        'iniciado_em': carga.iniciado_em.strftime('%d/%m/%Y %H:%M:%S') if carga.iniciado_em else '-',
+        'finalizado_em': carga.finalizado_em.strftime('%d/%m/%Y %H:%M:%S') if carga.finalizado_em else '-',
+    }
+
+
+class CatalogoCodigos:
+    """Mantém o espelho do catálogo e responde às buscas por etiqueta.
+
+    A carga baixa o catálogo inteiro em páginas Skip/Take, `paginas_paralelas`
+    por vez, e atualiza a tabela no lugar: só etiquetas novas ou com valores
+    diferentes são regravadas, e as que sumiram da API são removidas no fim
+    (se a carga parecer incompleta, nada é removido).
+    O espelho continua respondendo durante a carga. Como na sincronização de
+    estoque, o índice único em `cargas_catalogo.ativo` garante uma carga por
+    vez entre processos. `baixar_pagina(skip, take)` devolve a lista de
+    registros da página.
+    """
+
+    def __init__(self, engine, session_factory, baixar_pagina, tamanho_pagina=TAMANHO_PAGINA,
+                 paginas_paralelas=PAGINAS_PARALELAS, validade=timedelta(minutes=30),
+                 travado_apos=timedelta(minutes=10)):
+        self.engine = engine
+        self.Session = session_factory
+        self.baixar_pagina = baixar_pagina
+        self.tamanho_pagina = tamanho_pagina
+        self.paginas_paralelas = paginas_paralelas
+        self.validade = validade
+        self.travado_apos = travado_apos
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="catalogo")
+
+    def buscar(self, codigo):
+        """Item da etiqueta no espelho, ou None se ela não estiver lá."""
+        with self.engine.connect() as conn:
+            linha = conn.execute(select(codigos).where(codigos.c.cod_barra_ord == codigo)).first()
+        if linha is None:
+            return None
+        item = {c: getattr(linha, c) for c in CAMPOS}
+        item['cod_barra_ord'] = linha.cod_barra_ord
+        return item
+
+    def estado_atual(self, db):
+        carga = db.query(CargaCatalogo).order_by(CargaCatalogo.id.desc()).first()
+        if carga is None:
+            return None
+        return estado(carga, db.query(func.count()).select_from(CatalogoCodigo).scalar())
+
+    def iniciar(self, forcar=False):
+        """Inicia uma carga em segundo plano. Retorna (estado, nova).
+
+        Sem `forcar`, não faz nada se a última carga concluída tiver menos de
+        `validade`; se houver uma em andamento, devolve o estado dela.
+        """
+        db = self.Session()
+        try:
+            agora = datetime.now()
+            # Carga "ativa" sem batimento há muito tempo: o processo dela morreu
+            db.query(CargaCatalogo).filter(
+                CargaCatalogo.ativo.is_(True),
+                CargaCatalogo.atualizado_em < agora - self.travado_apos,
+            ).update({
+                "status": StatusSincronizacao.ERRO, "ativo": None, "finalizado_em": agora,
+                "erro": "Interrompida (processo encerrado durante a carga)",
+            }, synchronize_session=False)
+            db.commit()
+
+            ativa = db.query(CargaCatalogo).filter(CargaCatalogo.ativo.is_(True)).first()
+            if ativa:
+                return estado(ativa), False
+            if not forcar:
+                recente = db.query(CargaCatalogo).filter(
+                    CargaCatalogo.status == StatusSincronizacao.CONCLUIDO,
+                    CargaCatalogo.finalizado_em > agora - self.validade,
+                ).order_by(CargaCatalogo.id.desc()).first()
+                if recente:
+                    return estado(recente), False
+
+            carga = CargaCatalogo(ativo=True, status=StatusSincronizacao.EXECUTANDO,
+                                  iniciado_em=agora, atualizado_em=agora)
+            db.add(carga)
+            try:
+                db.commit()
+            except IntegrityError:
+                # Outro processo iniciou uma carga entre a verificação e o INSERT
+                db.rollback()
+                ativa = db.query(CargaCatalogo).filter(CargaCatalogo.ativo.is_(True)).first()
+                return (estado(ativa) if ativa else None), False
+            self._executor.submit(self._executar, carga.id)
+            return estado(carga), True
+        finally:
+            db.close()
+
+    def _gravar_pagina(self, carga_id, registros):
+        linhas = {}
+        for item in registros:
+            linha = _linha_espelho(item)
+            if linha:
+                # Etiqueta repetida na página: vale a última
+                linhas[linha['cod_barra_ord']] = linha
+
+        agora = datetime.now()
+        with self.engine.begin() as conn:
+            existentes = {
+                r.cod_barra_ord: r for r in conn.execute(
+                    select(codigos).where(codigos.c.cod_barra_ord.in_(list(linhas)))
+                )
+            } if linhas else {}
+            novas, mudadas, iguais = [], [], []
+            for chave, linha in linhas.items():
+                atual = existentes.get(chave)
+                if atual is None:
+                    novas.append({**linha, 'carga_id': carga_id, 'atualizado_em': agora})
+                elif any(getattr(atual, c) != linha[c] for c in CAMPOS):
+                    mudadas.append({**{c: linha[c] for c in CAMPOS}, 'chave': chave})
+                else:
+                    iguais.append(chave)
+
+            if novas:
+                conn.execute(insert(codigos), novas)
+            if mudadas:
+                conn.execute(
+                    update(codigos).where(codigos.c.cod_barra_ord == bindparam('chave'))
+                    .values(carga_id=carga_id, atualizado_em=agora),
+                    mudadas,
+                )
+            if iguais:
+                # Sem mudança: só marca que a etiqueta continua no catálogo
+                conn.execute(update(codigos).where(codigos.c.cod_barra_ord.in_(iguais)).values(carga_id=carga_id))
+            conn.execute(update(cargas).where(cargas.c.id == carga_id).values(
+                paginas=cargas.c.paginas + 1,
+                recebidos=cargas.c.recebidos + len(registros),
+                inseridos=cargas.c.inseridos + len(novas),
+                atualizados=cargas.c.atualizados + len(mudadas),
+                atualizado_em=agora,
+            ))
+
+    def _baixar_tudo(self, carga_id):
+        """Busca as páginas em paralelo até a primeira página vazia.
+
+        Uma página com menos de `tamanho_pagina` registros não encerra a
+        carga (a API pode limitar o Take); só a vazia. As páginas são pedidas
+        em ordem e gravadas nesta thread, à medida que chegam. Retorna
+        (recebidos, completa): a carga é incompleta se alguma página antes
+        da última veio curta ou se veio algo depois da página vazia.
+        """
+        recebidos = 0
+        proxima = 0
+        fim = None
+        tamanhos = {}
+        with ThreadPoolExecutor(self.paginas_paralelas, thread_name_prefix="catalogo-pagina") as executor:
+            pendentes = {}
+
+            def pedir():
+                nonlocal proxima
+                futuro = executor.submit(self.baixar_pagina, proxima * self.tamanho_pagina, self.tamanho_pagina)
+                pendentes[futuro] = proxima
+                proxima += 1
+
+            for _ in range(self.paginas_paralelas):
+                pedir()
+            while pendentes:
+                prontas, _ = wait(pendentes, return_when=FIRST_COMPLETED)
+                for futuro in prontas:
+                    pagina = pendentes.pop(futuro)
+                    try:
+                        registros = futuro.result()
+                    except Exception:
+                        for outro in pendentes:
+                            outro.cancel()
+                        raise
+                    self._gravar_pagina(carga_id, registros)
+                    recebidos += len(registros)
+                    tamanhos[pagina] = len(registros)
+                    if not registros:
+                        fim = pagina if fim is None else min(fim, pagina)
+                    if fim is None:
+                        pedir()
+        completa = (
+            all(tamanhos[p] == self.tamanho_pagina for p in range(fim - 1))
+            and not any(tamanhos[p] for p in tamanhos if p > fim)
+        )
+        return recebidos, completa
+
+    def _executar(self, carga_id):
+        inicio = perf_counter()
+        try:
+            with self.engine.connect() as conn:
+                anteriores = conn.execute(select(func.count()).select_from(codigos)).scalar()
+            recebidos, completa = self._baixar_tudo(carga_id)
+            aviso = None
+            if not recebidos:
+                aviso = "API não devolveu registros; espelho mantido"
+            elif not completa:
+                aviso = "Páginas incompletas; etiquetas ausentes não foram removidas"
+            elif recebidos < anteriores * PROPORCAO_MINIMA:
+                aviso = f"Recebidos {recebidos} de {anteriores} no espelho; etiquetas ausentes não foram removidas"
+            with self.engine.begin() as conn:
+                removidos = 0
+                if aviso is None:
+                    # Não vistas nesta carga: saíram do catálogo
+                    removidos = conn.execute(delete(codigos).where(codigos.c.carga_id != carga_id)).rowcount
+                conn.execute(update(cargas).where(cargas.c.id == carga_id).values(
+                    status=StatusSincronizacao.CONCLUIDO, ativo=None, removidos=removidos, erro=aviso,
+                    finalizado_em=datetime.now(), atualizado_em=datetime.now(),
+                ))
+            (log.warning if aviso else log.info)("Carga do catálogo concluída", extra=logs.campos(
+                carga_id=carga_id, recebidos=recebidos, removidos=removidos, aviso=aviso,
+                segundos=round(perf_counter() - inicio, 3),
+            ))
+        except Exception as e:
+            log.exception("Carga do catálogo falhou", extra=logs.campos(carga_id=carga_id))
+            try:
+                with self.engine.begin() as conn:
+                    conn.execute(update(cargas).where(cargas.c.id == carga_id).values(
+                        status=StatusSincronizacao.ERRO, ativo=None, erro=str(e)[:500],
+                        finalizado_em=datetime.now(),
+                    ))
+            except Exception:
+                log.exception("Não foi possível registrar a falha da carga", extra=logs.campos(carga_id=carga_id))
@@ -0,0 +1,138 @@
+from sqlalchemy import and_, case, exists, func, literal, or_, select, union_all
+
+from models import ContagemInventario, EstoqueInventario
+
+contagens = ContagemInventario.__table__
+estoque = EstoqueInventario.__table__
+
+# Filtros aceitos em ?status=; "divergente" junta falta e sobra
+STATUS = ("ok", "falta", "sobra", "divergente")
+
+
+def _mesmo_item(c, e):
+    return and_(e.c.cod_item == c.c.cod_item, e.c.id_mascara == c.c.tmasc_item_id)
+
+
+def consulta_comparativo(inv_id):
+    """Leituras x estoque do inventário numa única consulta.
+
+    Une (UNION ALL) os itens lidos, com o estoque da mesma chave somado entre
+    empresas, e o estoque com saldo que nunca foi lido (anti-join), que aparece
+    como falta. Diferença e status são calculados no banco.
+    """
+    lidos = (
+        select(
+            contagens.c.cod_item,
+            contagens.c.tmasc_item_id.label("id_mascara"),
+            func.coalesce(func.max(estoque.c.mascara), "").label("mascara"),
+            func.coalesce(func.nullif(func.max(estoque.c.desc_tecnica), ""), contagens.c.descricao)
+            .label("descricao"),
+            contagens.c.quantidade.label("qtd_lida"),
+            func.coalesce(func.sum(estoque.c.qtd_almox15), 0).label("qtd_sistema"),
+        )
+        .select_from(contagens.outerjoin(estoque, _mesmo_item(contagens, estoque)))
+        .where(contagens.c.inventario_id == inv_id)
+        .group_by(contagens.c.cod_item, contagens.c.tmasc_item_id,
+                  contagens.c.quantidade, contagens.c.descricao)
+    )
+    nao_lidos = (
+        select(
+            estoque.c.cod_item,
+            estoque.c.id_mascara,
+            func.coalesce(func.max(estoque.c.mascara), "").label("mascara"),
+            func.max(estoque.c.desc_tecnica).label("descricao"),
+            literal(0).label("qtd_lida"),
+            func.coalesce(func.sum(estoque.c.qtd_almox15), 0).label("qtd_sistema"),
+        )
+        .where(~exists().where(
+            contagens.c.inventario_id == inv_id, _mesmo_item(contagens, estoque)
+        ))
+        .group_by(estoque.c.cod_item, estoque.c.id_mascara)
+        # Sem saldo e sem leitura não há o que conferir
+        .having(func.coalesce(func.sum(estoque.c.qtd_almox15), 0) != 0)
+    )
+    linhas = union_all(lidos, nao_lidos).subquery("comparativo")
+
+    diferenca = linhas.c.qtd_lida - linhas.c.qtd_sistema
+    status = case((diferenca == 0, "ok"), (diferenca < 0, "falta"), else_="sobra")
+    return select(
+        linhas.c.cod_item,
+        linhas.c.id_mascara,
+        linhas.c.mascara,
+        linhas.c.descricao,
+        linhas.c.qtd_lida,
+        linhas.c.qtd_sistema,
+        diferenca.label("diferenca"),
+        status.label("status"),
+    ).subquery("resultado")
+
+
+def _linha(r):
+    return {
+        "cod_item": r.cod_item,
+        "id_mascara": r.id_mascara,
+        "mascara": r.mascara,
+        "descricao": r.descricao,
+        "qtd_lida": float(r.qtd_lida),
+        "qtd_sistema": float(r.qtd_sistema),
+        "diferenca": float(r.diferenca),
+        "status": r.status,
+    }
+
+
+def _ordenada(r, filtros=()):
+    return (
+        select(r).where(*filtros)
+        .order_by(case((r.c.diferenca == 0, 1), else_=0), r.c.cod_item, r.c.id_mascara)
+    )
+
+
+def iter_comparativo(db, inv_id, lote=1000):
+    """Todas as linhas do comparativo, lidas do banco em lotes (exportação)."""
+    consulta = _ordenada(consulta_comparativo(inv_id)).execution_options(yield_per=lote)
+    for linha in db.execute(consulta):
+        yield _linha(linha)
+
+
+def comparar(db, inv_id, status=None, busca="", pagina=1, por_pagina=100):
+    """Página do comparativo, filtrada por status e texto (código, descrição
+    ou máscara). Divergentes primeiro, depois por código. `por_pagina=0`
+    devolve tudo. `resumo` conta os status do inventário inteiro.
+    """
+    r = consulta_comparativo(inv_id)
+    filtros = []
+    if status == "divergente":
+        filtros.append(r.c.diferenca != 0)
+    elif status:
+        filtros.append(r.c.status == status)
+    if busca:
+        # Texto literal, como a busca do dashboard: % e _ não são curingas
+        literal = busca.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        termo = f"%{literal}%"
+        filtros.append(or_(*(c.ilike(termo, escape="\\") for c in (r.c.cod_item, r.c.descricao, r.c.mascara))))
+
+    consulta = _ordenada(r, filtros)
+    if por_pagina:
+        consulta = consulta.limit(por_pagina).offset((max(pagina, 1) - 1) * por_pagina)
+    linhas = [_linha(l) for l in db.execute(consulta)]
+
+    resumo = dict.fromkeys(("ok", "falta", "sobra"), 0)
+    resumo.update(db.execute(select(r.c.status, func.count()).group_by(r.c.status)).all())
+    # Sem busca, o total filtrado sai do próprio resumo
+    if busca:
+        filtrados = db.execute(select(func.count()).select_from(r).where(*filtros)).scalar()
+    elif status == "divergente":
+        filtrados = resumo["falta"] + resumo["sobra"]
+    elif status:
+        filtrados = resumo[status]
+    else:
+        filtrados = sum(resumo.values())
+
+    return {
+        "total": sum(resumo.values()),
+        "filtrados": filtrados,
+        "pagina": pagina,
+        "por_pagina": por_pagina,
+        "resumo": resumo,
+        "linhas": linhas,
+    }
@@ -0,0 +1,83 @@
+from sqlalchemy import case, delete, func, insert, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import ContagemInventario, ItemInventario
+
+contagens = ContagemInventario.__table__
+itens = ItemInventario.__table__
+
+
+def somar_leituras(db, novos):
+    """Acrescenta os itens recém-inseridos às contagens, na transação de `db`.
+
+    Um único upsert por chave (inventario_id, cod_item, tmasc_item_id), em
+    ordem fixa para que lotes concorrentes travem as linhas na mesma ordem.
+    """
+    somas = {}
+    for item in novos:
+        chave = (item.inventario_id, item.cod_item, item.tmasc_item_id)
+        soma = somas.get(chave)
+        if soma is None:
+            soma = somas[chave] = {
+                "inventario_id": chave[0], "cod_item": chave[1], "tmasc_item_id": chave[2],
+                "quantidade": 0, "leituras": 0, "descricao": item.desc_tecnica,
+            }
+        soma["quantidade"] += item.quantidade or 0
+        soma["leituras"] += 1
+        if item.desc_tecnica is not None and (soma["descricao"] is None or item.desc_tecnica > soma["descricao"]):
+            soma["descricao"] = item.desc_tecnica
+    if not somas:
+        return
+
+    upsert = postgresql_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+    stmt = upsert(contagens)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[contagens.c.inventario_id, contagens.c.cod_item, contagens.c.tmasc_item_id],
+        set_={
+            "quantidade": contagens.c.quantidade + stmt.excluded.quantidade,
+            "leituras": contagens.c.leituras + stmt.excluded.leituras,
+            # Mesma regra do max(desc_tecnica) usado em recalcular()
+            "descricao": case(
+                (contagens.c.descricao.is_(None), stmt.excluded.descricao),
+                (stmt.excluded.descricao > contagens.c.descricao, stmt.excluded.descricao),
+                else_=contagens.c.descricao,
+            ),
+        },
+    )
+    db.execute(stmt, [somas[chave] for chave in sorted(somas)])
+
+
+def remover_inventario(db, inv_id):
+    db.execute(delete(contagens).where(contagens.c.inventario_id == inv_id))
+
+
+def recalcular(db, inv_id=None):
+    """Reconstrói as contagens a partir das leituras (todas ou de um inventário)."""
+    agrupado = select(
+        itens.c.inventario_id, itens.c.cod_item, itens.c.tmasc_item_id,
+        func.coalesce(func.sum(itens.c.quantidade), 0),
+        func.count(),
+        func.max(itens.c.desc_tecnica),
+    ).group_by(itens.c.inventario_id, itens.c.cod_item, itens.c.tmasc_item_id)
+    limpar = delete(contagens)
+    if inv_id is not None:
+        agrupado = agrupado.where(itens.c.inventario_id == inv_id)
+        limpar = limpar.where(contagens.c.inventario_id == inv_id)
+
+    db.execute(limpar)
+    db.execute(insert(contagens).from_select(
+        ["inventario_id", "cod_item", "tmasc_item_id", "quantidade", "leituras", "descricao"],
+        agrupado,
+    ))
+
+
+def inventarios_sem_contagem(db):
+    """Inventários com leituras mas sem contagens (anteriores à tabela)."""
+    com_contagem = select(contagens.c.inventario_id).distinct()
+    return [
+        inv_id for (inv_id,) in db.execute(
+            select(itens.c.inventario_id).distinct()
+            .where(itens.c.inventario_id.not_in(com_contagem))
+        )
+    ]
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
-from database import engine
+from database import engine, Session
 from models import Base, User
+import contagens
 
 print("=" * 60)
 print("🗄️  CRIANDO TABELAS NO BANCO DE DADOS")
@@ -9,6 +10,38 @@ print("=" * 60)
 try:
     Base.metadata.create_all(engine)
     print("\n✅ Tabelas criadas com sucesso!")
+
+    # create_all não cria índices novos em tabelas que já existiam
+    for tabela in Base.metadata.sorted_tables:
+        for indice in tabela.indexes:
+            try:
+                indice.create(engine, checkfirst=True)
+            except Exception as e:
+                print(f"\n⚠️  Índice {indice.name} não criado: {e}")
+                if indice.unique:
+                    print("   Remova os registros duplicados da tabela e rode este script novamente.")
+
+    # Índices de chave antigos, substituídos pelos de coalesce(cod_emp, -1)
+    with engine.begin() as conn:
+        for antigo in ("ix_estoque_inventario_chave", "ix_estoque_staging_chave"):
+            conn.exec_driver_sql(f"DROP INDEX IF EXISTS {antigo}")
+
+    # create_all não acrescenta valores a um ENUM que já existe no PostgreSQL
+    if engine.dialect.name == "postgresql":
+        with engine.begin() as conn:
+            conn.exec_driver_sql("ALTER TYPE statusleitura ADD VALUE IF NOT EXISTS 'INDISPONIVEL'")
+
+    # Contagens do comparativo para inventários lidos antes da tabela existir
+    db = Session()
+    try:
+        pendentes = contagens.inventarios_sem_contagem(db)
+        for inv_id in pendentes:
+            contagens.recalcular(db, inv_id)
+        db.commit()
+        if pendentes:
+            print(f"\n✅ Contagens preenchidas para {len(pendentes)} inventário(s)")
+    finally:
+        db.close()
     
     from sqlalchemy import inspect
     inspector = inspect(engine)
@@ -0,0 +1,238 @@
+"""Feed de eventos por inventário (Server-Sent Events).
+
+Os eventos são gravados em `eventos_inventario` na mesma transação da
+mudança que descrevem, então todos os processos enxergam todos os eventos.
+Cada processo tem uma única thread que lê os eventos novos (só enquanto há
+assinantes) e distribui para a fila de cada conexão.
+
+Os ids são reservados no INSERT, mas as transações terminam em qualquer
+ordem: o evento 41 pode aparecer depois do 42. Por isso, além dos ids acima
+do último lido, cada leitura procura de novo os ids pulados (lacunas) por
+JANELA_LACUNA_S segundos; depois disso a lacuna é tida como rollback. A
+entrega é "pelo menos uma vez": na reconexão, eventos recentes abaixo do
+Last-Event-ID podem ser reenviados, e o cliente deve tolerar repetições.
+
+Cada conexão SSE fica parada esperando na sua fila. Para manter centenas de
+conexões ociosas por worker sem uma thread de SO para cada, rode com um
+worker gevent (ex.: `gunicorn -k gevent -w 2 main:app`): o monkey patching
+transforma filas, locks e sleeps em operações cooperativas de greenlets.
+"""
+import json
+import queue
+import threading
+from datetime import datetime, timedelta
+from time import monotonic, sleep
+
+from sqlalchemy import func, or_
+
+import logs
+from models import EventoInventario
+
+log = logs.obter("eventos")
+
+# Comentário SSE enviado periodicamente para manter proxies com a conexão aberta
+KEEPALIVE_S = 15
+# Por quanto tempo um id pulado ainda pode aparecer (transação em andamento)
+JANELA_LACUNA_S = 30
+# Lacunas acompanhadas no máximo (um salto maior na sequência não é seguido)
+MAX_LACUNAS = 1000
+# Eventos reenviados numa reconexão; acima disso o cliente recebe "resync"
+LIMITE_RECUPERACAO = 500
+
+
+def registrar_evento(db, inventario_id, tipo, dados):
+    """Adiciona o evento à transação atual; ele só é publicado após o commit."""
+    db.add(EventoInventario(
+        inventario_id=inventario_id,
+        tipo=tipo,
+        dados=json.dumps(dados, ensure_ascii=False, default=str),
+        criado_em=datetime.now(),
+    ))
+
+
+def formatar_sse(evento_id, tipo, dados):
+    return f"id: {evento_id}\nevent: {tipo}\ndata: {dados}\n\n"
+
+
+class Assinatura:
+    def __init__(self, inventario_id, max_fila=1000):
+        self.inventario_id = inventario_id
+        self.fila = queue.Queue(maxsize=max_fila)
+        self.atrasada = False
+
+    def entregar(self, evento):
+        try:
+            self.fila.put_nowait(evento)
+        except queue.Full:
+            # Cliente lento: encerra o stream; o EventSource reconecta
+            # com Last-Event-ID e recupera o que perdeu do banco
+            self.atrasada = True
+
+
+class BrokerEventos:
+    def __init__(self, session_factory, intervalo=1.0, retencao=timedelta(hours=6)):
+        self.Session = session_factory
+        self.intervalo = intervalo
+        self.retencao = retencao
+        self._assinaturas = {}
+        self._lock = threading.Lock()
+        self._tem_assinantes = threading.Event()
+        self._ultimo_id = None
+        self._lacunas = {}  # id pulado -> monotonic() de quando foi visto
+        self._thread = None
+
+    def assinar(self, inventario_id):
+        assinatura = Assinatura(inventario_id)
+        with self._lock:
+            self._assinaturas.setdefault(inventario_id, set()).add(assinatura)
+            self._tem_assinantes.set()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="eventos", daemon=True)
+                self._thread.start()
+        return assinatura
+
+    def cancelar(self, assinatura):
+        with self._lock:
+            grupo = self._assinaturas.get(assinatura.inventario_id, set())
+            grupo.discard(assinatura)
+            if not grupo:
+                self._assinaturas.pop(assinatura.inventario_id, None)
+            if not self._assinaturas:
+                self._tem_assinantes.clear()
+
+    def total_assinantes(self):
+        with self._lock:
+            return sum(len(g) for g in self._assinaturas.values())
+
+    def eventos_desde(self, inventario_id, ultimo_id, limite=LIMITE_RECUPERACAO):
+        """Eventos gravados após `ultimo_id` (reconexão com Last-Event-ID),
+        mais os recentes abaixo dele, que podem ter sido confirmados depois.
+
+        Retorna (eventos, completo); com mais de `limite` eventos, devolve só
+        os primeiros e completo=False.
+        """
+        recentes = datetime.now() - timedelta(seconds=JANELA_LACUNA_S)
+        db = self.Session()
+        try:
+            eventos = [
+                (e.id, e.tipo, e.dados) for e in db.query(EventoInventario)
+                .filter(
+                    EventoInventario.inventario_id == inventario_id,
+                    or_(EventoInventario.id > ultimo_id, EventoInventario.criado_em >= recentes),
+                )
+                .order_by(EventoInventario.id).limit(limite + 1)
+            ]
+        finally:
+            db.close()
+        return eventos[:limite], len(eventos) <= limite
+
+    def ultimo_evento(self, inventario_id):
+        db = self.Session()
+        try:
+            return db.query(func.max(EventoInventario.id)).filter(
+                EventoInventario.inventario_id == inventario_id
+            ).scalar() or 0
+        finally:
+            db.close()
+
+    def _loop(self):
+        ultima_limpeza = datetime.now()
+        while True:
+            if not self._tem_assinantes.is_set():
+                # Sem assinantes: recomeça do evento mais recente na volta
+                self._ultimo_id = None
+                self._lacunas.clear()
+                self._tem_assinantes.wait()
+            try:
+                self._distribuir()
+                if datetime.now() - ultima_limpeza > timedelta(minutes=10):
+                    self._limpar()
+                    ultima_limpeza = datetime.now()
+            except Exception as e:
+                log.warning("Erro ao ler eventos", extra=logs.campos(erro=str(e)))
+            sleep(self.intervalo)
+
+    def _distribuir(self):
+        db = self.Session()
+        try:
+            if self._ultimo_id is None:
+                self._ultimo_id = db.query(func.max(EventoInventario.id)).scalar() or 0
+                return
+            with self._lock:
+                inventarios = list(self._assinaturas)
+            if not inventarios:
+                return
+            agora = monotonic()
+            for faltante in [i for i, visto in self._lacunas.items() if agora - visto > JANELA_LACUNA_S]:
+                del self._lacunas[faltante]
+            novos = EventoInventario.id > self._ultimo_id
+            if self._lacunas:
+                novos = or_(novos, EventoInventario.id.in_(list(self._lacunas)))
+            novos = (
+                db.query(EventoInventario.id, EventoInventario.inventario_id,
+                         EventoInventario.tipo, EventoInventario.dados)
+                .filter(novos)
+                .order_by(EventoInventario.id).limit(1000).all()
+            )
+        finally:
+            db.close()
+        for evento_id, inventario_id, tipo, dados in novos:
+            if evento_id > self._ultimo_id:
+                # Ids pulados: transações ainda abertas (ou desfeitas)
+                for faltante in range(max(self._ultimo_id + 1, evento_id - MAX_LACUNAS), evento_id):
+                    self._lacunas[faltante] = agora
+                self._ultimo_id = evento_id
+            else:
+                self._lacunas.pop(evento_id, None)
+            with self._lock:
+                assinaturas = list(self._assinaturas.get(inventario_id, ()))
+            for assinatura in assinaturas:
+                assinatura.entregar((evento_id, tipo, dados))
+
+    def _limpar(self):
+        db = self.Session()
+        try:
+            db.query(EventoInventario).filter(
+                EventoInventario.criado_em < datetime.now() - self.retencao
+            ).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def stream(self, inventario_id, ultimo_id=None):
+        """Gerador das mensagens SSE de um inventário.
+
+        Se a reconexão tiver perdido mais que LIMITE_RECUPERACAO eventos, em
+        vez deles vai um evento "resync": o cliente deve recarregar a tela.
+        """
+        assinatura = self.assinar(inventario_id)
+        # Ids já enviados nesta conexão (os eventos podem chegar fora de ordem)
+        enviados = set()
+        try:
+            yield "retry: 3000\n\n"
+            if ultimo_id is not None:
+                eventos, completo = self.eventos_desde(inventario_id, ultimo_id)
+                if completo:
+                    for evento in eventos:
+                        enviados.add(evento[0])
+                        yield formatar_sse(*evento)
+                else:
+                    log.info("Reconexão com eventos demais, enviando resync", extra=logs.campos(
+                        inventario_id=inventario_id, ultimo_id=ultimo_id,
+                    ))
+                    yield formatar_sse(self.ultimo_evento(inventario_id), "resync", "{}")
+            while not assinatura.atrasada:
+                try:
+                    evento = assinatura.fila.get(timeout=KEEPALIVE_S)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                # Pode já ter saído na recuperação acima
+                if evento[0] in enviados:
+                    continue
+                enviados.add(evento[0])
+                if len(enviados) > 2 * LIMITE_RECUPERACAO:
+                    enviados = set(sorted(enviados)[-LIMITE_RECUPERACAO:])
+                yield formatar_sse(*evento)
+        finally:
+            self.cancelar(assinatura)
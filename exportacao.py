@@ -0,0 +1,173 @@
+import csv
+import io
+import math
+import re
+import zipfile
+from datetime import date, datetime
+from xml.sax.saxutils import escape
+
+# Bytes acumulados antes de entregar um pedaço da resposta
+TAMANHO_PEDACO = 64 * 1024
+
+# Caracteres proibidos no XML 1.0 (ex.: \x0b vindo de descrições do ERP):
+# um só deles torna a planilha ilegível
+_PROIBIDOS_XML = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+MIMETYPES = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+class _Saida:
+    """Destino do zip que só aceita write(): o zipfile passa a gravar em modo
+    streaming (sem seek), e o gerador recolhe os bytes a cada pedaço."""
+
+    def __init__(self):
+        self.partes = []
+        self.tamanho = 0
+
+    def write(self, dados):
+        self.partes.append(bytes(dados))
+        self.tamanho += len(dados)
+        return len(dados)
+
+    def flush(self):
+        pass
+
+    def recolher(self):
+        dados = b"".join(self.partes)
+        self.partes = []
+        self.tamanho = 0
+        return dados
+
+
+_CONTENT_TYPES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
+<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
+<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>
+</Types>"""
+
+_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>
+</Relationships>"""
+
+_WORKBOOK = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">
+<sheets><sheet name="{nome}" sheetId="1" r:id="rId1"/></sheets>
+</workbook>"""
+
+_WORKBOOK_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>
+<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>
+</Relationships>"""
+
+# Estilo 1: cabeçalho em negrito
+_STYLES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">
+<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font><font><b/><sz val="11"/><name val="Calibri"/></font></fonts>
+<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>
+<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>
+<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>
+<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/><xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/></cellXfs>
+</styleSheet>"""
+
+
+def _texto_xml(texto):
+    return escape(_PROIBIDOS_XML.sub("", texto))
+
+
+def _celula(valor, estilo=""):
+    if valor is None:
+        return "<c/>"
+    if isinstance(valor, bool):
+        return f'<c t="b"{estilo}><v>{int(valor)}</v></c>'
+    if isinstance(valor, float) and not math.isfinite(valor):
+        # NaN e infinito não existem no formato: célula vazia
+        return "<c/>"
+    if isinstance(valor, (int, float)):
+        return f'<c{estilo}><v>{valor!r}</v></c>'
+    if isinstance(valor, datetime):
+        valor = valor.strftime("%d/%m/%Y %H:%M:%S")
+    elif isinstance(valor, date):
+        valor = valor.strftime("%d/%m/%Y")
+    return f'<c t="inlineStr"{estilo}><is><t xml:space="preserve">{_texto_xml(str(valor))}</t></is></c>'
+
+
+def gerar_xlsx(cabecalho, linhas, nome_planilha="Planilha"):
+    """Gera um .xlsx em pedaços de bytes, linha a linha.
+
+    Planilha única com strings inline (sem tabela de strings compartilhadas),
+    gravada num zip em streaming: a memória não cresce com o número de
+    linhas e o primeiro pedaço sai antes de a consulta terminar.
+    `linhas` é um iterável de sequências na ordem do `cabecalho`.
+    """
+    saida = _Saida()
+    with zipfile.ZipFile(saida, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("[Content_Types].xml", _CONTENT_TYPES)
+        zf.writestr("_rels/.rels", _RELS)
+        zf.writestr("xl/workbook.xml", _WORKBOOK.format(nome=escape(_PROIBIDOS_XML.sub("", nome_planilha)[:31], {'"': "&quot;"})))
+        zf.writestr("xl/_rels/workbook.xml.rels", _WORKBOOK_RELS)
+        zf.writestr("xl/styles.xml", _STYLES)
+
+        # force_zip64: o tamanho da planilha não é conhecido de antemão
+        with zf.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as planilha:
+            planilha.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                b'<sheetData>'
+            )
+            cabecalho_xml = "".join(_celula(c, ' s="1"') for c in cabecalho)
+            planilha.write(f"<row>{cabecalho_xml}</row>".encode("utf-8"))
+            for linha in linhas:
+                planilha.write(f"<row>{''.join(_celula(v) for v in linha)}</row>".encode("utf-8"))
+                if saida.tamanho >= TAMANHO_PEDACO:
+                    yield saida.recolher()
+            planilha.write(b"</sheetData></worksheet>")
+    yield saida.recolher()
+
+
+def _valor_csv(valor):
+    if isinstance(valor, float):
+        # Excel em português: vírgula decimal; inteiros sem ",0"
+        return str(int(valor)) if valor.is_integer() else str(valor).replace(".", ",")
+    if isinstance(valor, datetime):
+        return valor.strftime("%d/%m/%Y %H:%M:%S")
+    return valor
+
+
+def gerar_csv(cabecalho, linhas, delimitador=";"):
+    """Gera um CSV (UTF-8 com BOM, separado por `;`) em pedaços de bytes."""
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer, delimiter=delimitador)
+    buffer.write("\ufeff")
+    escritor.writerow(cabecalho)
+    for linha in linhas:
+        escritor.writerow([_valor_csv(v) for v in linha])
+        if buffer.tell() >= TAMANHO_PEDACO:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+
+def gerar_arquivo(formato, colunas, registros, nome_planilha="Planilha"):
+    """Exporta dicts como `formato` ("xlsx" ou "csv").
+
+    `colunas` mapeia chave do dict -> título da coluna, na ordem do arquivo.
+    """
+    cabecalho = list(colunas.values())
+    linhas = ([r.get(c) for c in colunas] for r in registros)
+    if formato == "csv":
+        return gerar_csv(cabecalho, linhas)
+    return gerar_xlsx(cabecalho, linhas, nome_planilha)
+
+
+def nome_arquivo(texto):
+    return "".join([c for c in texto if c.isalnum() or c in (' ', '-', '_', '.', '(', ')')]).strip()
@@ -0,0 +1,178 @@
+"""Cliente HTTP compartilhado para a API Focco.
+
+Uma única sessão com pool de conexões keep-alive atende todas as threads.
+Cada operação ("codigo_barras", "estoque", ...) tem seu próprio timeout,
+prazo total e disjuntor (circuit breaker): depois de FOCCO_FALHAS_PARA_ABRIR
+falhas seguidas a operação falha na hora, sem ocupar a thread, por
+FOCCO_CIRCUITO_ABERTO_S segundos; então uma chamada de teste decide se
+volta ao normal. Só chamadas idempotentes são repetidas, com espera
+exponencial e jitter.
+"""
+import os
+import random
+import threading
+from time import monotonic, perf_counter, sleep
+
+import requests
+
+import logs
+import metricas
+
+POOL = int(os.getenv("FOCCO_POOL", "16"))
+TIMEOUT_CONEXAO = float(os.getenv("FOCCO_TIMEOUT_CONEXAO", "3"))
+TENTATIVAS = int(os.getenv("FOCCO_TENTATIVAS", "3"))
+ESPERA_BASE = float(os.getenv("FOCCO_ESPERA_BASE", "0.2"))
+FALHAS_PARA_ABRIR = int(os.getenv("FOCCO_FALHAS_PARA_ABRIR", "5"))
+CIRCUITO_ABERTO_S = float(os.getenv("FOCCO_CIRCUITO_ABERTO_S", "30"))
+
+# Respostas que indicam instabilidade do servidor (contam para o disjuntor
+# e podem ser repetidas); 4xx é erro da chamada e volta direto
+STATUS_INSTAVEL = {429, 500, 502, 503, 504}
+
+FECHADO, MEIO_ABERTO, ABERTO = "fechado", "meio_aberto", "aberto"
+_VALOR_ESTADO = {FECHADO: 0, MEIO_ABERTO: 1, ABERTO: 2}
+
+log = logs.obter("focco")
+
+
+class ErroFocco(Exception):
+    """Falha ao falar com a API (rede, timeout, 5xx ou disjuntor aberto)."""
+
+    def __init__(self, mensagem, status=None):
+        super().__init__(mensagem)
+        self.status = status
+
+
+class CircuitoAberto(ErroFocco):
+    pass
+
+
+class Operacao:
+    """Configuração de uma chamada: timeout de leitura, prazo total (inclui
+    as novas tentativas) e se pode ser repetida sem efeito colateral."""
+
+    def __init__(self, nome, timeout_leitura, prazo, idempotente):
+        self.nome = nome
+        self.timeout = (TIMEOUT_CONEXAO, timeout_leitura)
+        self.prazo = prazo
+        self.idempotente = idempotente
+
+
+class Disjuntor:
+    def __init__(self, nome, falhas_para_abrir=FALHAS_PARA_ABRIR, aberto_s=CIRCUITO_ABERTO_S):
+        self.nome = nome
+        self.falhas_para_abrir = falhas_para_abrir
+        self.aberto_s = aberto_s
+        self.estado = FECHADO
+        self.falhas = 0
+        self.aberto_ate = 0.0
+        self._lock = threading.Lock()
+        self._publicar()
+
+    def permitir(self):
+        """True se a chamada pode seguir. Meio aberto deixa passar só uma."""
+        with self._lock:
+            if self.estado == FECHADO:
+                return True
+            if self.estado == ABERTO and monotonic() >= self.aberto_ate:
+                self._mudar(MEIO_ABERTO)
+                return True
+            return False
+
+    def sucesso(self):
+        with self._lock:
+            self.falhas = 0
+            if self.estado != FECHADO:
+                self._mudar(FECHADO)
+
+    def falha(self):
+        with self._lock:
+            self.falhas += 1
+            if self.estado == MEIO_ABERTO or self.falhas >= self.falhas_para_abrir:
+                self.aberto_ate = monotonic() + self.aberto_s
+                if self.estado != ABERTO:
+                    self._mudar(ABERTO)
+
+    def _mudar(self, estado):
+        nivel = log.warning if estado == ABERTO else log.info
+        nivel("Disjuntor mudou de estado", extra=logs.campos(
+            endpoint=self.nome, de=self.estado, para=estado, falhas=self.falhas
+        ))
+        self.estado = estado
+        self._publicar()
+
+    def _publicar(self):
+        metricas.focco_circuito.definir(_VALOR_ESTADO[self.estado], endpoint=self.nome)
+
+
+class ClienteFocco:
+    def __init__(self, token, pool=POOL, tentativas=TENTATIVAS, espera_base=ESPERA_BASE):
+        self.sessao = requests.Session()
+        adaptador = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=pool)
+        self.sessao.mount("https://", adaptador)
+        self.sessao.mount("http://", adaptador)
+        self.sessao.headers.update({"Authorization": f"Bearer {token}", "Content-Type": "application/json"})
+        self.tentativas = tentativas
+        self.espera_base = espera_base
+        self.disjuntores = {}
+        self._lock = threading.Lock()
+
+    def disjuntor(self, nome):
+        with self._lock:
+            if nome not in self.disjuntores:
+                self.disjuntores[nome] = Disjuntor(nome)
+            return self.disjuntores[nome]
+
+    def requisitar(self, operacao, metodo, url, **kwargs):
+        """Faz a chamada e devolve a resposta (qualquer status fora de STATUS_INSTAVEL).
+
+        Com `stream=True` só o estabelecimento da resposta é protegido: uma
+        falha no meio do corpo fica com quem está lendo.
+        Levanta CircuitoAberto sem tocar a rede se o disjuntor estiver aberto
+        e ErroFocco quando as tentativas ou o prazo acabarem.
+        """
+        disjuntor = self.disjuntor(operacao.nome)
+        if not disjuntor.permitir():
+            metricas.focco_erros.inc(endpoint=operacao.nome, tipo="circuito_aberto")
+            raise CircuitoAberto(f"{operacao.nome}: API indisponível, tentando de novo em instantes")
+
+        limite = monotonic() + operacao.prazo
+        tentativas = self.tentativas if operacao.idempotente else 1
+        for tentativa in range(1, tentativas + 1):
+            # A leitura nunca passa do prazo que sobrou para a operação
+            conexao, leitura = operacao.timeout
+            restante = max(limite - monotonic(), 0.1)
+            inicio = perf_counter()
+            try:
+                resposta = self.sessao.request(
+                    metodo, url, timeout=(min(conexao, restante), min(leitura, restante)), **kwargs
+                )
+            except requests.RequestException as e:
+                resposta, status, tipo = None, None, type(e).__name__
+                erro = ErroFocco(f"{tipo}: {e}")
+            except Exception:
+                disjuntor.falha()
+                raise
+            metricas.focco_chamada.observar(perf_counter() - inicio, endpoint=operacao.nome)
+
+            if resposta is not None:
+                if resposta.status_code not in STATUS_INSTAVEL:
+                    disjuntor.sucesso()
+                    return resposta
+                status = resposta.status_code
+                tipo = f"http_{status}"
+                erro = ErroFocco(f"Erro HTTP {status}: {logs.truncar(resposta.text)}", status=status)
+                resposta.close()
+            metricas.focco_erros.inc(endpoint=operacao.nome, tipo=tipo)
+
+            # Full jitter: espera aleatória entre 0 e base * 2^n, dentro do prazo
+            espera = random.uniform(0, self.espera_base * 2 ** (tentativa - 1))
+            if tentativa == tentativas or monotonic() + espera >= limite:
+                break
+            log.debug("Nova tentativa", extra=logs.campos(
+                endpoint=operacao.nome, tentativa=tentativa + 1, status_upstream=status, erro=str(erro)
+            ))
+            sleep(espera)
+
+        disjuntor.falha()
+        raise erro
@@ -0,0 +1,139 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import logs
+from models import LeituraPendente, StatusLeitura
+
+log = logs.obter("leituras")
+
+# Intervalo mínimo entre duas limpezas das leituras já resolvidas
+INTERVALO_LIMPEZA = timedelta(minutes=10)
+
+
+class FilaCheia(Exception):
+    pass
+
+
+class ProcessadorLeituras:
+    """Resolve leituras de código em segundo plano, num pool limitado.
+
+    A requisição só grava a leitura bruta (LeituraPendente) e devolve o id;
+    `processar(db, leitura)` roda num worker, faz a consulta/validação e
+    retorna (status, mensagem, item_id). No máximo `max_fila` leituras ficam
+    aguardando em memória; acima disso `enfileirar` levanta FilaCheia.
+    Leituras resolvidas há mais de `retencao` são apagadas de tempos em
+    tempos pelos próprios workers.
+    """
+
+    def __init__(self, session_factory, processar, workers=4, max_fila=1000,
+                 travada_apos=timedelta(minutes=5), retencao=timedelta(days=7)):
+        self.Session = session_factory
+        self.processar = processar
+        self.workers = workers
+        self.travada_apos = travada_apos
+        self.retencao = retencao
+        self._ultima_limpeza = datetime.min
+        self._lock_limpeza = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="leituras")
+        self._vagas = threading.BoundedSemaphore(max_fila)
+
+    def enfileirar(self, leitura_id):
+        if not self._vagas.acquire(blocking=False):
+            raise FilaCheia("Fila de leituras cheia, tente novamente em instantes")
+        try:
+            self._executor.submit(self._executar, leitura_id)
+        except BaseException:
+            self._vagas.release()
+            raise
+
+    def _disponiveis(self):
+        # Pendentes, ou reservadas há tempo demais por um processo que morreu
+        # (processado_em guarda o momento da reserva enquanto processa)
+        limite = datetime.now() - self.travada_apos
+        return (LeituraPendente.status == StatusLeitura.PENDENTE) | (
+            (LeituraPendente.status == StatusLeitura.PROCESSANDO)
+            & (LeituraPendente.processado_em < limite)
+        )
+
+    def recuperar_pendentes(self):
+        """Reenfileira leituras que ficaram na fila de um processo que reiniciou."""
+        db = self.Session()
+        try:
+            ids = [
+                i for (i,) in db.query(LeituraPendente.id)
+                .filter(self._disponiveis())
+                .order_by(LeituraPendente.id)
+            ]
+        finally:
+            db.close()
+        for leitura_id in ids:
+            try:
+                self.enfileirar(leitura_id)
+            except FilaCheia:
+                break
+        return len(ids)
+
+    def limpar(self):
+        """Apaga as leituras resolvidas (nem pendentes nem em processamento)
+        há mais de `retencao`. Retorna quantas foram apagadas."""
+        db = self.Session()
+        try:
+            apagadas = db.query(LeituraPendente).filter(
+                LeituraPendente.status.not_in([StatusLeitura.PENDENTE, StatusLeitura.PROCESSANDO]),
+                LeituraPendente.processado_em < datetime.now() - self.retencao,
+            ).delete(synchronize_session=False)
+            db.commit()
+            return apagadas
+        finally:
+            db.close()
+
+    def _limpar_se_preciso(self):
+        # Um worker por vez, no máximo a cada INTERVALO_LIMPEZA
+        if not self._lock_limpeza.acquire(blocking=False):
+            return
+        try:
+            if datetime.now() - self._ultima_limpeza < INTERVALO_LIMPEZA:
+                return
+            self._ultima_limpeza = datetime.min
+            apagadas = self.limpar()
+            if apagadas:
+                log.info("Leituras antigas removidas", extra=logs.campos(apagadas=apagadas))
+        except Exception as e:
+            log.warning("Erro ao limpar leituras antigas", extra=logs.campos(erro=str(e)))
+        finally:
+            self._lock_limpeza.release()
+
+    def _reservar(self, db, leitura_id):
+        # UPDATE condicional: se outro worker/processo já pegou, rowcount é 0
+        reservada = db.query(LeituraPendente).filter(
+            LeituraPendente.id == leitura_id, self._disponiveis()
+        ).update({"status": StatusLeitura.PROCESSANDO, "processado_em": datetime.now()},
+                 synchronize_session=False)
+        db.commit()
+        return reservada == 1
+
+    def _executar(self, leitura_id):
+        db = self.Session()
+        try:
+            if not self._reservar(db, leitura_id):
+                return
+            leitura = db.get(LeituraPendente, leitura_id)
+            try:
+                status, mensagem, item_id = self.processar(db, leitura)
+            except Exception as e:
+                db.rollback()
+                leitura = db.get(LeituraPendente, leitura_id)
+                status, mensagem, item_id = StatusLeitura.ERRO, str(e)[:300], None
+            leitura.status = status
+            leitura.mensagem = mensagem
+            leitura.item_id = item_id
+            leitura.processado_em = datetime.now()
+            db.commit()
+        except Exception:
+            db.rollback()
+            log.exception("Erro ao processar leitura", extra=logs.campos(leitura_id=leitura_id))
+        finally:
+            db.close()
+            self._vagas.release()
+        self._limpar_se_preciso()
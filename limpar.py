@@ -1,5 +1,5 @@
 from database import Session
-from models import Inventario, ItemInventario
+from models import Inventario, ItemInventario, ContagemInventario
 from sqlalchemy import text
 
 def limpar_tudo():
@@ -11,6 +11,10 @@ def limpar_tudo():
         rows_itens = db.query(ItemInventario).delete()
         print(f"✓ {rows_itens} registros removidos de 'itens_inventario'")
 
+        # 2. Apagar Contagens agregadas (também filhas de Inventarios)
+        rows_contagens = db.query(ContagemInventario).delete()
+        print(f"✓ {rows_contagens} registros removidos de 'contagens_inventario'")
+
         # 3. Apagar Inventários (Tabela Pai)
         rows_inv = db.query(Inventario).delete()
         print(f"✓ {rows_inv} registros removidos de 'inventarios'")
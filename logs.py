@@ -0,0 +1,116 @@
+"""Logs estruturados e assíncronos.
+
+As threads das requisições só colocam o registro numa fila em memória
+(sem bloquear: com a fila cheia o registro é descartado e contado); uma
+thread separada formata e escreve em stdout. Campos estruturados vão em
+`extra=campos(...)`; sucessos marcados com `amostrar=True` passam pela
+amostragem de LOG_AMOSTRA_SUCESSO.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+
+NIVEL = os.getenv("LOG_NIVEL", "INFO").upper()
+# "texto" (mensagem + chave=valor) ou "json" (uma linha JSON por registro)
+FORMATO = os.getenv("LOG_FORMATO", "texto").lower()
+# Fração dos sucessos registrada (0 a 1); falhas sempre são registradas
+AMOSTRA_SUCESSO = float(os.getenv("LOG_AMOSTRA_SUCESSO", "0.1"))
+# Textos maiores que isso (ex.: corpo de resposta da API) são cortados
+MAX_TEXTO = int(os.getenv("LOG_MAX_TEXTO", "300"))
+FILA_MAX = int(os.getenv("LOG_FILA_MAX", "10000"))
+
+_listener = None
+_handler = None
+
+
+def truncar(texto, limite=None):
+    limite = MAX_TEXTO if limite is None else limite
+    texto = str(texto)
+    if len(texto) <= limite:
+        return texto
+    return f"{texto[:limite]}... (+{len(texto) - limite} caracteres)"
+
+
+def campos(amostrar=False, **valores):
+    """`extra` de um registro: campos estruturados, com textos truncados."""
+    return {
+        "campos": {k: truncar(v) if isinstance(v, str) else v for k, v in valores.items() if v is not None},
+        "amostrar": amostrar,
+    }
+
+
+class _Amostragem(logging.Filter):
+    def filter(self, registro):
+        return not getattr(registro, "amostrar", False) or random.random() < AMOSTRA_SUCESSO
+
+
+class _FilaHandler(QueueHandler):
+    """QueueHandler que nunca bloqueia: descarta quando a fila enche."""
+
+    descartados = 0
+
+    def enqueue(self, registro):
+        try:
+            self.queue.put_nowait(registro)
+        except queue.Full:
+            self.descartados += 1
+
+
+class FormatadorTexto(logging.Formatter):
+    def format(self, registro):
+        linha = (
+            f"{datetime.fromtimestamp(registro.created):%Y-%m-%d %H:%M:%S} "
+            f"{registro.levelname:<7} [{registro.name}] {registro.getMessage()}"
+        )
+        extra = getattr(registro, "campos", None)
+        if extra:
+            linha += " " + " ".join(f"{k}={json.dumps(v, ensure_ascii=False, default=str)}" for k, v in extra.items())
+        return linha
+
+
+class FormatadorJSON(logging.Formatter):
+    def format(self, registro):
+        dados = {
+            "ts": datetime.fromtimestamp(registro.created).isoformat(timespec="milliseconds"),
+            "nivel": registro.levelname,
+            "logger": registro.name,
+            "msg": registro.getMessage(),
+        }
+        dados.update(getattr(registro, "campos", None) or {})
+        return json.dumps(dados, ensure_ascii=False, default=str)
+
+
+def configurar():
+    """Liga a fila e a thread de escrita nos loggers "olivar.*" (idempotente)."""
+    global _listener, _handler
+    if _listener is not None:
+        return
+    saida = logging.StreamHandler(sys.stdout)
+    saida.setFormatter(FormatadorJSON() if FORMATO == "json" else FormatadorTexto())
+
+    _handler = _FilaHandler(queue.Queue(FILA_MAX))
+    _handler.addFilter(_Amostragem())
+    raiz = logging.getLogger("olivar")
+    raiz.setLevel(NIVEL)
+    raiz.addHandler(_handler)
+    raiz.propagate = False
+
+    _listener = QueueListener(_handler.queue, saida)
+    _listener.start()
+    # Escreve o que ainda estiver na fila ao encerrar o processo
+    atexit.register(_listener.stop)
+
+
+def descartados():
+    """Registros perdidos por fila cheia desde o início do processo."""
+    return _handler.descartados if _handler else 0
+
+
+def obter(nome):
+    return logging.getLogger(f"olivar.{nome}")
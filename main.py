@@ -1,25 +1,50 @@
 import os
 import json
-import pandas as pd 
-from io import BytesIO 
+import hmac
+from urllib.parse import quote
 from flask import (
-    Flask, render_template, request, redirect, url_for, session, flash, jsonify, send_file
+    Flask, Response, render_template, request, redirect, url_for, session, flash, jsonify, send_file
 )
 from sqlalchemy import text, func
-from database import Session
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from database import Session, engine
+import logs
+import metricas
+from requisicao import instalar as instalar_requisicao, obter_db
 # IMPORTANTE: Apenas as tabelas que existem
-from models import Inventario, ItemInventario, StatusInventario, EstoqueInventario
+from models import (
+    Inventario, ItemInventario, StatusInventario, LeituraPendente, StatusLeitura,
+    JobSincronizacao
+)
 from werkzeug.security import check_password_hash
-from datetime import datetime
-import requests
+from datetime import datetime, timedelta
+from time import perf_counter
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from functools import lru_cache
+from cache_codigos import criar_cache
+import focco
+from ingestao import FilaCheia, ProcessadorLeituras
+from eventos import BrokerEventos, registrar_evento
+import contagens
+from comparativo import STATUS as STATUS_COMPARATIVO, comparar, iter_comparativo
+from exportacao import MIMETYPES as MIMETYPES_EXPORTACAO, gerar_arquivo, nome_arquivo
+from contextlib import contextmanager
+from sincronizacao import SincronizadorEstoque, progresso
+from catalogo import CatalogoCodigos, normalizar_codigo
+from visualizacao_de_dados.stream import iter_json_array
+from snapshot import SnapshotCache, consultar, etag_consulta
 
 # Garante carregamento do .env e define pasta base
 basedir = os.path.abspath(os.path.dirname(__file__))
 env_path = os.path.join(basedir, '.env')
 load_dotenv(env_path)
 
+logs.configurar()
+log_api = logs.obter("api")
+log_sync = logs.obter("sync")
+log = logs.obter("app")
+
 app = Flask(__name__)
 app.secret_key = os.getenv("SECRET_KEY", "dev-key-change-in-production")
 
@@ -30,71 +55,220 @@ app.config.update(
     SESSION_COOKIE_SECURE=False,
 )
 
+# Sessão do banco por requisição + contagem de consultas SQL (requisicao.py)
+instalar_requisicao(app)
+
+# Exportações do dashboard geradas pelo save_result.py (ver atual.json)
+EXPORT_DIR = os.path.join(basedir, "exportacoes")
+
+snapshot_cache = SnapshotCache(
+    os.path.join(basedir, "result.json"), os.path.join(basedir, "result.col")
+)
+
 # ============ CONFIGURAÇÕES DE APIS ============
 API_CODIGO_BARRAS_URL = os.getenv("API_CODIGO_BARRAS_URL", "")
 API_ESTOQUE_URL = os.getenv("API_ESTOQUE_URL", "")
 API_TOKEN = os.getenv("API_TOKEN", "")
 API_ESTOQUE_CHAVE = os.getenv("API_ESTOQUE_CHAVE", "")
 
+# Leitura em lote: limite de códigos por requisição e consultas simultâneas à API
+LOTE_MAX_CODIGOS = int(os.getenv("LOTE_MAX_CODIGOS", "500"))
+LOTE_CONSULTAS_PARALELAS = int(os.getenv("LOTE_CONSULTAS_PARALELAS", "8"))
+
+# Linhas por página nas consultas paginadas (snapshot e comparativo)
+POR_PAGINA_MAX = 1000
+
+# Espelho do catálogo de etiquetas: páginas por requisição, páginas baixadas
+# ao mesmo tempo e por quanto tempo uma carga concluída dispensa outra
+CATALOGO_TAMANHO_PAGINA = int(os.getenv("CATALOGO_TAMANHO_PAGINA", "1000"))
+CATALOGO_PAGINAS_PARALELAS = int(os.getenv("CATALOGO_PAGINAS_PARALELAS", "4"))
+CATALOGO_VALIDADE_MIN = float(os.getenv("CATALOGO_VALIDADE_MIN", "30"))
+
+# Leitura assíncrona: workers que resolvem os códigos e tamanho máximo da fila
+LEITURAS_WORKERS = int(os.getenv("LEITURAS_WORKERS", "4"))
+LEITURAS_MAX_FILA = int(os.getenv("LEITURAS_MAX_FILA", "1000"))
+# Dias que uma leitura já resolvida fica em leituras_pendentes
+LEITURAS_RETENCAO_DIAS = float(os.getenv("LEITURAS_RETENCAO_DIAS", "7"))
+
+# Cliente compartilhado (focco.py): pool keep-alive, novas tentativas e disjuntor.
+# Timeout de leitura e prazo total (com as novas tentativas) de cada operação.
+cliente_focco = focco.ClienteFocco(
+    API_TOKEN, pool=max(focco.POOL, LOTE_CONSULTAS_PARALELAS + LEITURAS_WORKERS)
+)
+OP_CODIGO = focco.Operacao(
+    "codigo_barras",
+    timeout_leitura=float(os.getenv("FOCCO_TIMEOUT_CODIGO", "5")),
+    prazo=float(os.getenv("FOCCO_PRAZO_CODIGO", "8")),
+    # POST, mas só consulta: pode ser repetido
+    idempotente=True,
+)
+OP_CATALOGO = focco.Operacao(
+    "catalogo",
+    timeout_leitura=float(os.getenv("FOCCO_TIMEOUT_CATALOGO", "30")),
+    prazo=float(os.getenv("FOCCO_PRAZO_CATALOGO", "60")),
+    idempotente=True,
+)
+OP_ESTOQUE = focco.Operacao(
+    "estoque",
+    timeout_leitura=float(os.getenv("FOCCO_TIMEOUT_ESTOQUE", "60")),
+    prazo=float(os.getenv("FOCCO_PRAZO_ESTOQUE", "120")),
+    idempotente=True,
+)
+
+cache_codigos = criar_cache(basedir)
+broker_eventos = BrokerEventos(Session)
+
+def _baixar_pagina_catalogo(skip, take):
+    # Ordenado pela etiqueta: as páginas não se sobrepõem
+    payload = {
+        "Chave": API_ESTOQUE_CHAVE, "Skip": skip, "Take": take, "Parameters": [],
+        "Sorting": [{ "ByColumn": "cod_barra_ord", "Sort": "ASC" }]
+    }
+    response = cliente_focco.requisitar(OP_CATALOGO, "POST", API_CODIGO_BARRAS_URL, json=payload)
+    if response.status_code != 200:
+        raise focco.ErroFocco(
+            f"Erro HTTP {response.status_code}: {logs.truncar(response.text)}", status=response.status_code
+        )
+    return _lista_itens(response.json())
+
+catalogo_codigos = CatalogoCodigos(
+    engine, Session, _baixar_pagina_catalogo,
+    tamanho_pagina=CATALOGO_TAMANHO_PAGINA,
+    paginas_paralelas=CATALOGO_PAGINAS_PARALELAS,
+    validade=timedelta(minutes=CATALOGO_VALIDADE_MIN),
+)
+
+def _atualizar_catalogo():
+    """Carga do espelho ao abrir um inventário; falhar aqui não impede a abertura."""
+    if not API_CODIGO_BARRAS_URL:
+        return
+    try:
+        carga, nova = catalogo_codigos.iniciar()
+        if nova:
+            log.info("Carga do catálogo iniciada", extra=logs.campos(carga_id=carga["id"]))
+    except Exception as e:
+        log.warning("Não foi possível iniciar a carga do catálogo", extra=logs.campos(erro=str(e)))
+
 # ============ FUNÇÕES AUXILIARES ============
 
-@lru_cache(maxsize=128)
-def consultar_codigo_api_individual(cod_barra_busca):
+class ErroApiCodigo(Exception):
+    """Falha de comunicação com a API (não significa código inexistente).
+
+    `consultar_codigo_api_individual` a deixa passar quando não há resposta
+    recente o bastante no cache para servir no lugar: quem chama responde
+    "indisponível" (503), nunca "não encontrado".
+    """
+
+    def __init__(self, mensagem, status=None):
+        super().__init__(mensagem)
+        self.status = status
+
+def _ler_por_pagina():
+    """?por_pagina da requisição, entre 1 e POR_PAGINA_MAX; "todos" devolve
+    0 (todas as linhas filtradas, usado na exportação). Levanta ValueError."""
+    por_pagina = request.args.get("por_pagina", "100")
+    if por_pagina == "todos":
+        return 0
+    return max(1, min(int(por_pagina), POR_PAGINA_MAX))
+
+API_INDISPONIVEL = "API de códigos indisponível, tente de novo em instantes"
+_INDISPONIVEL = object()
+
+def consultar_codigo_api_individual(cod_barra_busca, inventario_id=None):
     if not cod_barra_busca: return None
 
+    inicio = perf_counter()
+    try:
+        item = catalogo_codigos.buscar(cod_barra_busca)
+    except Exception as e:
+        # Espelho indisponível não impede a leitura: segue para cache e API
+        log_api.warning("Erro ao consultar o catálogo local", extra=logs.campos(erro=str(e)))
+        item = None
+    metricas.catalogo_consultas.inc(resultado="encontrado" if item else "ausente")
+    if item:
+        log_api.info("Código consultado", extra=logs.campos(
+            amostrar=True, inventario_id=inventario_id, codigo=cod_barra_busca, origem="catalogo",
+            encontrado=True, latencia_ms=round((perf_counter() - inicio) * 1000, 2),
+        ))
+        return item
+
+    encontrado, item = cache_codigos.obter(cod_barra_busca)
+    if encontrado:
+        # Entrada negativa (código inexistente) também escapa da amostragem
+        log_api.info("Código consultado", extra=logs.campos(
+            amostrar=item is not None, inventario_id=inventario_id, codigo=cod_barra_busca, origem="cache",
+            encontrado=item is not None, latencia_ms=round((perf_counter() - inicio) * 1000, 1),
+        ))
+        return item
+
+    try:
+        item = _buscar_codigo_api(cod_barra_busca)
+    except ErroApiCodigo as e:
+        # Erros de rede/HTTP não entram no cache negativo. Com a API fora do
+        # ar, vale a última resposta boa do código, se não for antiga demais.
+        item = cache_codigos.obter_vencido(cod_barra_busca)
+        log_api.warning("Falha na consulta do código", extra=logs.campos(
+            inventario_id=inventario_id, codigo=cod_barra_busca, status_upstream=e.status,
+            latencia_ms=round((perf_counter() - inicio) * 1000, 1), erro=str(e),
+            servido_do_cache_vencido=item is not None,
+        ))
+        if item is None:
+            raise
+        return item
+
+    cache_codigos.gravar(cod_barra_busca, item)
+    # Código inexistente não passa pela amostragem: costuma indicar etiqueta errada
+    log_api.info("Código consultado", extra=logs.campos(
+        amostrar=item is not None, inventario_id=inventario_id, codigo=cod_barra_busca, origem="api",
+        encontrado=item is not None, status_upstream=200,
+        latencia_ms=round((perf_counter() - inicio) * 1000, 1),
+    ))
+    return item
+
+def _consultar_no_lote(cod_barra_busca, inventario_id):
+    """Como consultar_codigo_api_individual, mas com a API fora do ar devolve
+    _INDISPONIVEL em vez de levantar (uma falha não derruba o lote)."""
+    try:
+        return consultar_codigo_api_individual(cod_barra_busca, inventario_id)
+    except ErroApiCodigo:
+        return _INDISPONIVEL
+
+def _lista_itens(dados_api):
+    if isinstance(dados_api, list): return dados_api
+    if isinstance(dados_api, dict):
+        if 'value' in dados_api: return dados_api['value']
+        if 'data' in dados_api: return dados_api['data']
+        if 'cod_item' in dados_api: return [dados_api]
+    return []
+
+def _buscar_codigo_api(cod_barra_busca):
     try:
-        print(f"🔍 [API] Buscando código: '{cod_barra_busca}'")
-        
-        headers = {
-            "Authorization": f"Bearer {API_TOKEN}",
-            "Content-Type": "application/json"
-        }
-        
         payload = {
             "Chave": API_ESTOQUE_CHAVE, "Skip": 0, "Take": 1,
             "Parameters": [{ "Column": "cod_barra_ord", "Value": cod_barra_busca }],
             "Sorting": [{ "ByColumn": "cod_item", "Sort": "ASC" }]
         }
         
-        response = requests.post(
-            API_CODIGO_BARRAS_URL, headers=headers, json=payload, timeout=10
-        )
+        response = cliente_focco.requisitar(OP_CODIGO, "POST", API_CODIGO_BARRAS_URL, json=payload)
         
         if response.status_code != 200:
-            print(f"❌ [API] Erro HTTP {response.status_code}: {response.text}")
-            return None
+            metricas.focco_erros.inc(endpoint="codigo_barras", tipo=f"http_{response.status_code}")
+            raise ErroApiCodigo(
+                f"Erro HTTP {response.status_code}: {logs.truncar(response.text)}", status=response.status_code
+            )
             
-        dados_api = response.json()
-        lista_itens = []
-        if isinstance(dados_api, list): lista_itens = dados_api
-        elif isinstance(dados_api, dict):
-            if 'value' in dados_api: lista_itens = dados_api['value']
-            elif 'data' in dados_api: lista_itens = dados_api['data']
-            elif 'cod_item' in dados_api: lista_itens = [dados_api]
-        
+        lista_itens = _lista_itens(response.json())
         if not lista_itens:
-            print(f"⚠️ [API] Lista vazia para código '{cod_barra_busca}'")
             return None
-            
-        item = lista_itens[0]
-        c_item = str(item.get('cod_item', '')).strip()
-        t_id = item.get('tmasc_item_id')
-        t_id = int(t_id) if t_id is not None else 0
-        
-        return {
-            'cod_emp': item.get('cod_emp'),
-            'etiq_id': item.get('etiq_id'),
-            'cod_barra_ord': item.get('cod_barra_ord'),
-            'cod_item': c_item,
-            'desc_tecnica': item.get('desc_tecnica'),
-            'mascara': item.get('mascara'),
-            'tmasc_item_id': t_id,
-            'qtde': item.get('qtde')
-        }
+        return normalizar_codigo(lista_itens[0])
 
+    except ErroApiCodigo:
+        raise
+    except focco.ErroFocco as e:
+        raise ErroApiCodigo(str(e), status=e.status) from e
     except Exception as e:
-        print(f"❌ [API] Exceção: {e}")
-        return None
+        metricas.focco_erros.inc(endpoint="codigo_barras", tipo=type(e).__name__)
+        raise ErroApiCodigo(f"Exceção: {e}") from e
 
 # ============ AUTH ============
 def verify_password(stored_hash, provided_password):
@@ -118,11 +292,9 @@ def login():
     if request.method == "POST":
         username = (request.form.get("username") or "").strip()
         password = request.form.get("password") or ""
-        db = Session()
-        try:
-            sql = text("SELECT * FROM users WHERE login = :u LIMIT 1")
-            row = db.execute(sql, {"u": username}).mappings().first()
-        finally: db.close()
+        db = obter_db()
+        sql = text("SELECT * FROM users WHERE login = :u LIMIT 1")
+        row = db.execute(sql, {"u": username}).mappings().first()
 
         if not row or not verify_password(str(row.get('password') or ""), password):
             flash("Credenciais inválidas.", "danger")
@@ -146,20 +318,83 @@ def logout():
 @app.route("/")
 @login_required
 def index():
-    data = []
     columns = []
     try:
-        json_file = os.path.join(basedir, "result.json")
-        if os.path.exists(json_file):
-            with open(json_file, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            if data and isinstance(data, list):
-                columns = list(data[0].keys())
+        columns = snapshot_cache.obter().colunas
     except Exception as e:
-        print(f"⚠️ Erro ao ler result.json: {e}")
-        data = []
+        log.warning("Erro ao ler result.json", extra=logs.campos(erro=str(e)))
+
+    return render_template("index.html", columns=columns, user=session.get("user"))
+
+@app.route("/api/dashboard", methods=["GET"])
+@login_required
+def api_dashboard():
+    try:
+        snapshot = snapshot_cache.obter()
+    except Exception as e:
+        return jsonify({"erro": f"Erro ao ler result.json: {e}"}), 500
+
+    etag = etag_consulta(snapshot, request.query_string.decode("utf-8"))
+    if request.if_none_match.contains(etag):
+        resp = app.response_class(status=304)
+        resp.set_etag(etag)
+        return resp
+
+    try:
+        pagina = int(request.args.get("pagina", 1))
+        por_pagina = _ler_por_pagina()
+    except ValueError:
+        return jsonify({"erro": "Paginação inválida"}), 400
+
+    filtros = {
+        chave[len("filtro["):-1]: valor
+        for chave, valor in request.args.items()
+        if chave.startswith("filtro[") and chave.endswith("]")
+    }
+    resultado = consultar(
+        snapshot,
+        filtros=filtros,
+        busca=request.args.get("busca", ""),
+        ordenar=request.args.get("ordenar"),
+        decrescente=request.args.get("ordem") == "desc",
+        pagina=pagina,
+        por_pagina=por_pagina,
+    )
+    resp = jsonify(resultado)
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "private, no-cache"
+    return resp
 
-    return render_template("index.html", data=data, columns=columns, user=session.get("user"))
+@app.route("/api/dashboard/exportar/<formato>", methods=["GET"])
+@login_required
+def exportar_dashboard(formato):
+    """Serve o arquivo pronto do snapshot atual (gerado pelo save_result.py).
+
+    Nenhum processamento por requisição: send_file responde 304 com o ETag
+    (hash do snapshot) e atende pedidos Range para downloads retomados.
+    """
+    try:
+        with open(os.path.join(EXPORT_DIR, "atual.json"), "r", encoding="utf-8") as f:
+            manifesto = json.load(f)
+        nome = manifesto["arquivos"][formato]
+    except (FileNotFoundError, ValueError, KeyError):
+        return jsonify({"erro": f"Exportação {formato} ainda não gerada"}), 404
+
+    try:
+        resp = send_file(
+            os.path.join(EXPORT_DIR, nome),
+            mimetype=MIMETYPES_EXPORTACAO[formato],
+            as_attachment=True,
+            download_name=f"estoque_{manifesto['hash']}.{formato}",
+            conditional=True,
+            etag=f"{manifesto['hash']}-{formato}",
+            max_age=0,
+        )
+    except FileNotFoundError:
+        # O snapshot foi trocado entre ler o manifesto e abrir o arquivo
+        return jsonify({"erro": "Exportação sendo atualizada, tente novamente"}), 503
+    resp.headers["Cache-Control"] = "private, no-cache"
+    return resp
 
 @app.route("/inventarios", methods=["GET"])
 @login_required
@@ -169,11 +404,9 @@ def inventarios():
 @app.route("/api/inventarios", methods=["GET"])
 @login_required
 def get_inventarios():
-    db = Session()
-    try:
-        data = db.query(Inventario).order_by(Inventario.criado_em.desc()).all()
-        return jsonify([i.to_dict() for i in data])
-    finally: db.close()
+    db = obter_db()
+    data = db.query(Inventario).order_by(Inventario.criado_em.desc()).all()
+    return jsonify([i.to_dict() for i in data])
 
 @app.route("/api/inventarios", methods=["POST"])
 @login_required
@@ -181,43 +414,46 @@ def criar_inventario():
     data = request.get_json()
     nome = data.get("nome", "").strip()
     if not nome: return jsonify({"erro": "Nome obrigatório"}), 400
-    db = Session()
+    db = obter_db()
     try:
         inv = Inventario(nome=nome, status=StatusInventario.ABERTO, criado_em=datetime.now())
         db.add(inv)
         db.commit()
         db.refresh(inv)
+        _atualizar_catalogo()
         return jsonify(inv.to_dict()), 201
     except Exception as e:
         db.rollback()
         return jsonify({"erro": str(e)}), 500
-    finally: db.close()
 
 @app.route("/api/inventarios/<int:inv_id>/fechar", methods=["PUT"])
 @login_required
 def fechar_inventario(inv_id):
-    db = Session()
+    db = obter_db()
     try:
         inv = db.query(Inventario).filter_by(id=inv_id).first()
         if not inv: return jsonify({"erro": "Não encontrado"}), 404
         inv.status = StatusInventario.FECHADO
         inv.data_fim = datetime.now()
+        registrar_evento(db, inv_id, "status", inv.to_dict())
         db.commit()
         return jsonify(inv.to_dict()), 200
     except Exception as e:
         db.rollback()
         return jsonify({"erro": str(e)}), 500
-    finally: db.close()
 
 @app.route("/api/inventarios/<int:inv_id>", methods=["DELETE"])
 @login_required
 def deletar_inventario(inv_id):
-    db = Session()
+    db = obter_db()
     try:
         inv = db.query(Inventario).filter_by(id=inv_id).first()
         if not inv: return jsonify({"erro": "Não encontrado"}), 404
         
+        db.query(LeituraPendente).filter_by(inventario_id=inv_id).delete()
         db.query(ItemInventario).filter_by(inventario_id=inv_id).delete()
+        contagens.remover_inventario(db, inv_id)
+        registrar_evento(db, inv_id, "removido", {"id": inv_id})
         
         db.delete(inv)
         db.commit()
@@ -225,42 +461,77 @@ def deletar_inventario(inv_id):
     except Exception as e:
         db.rollback()
         return jsonify({"erro": str(e)}), 500
-    finally: db.close()
 
 @app.route("/inventarios/<int:inv_id>/leitura", methods=["GET"])
 @login_required
 def leitura_codigos(inv_id):
-    db = Session()
-    try:
-        inv = db.query(Inventario).filter_by(id=inv_id).first()
-        if not inv: return redirect(url_for("inventarios"))
-        return render_template("leitura.html", inventario=inv, user=session.get("user"))
-    finally: db.close()
+    inv = obter_db().get(Inventario, inv_id)
+    if not inv: return redirect(url_for("inventarios"))
+    if inv.status == StatusInventario.ABERTO:
+        _atualizar_catalogo()
+    return render_template("leitura.html", inventario=inv, user=session.get("user"))
 
 @app.route("/inventarios/<int:inv_id>/lista", methods=["GET"])
 @login_required
 def lista_itens_page(inv_id):
-    db = Session()
-    try:
-        inv = db.query(Inventario).filter_by(id=inv_id).first()
-        if not inv: return redirect(url_for("inventarios"))
-        return render_template("itens_lidos.html", inventario=inv, user=session.get("user"))
-    finally: db.close()
+    inv = obter_db().get(Inventario, inv_id)
+    if not inv: return redirect(url_for("inventarios"))
+    return render_template("itens_lidos.html", inventario=inv, user=session.get("user"))
 
 @app.route("/api/inventarios/<int:inv_id>/itens", methods=["GET"])
 @login_required
 def get_itens_inventario(inv_id):
-    db = Session()
-    try:
-        itens = db.query(ItemInventario).filter_by(inventario_id=inv_id).order_by(ItemInventario.timestamp.desc()).all()
-        return jsonify([i.to_dict() for i in itens]), 200
-    finally: db.close()
+    """Lista os itens lidos.
+
+    Sem parâmetros devolve a lista completa (formato antigo). Com `limite`,
+    pagina por id do mais novo para o mais antigo (`antes=<id>` pega a
+    próxima página); com `since=<id>` devolve só os itens com id maior que o
+    cursor que o cliente já tem. Nos dois modos a resposta traz `cursor`
+    (maior id do inventário) e `proximo` (valor de `antes` da próxima página).
+    """
+    limite = request.args.get("limite", type=int)
+    antes = request.args.get("antes", type=int)
+    since = request.args.get("since", type=int)
+
+    db = obter_db()
+    # Versão barata da lista: se nada mudou, 304 sem carregar nenhum item
+    total, ultimo_id = db.query(
+        func.count(ItemInventario.id), func.max(ItemInventario.id)
+    ).filter_by(inventario_id=inv_id).one()
+    etag = f"itens-{inv_id}-{total}-{ultimo_id or 0}-{request.query_string.decode('utf-8')}"
+    if request.if_none_match.contains(etag):
+        resp = app.response_class(status=304)
+        resp.set_etag(etag)
+        return resp
+
+    q = db.query(ItemInventario).filter_by(inventario_id=inv_id)
+    if limite is None and since is None:
+        itens = q.order_by(ItemInventario.timestamp.desc()).all()
+        resp = jsonify([i.to_dict() for i in itens])
+    else:
+        limite = max(1, min(limite or 100, POR_PAGINA_MAX))
+        if since is not None:
+            q = q.filter(ItemInventario.id > since)
+        if antes is not None:
+            q = q.filter(ItemInventario.id < antes)
+        itens = q.order_by(ItemInventario.id.desc()).limit(limite + 1).all()
+        tem_mais = len(itens) > limite
+        itens = itens[:limite]
+        resp = jsonify({
+            "itens": [i.to_dict() for i in itens],
+            "total": total,
+            "cursor": ultimo_id or 0,
+            "proximo": itens[-1].id if tem_mais else None,
+        })
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "private, no-cache"
+    return resp, 200
 
 @app.route("/api/inventarios/<int:inv_id>/itens", methods=["POST"])
 @login_required
 def adicionar_item_inventario(inv_id):
     data = request.get_json()
-    db = Session()
+    db = obter_db()
     try:
         inv = db.query(Inventario).filter_by(id=inv_id).first()
         if not inv or inv.status != StatusInventario.ABERTO:
@@ -269,42 +540,268 @@ def adicionar_item_inventario(inv_id):
         cod = data.get('cod_barra_ord', '').strip()
         if not cod: return jsonify({"erro": "Código vazio"}), 400
 
-        item_api = consultar_codigo_api_individual(cod)
+        # Entrada negativa do cache vale até vencer (ver /api/admin/cache-codigos/<codigo>)
+        try:
+            item_api = consultar_codigo_api_individual(cod, inv_id)
+        except ErroApiCodigo:
+            return jsonify({"erro": API_INDISPONIVEL}), 503
         if not item_api:
-            consultar_codigo_api_individual.cache_clear()
-            item_api = consultar_codigo_api_individual(cod)
-            if not item_api:
-                return jsonify({"erro": "Código não encontrado na API"}), 404
+            return jsonify({"erro": "Código não encontrado na API"}), 404
 
-        raw_qtde = item_api.get('qtde')
-        if raw_qtde is None: return jsonify({"erro": "Sem quantidade na API"}), 422
         try:
-            qtd_real = float(raw_qtde)
-            if qtd_real <= 0: return jsonify({"erro": "Quantidade inválida"}), 422
-        except: return jsonify({"erro": "Erro valor quantidade"}), 422
+            qtd_real = _quantidade_item(item_api)
+        except ValueError as e:
+            return jsonify({"erro": str(e)}), 422
 
-        exists = db.query(ItemInventario).filter_by(inventario_id=inv_id, cod_barra_ord=cod).first()
-        if exists: 
+        inseridos = _inserir_itens(db, [_dados_item(inv_id, item_api, qtd_real)])
+        if not inseridos:
+            db.rollback()
             return jsonify({"erro": "Código já lido"}), 409
 
-        novo = ItemInventario(
-            inventario_id=inv_id,
-            cod_barra_ord=item_api['cod_barra_ord'],
-            cod_item=item_api['cod_item'],
-            etiq_id=item_api['etiq_id'],
-            desc_tecnica=item_api['desc_tecnica'],
-            mascara=item_api['mascara'],
-            tmasc_item_id=item_api['tmasc_item_id'],
-            quantidade=qtd_real,
-            timestamp=datetime.now()
-        )
-        db.add(novo)
+        novo = inseridos[0]
+        registrar_evento(db, inv_id, "item", novo.to_dict())
         db.commit()
         return jsonify({"sucesso": True, "dados": novo.to_dict(), "mensagem": "Adicionado"}), 201
     except Exception as e:
         db.rollback()
         return jsonify({"erro": str(e)}), 500
-    finally: db.close()
+
+@app.route("/api/inventarios/<int:inv_id>/itens/lote", methods=["POST"])
+@login_required
+def adicionar_itens_lote(inv_id):
+    data = request.get_json(silent=True) or {}
+    codigos = data.get("codigos")
+    if not isinstance(codigos, list) or not codigos:
+        return jsonify({"erro": "Informe a lista 'codigos'"}), 400
+    if len(codigos) > LOTE_MAX_CODIGOS:
+        return jsonify({"erro": f"Máximo de {LOTE_MAX_CODIGOS} códigos por lote"}), 400
+
+    db = obter_db()
+    try:
+        inv = db.query(Inventario).filter_by(id=inv_id).first()
+        if not inv or inv.status != StatusInventario.ABERTO:
+            return jsonify({"erro": "Inventário inválido ou fechado"}), 400
+
+        resultados = []
+        unicos = []
+        vistos = set()
+        for bruto in codigos:
+            cod = str(bruto or '').strip()
+            if not cod:
+                resultados.append({"codigo": cod, "status": "vazio", "erro": "Código vazio"})
+            elif cod in vistos:
+                resultados.append({"codigo": cod, "status": "duplicado", "erro": "Código repetido no lote"})
+            else:
+                vistos.add(cod)
+                unicos.append(cod)
+                resultados.append({"codigo": cod, "status": None})
+
+        # Uma única consulta para saber quais já foram lidos neste inventário
+        ja_lidos = {
+            c for (c,) in db.query(ItemInventario.cod_barra_ord)
+            .filter(ItemInventario.inventario_id == inv_id, ItemInventario.cod_barra_ord.in_(unicos))
+        }
+        pendentes = [c for c in unicos if c not in ja_lidos]
+
+        # Cache primeiro; o que faltar vai à API em paralelo sobre a sessão compartilhada
+        with ThreadPoolExecutor(max_workers=LOTE_CONSULTAS_PARALELAS) as executor:
+            itens_api = dict(zip(pendentes, executor.map(_consultar_no_lote, pendentes, [inv_id] * len(pendentes))))
+
+        novos = {}
+        for res in resultados:
+            cod = res["codigo"]
+            if res["status"] is not None:
+                continue
+            if cod in ja_lidos:
+                res.update(status="ja_lido", erro="Código já lido")
+                continue
+            item_api = itens_api.get(cod)
+            if item_api is _INDISPONIVEL:
+                res.update(status="indisponivel", erro=API_INDISPONIVEL)
+                continue
+            if not item_api:
+                res.update(status="nao_encontrado", erro="Código não encontrado na API")
+                continue
+            try:
+                qtd_real = _quantidade_item(item_api)
+            except ValueError as e:
+                res.update(status="invalido", erro=str(e))
+                continue
+            novos[cod] = _dados_item(inv_id, item_api, qtd_real)
+            res["status"] = "adicionado"
+
+        # Um único INSERT; quem foi lido por outro coletor nesse meio tempo
+        # é descartado pelo índice único e volta como "ja_lido"
+        inseridos = {i.cod_barra_ord: i for i in _inserir_itens(db, list(novos.values()))}
+        for item in inseridos.values():
+            registrar_evento(db, inv_id, "item", item.to_dict())
+        db.commit()
+        for res in resultados:
+            if res["status"] != "adicionado":
+                continue
+            item = inseridos.get(novos[res["codigo"]]["cod_barra_ord"])
+            if item is None:
+                res.update(status="ja_lido", erro="Código já lido")
+            else:
+                res["dados"] = item.to_dict()
+
+        adicionados = sum(1 for r in resultados if r["status"] == "adicionado")
+        return jsonify({
+            "sucesso": True,
+            "adicionados": adicionados,
+            "rejeitados": len(resultados) - adicionados,
+            "resultados": resultados,
+        }), 200
+    except Exception as e:
+        db.rollback()
+        return jsonify({"erro": str(e)}), 500
+
+def _quantidade_item(item_api):
+    raw_qtde = item_api.get('qtde')
+    if raw_qtde is None: raise ValueError("Sem quantidade na API")
+    try:
+        qtd_real = float(raw_qtde)
+    except (TypeError, ValueError):
+        raise ValueError("Erro valor quantidade")
+    if qtd_real <= 0: raise ValueError("Quantidade inválida")
+    return qtd_real
+
+def _dados_item(inv_id, item_api, qtd_real):
+    return dict(
+        inventario_id=inv_id,
+        cod_barra_ord=item_api['cod_barra_ord'],
+        cod_item=item_api['cod_item'],
+        etiq_id=item_api['etiq_id'],
+        desc_tecnica=item_api['desc_tecnica'],
+        mascara=item_api['mascara'],
+        tmasc_item_id=item_api['tmasc_item_id'],
+        quantidade=qtd_real,
+        timestamp=datetime.now()
+    )
+
+def _inserir_itens(db, itens):
+    """INSERT ... ON CONFLICT DO NOTHING sobre o índice (inventario_id, cod_barra_ord).
+
+    A leitura duplicada é detectada no mesmo comando que insere, sem SELECT
+    prévio e sem corrida entre coletores. Retorna só os itens inseridos, que
+    já entram nas contagens do comparativo na mesma transação.
+    """
+    if not itens: return []
+    insert = postgresql_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+    stmt = (
+        insert(ItemInventario)
+        .on_conflict_do_nothing(index_elements=["inventario_id", "cod_barra_ord"])
+        .returning(ItemInventario)
+    )
+    inseridos = list(db.scalars(stmt, itens))
+    contagens.somar_leituras(db, inseridos)
+    return inseridos
+
+# ============ LEITURA ASSÍNCRONA ============
+
+def _processar_leitura(db, leitura):
+    """Resolve uma LeituraPendente no worker; o commit fica com o processador."""
+    status, mensagem, item_id = _resolver_leitura(db, leitura)
+    registrar_evento(db, leitura.inventario_id, "leitura", {
+        "id": leitura.id, "cod_barra_ord": leitura.cod_barra_ord,
+        "status": status.value, "mensagem": mensagem, "item_id": item_id,
+    })
+    return status, mensagem, item_id
+
+def _resolver_leitura(db, leitura):
+    inv = db.get(Inventario, leitura.inventario_id)
+    if not inv or inv.status != StatusInventario.ABERTO:
+        return StatusLeitura.INVALIDO, "Inventário inválido ou fechado", None
+
+    cod = leitura.cod_barra_ord
+    try:
+        item_api = consultar_codigo_api_individual(cod, inv.id)
+    except ErroApiCodigo:
+        return StatusLeitura.INDISPONIVEL, API_INDISPONIVEL, None
+    if not item_api:
+        return StatusLeitura.NAO_ENCONTRADO, "Código não encontrado na API", None
+
+    try:
+        qtd_real = _quantidade_item(item_api)
+    except ValueError as e:
+        return StatusLeitura.INVALIDO, str(e), None
+
+    inseridos = _inserir_itens(db, [_dados_item(inv.id, item_api, qtd_real)])
+    if not inseridos:
+        return StatusLeitura.DUPLICADO, "Código já lido", None
+    novo = inseridos[0]
+    registrar_evento(db, inv.id, "item", novo.to_dict())
+    return StatusLeitura.ADICIONADO, f"Adicionado: {novo.desc_tecnica}", novo.id
+
+processador_leituras = ProcessadorLeituras(
+    Session, _processar_leitura, workers=LEITURAS_WORKERS, max_fila=LEITURAS_MAX_FILA,
+    retencao=timedelta(days=LEITURAS_RETENCAO_DIAS),
+)
+try:
+    processador_leituras.recuperar_pendentes()
+except Exception as e:
+    log.warning("Não foi possível recuperar leituras pendentes", extra=logs.campos(erro=str(e)))
+
+@app.route("/api/inventarios/<int:inv_id>/leituras", methods=["POST"])
+@login_required
+def registrar_leitura(inv_id):
+    data = request.get_json(silent=True) or {}
+    cod = str(data.get('cod_barra_ord') or '').strip()
+    if not cod: return jsonify({"erro": "Código vazio"}), 400
+    db = obter_db()
+    try:
+        inv = db.query(Inventario).filter_by(id=inv_id).first()
+        if not inv or inv.status != StatusInventario.ABERTO:
+            return jsonify({"erro": "Inventário inválido ou fechado"}), 400
+
+        leitura = LeituraPendente(inventario_id=inv_id, cod_barra_ord=cod, criado_em=datetime.now())
+        db.add(leitura)
+        db.commit()
+        try:
+            processador_leituras.enfileirar(leitura.id)
+        except FilaCheia as e:
+            db.delete(leitura)
+            db.commit()
+            return jsonify({"erro": str(e)}), 503
+        return jsonify(leitura.to_dict()), 202
+    except Exception as e:
+        db.rollback()
+        return jsonify({"erro": str(e)}), 500
+
+@app.route("/api/inventarios/<int:inv_id>/leituras", methods=["GET"])
+@login_required
+def consultar_leituras(inv_id):
+    # ?ids=1,2,3 consulta várias leituras de uma vez (polling do coletor)
+    try:
+        ids = [int(i) for i in request.args.get('ids', '').split(',') if i.strip()]
+    except ValueError:
+        return jsonify({"erro": "ids inválidos"}), 400
+    db = obter_db()
+    q = db.query(LeituraPendente).filter_by(inventario_id=inv_id)
+    if ids:
+        q = q.filter(LeituraPendente.id.in_(ids[:200]))
+    else:
+        q = q.filter(LeituraPendente.status.in_([StatusLeitura.PENDENTE, StatusLeitura.PROCESSANDO]))
+    return jsonify([l.to_dict() for l in q.order_by(LeituraPendente.id)]), 200
+
+@app.route("/api/inventarios/<int:inv_id>/leituras/<int:leitura_id>", methods=["GET"])
+@login_required
+def consultar_leitura(inv_id, leitura_id):
+    db = obter_db()
+    leitura = db.query(LeituraPendente).filter_by(id=leitura_id, inventario_id=inv_id).first()
+    if not leitura: return jsonify({"erro": "Não encontrado"}), 404
+    return jsonify(leitura.to_dict()), 200
+
+@app.route("/api/inventarios/<int:inv_id>/eventos", methods=["GET"])
+@login_required
+def eventos_inventario(inv_id):
+    # O EventSource reenvia o último id recebido ao reconectar
+    ultimo_id = request.headers.get("Last-Event-ID", type=int)
+    return Response(
+        broker_eventos.stream(inv_id, ultimo_id),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.route("/api/validar-codigo-barras", methods=["GET"])
 @login_required
@@ -316,6 +813,8 @@ def validar_codigo_barras():
         if not item: return jsonify({"sucesso": False, "erro": "Código não encontrado"}), 404
         if item.get('qtde') is None: return jsonify({"sucesso": False, "erro": "Sem quantidade"}), 422
         return jsonify({"sucesso": True, "dados": item}), 200
+    except ErroApiCodigo:
+        return jsonify({"sucesso": False, "erro": API_INDISPONIVEL}), 503
     except Exception as e:
         return jsonify({"erro": "Erro interno", "detalhes": str(e)}), 500
 
@@ -324,149 +823,169 @@ def validar_codigo_barras():
 @app.route("/inventarios/<int:inv_id>/comparativo", methods=["GET"])
 @login_required
 def comparativo_page(inv_id):
-    db = Session()
-    try:
-        inv = db.query(Inventario).filter_by(id=inv_id).first()
-        if not inv:
-            flash("Inventário não encontrado", "danger")
-            return redirect(url_for("inventarios"))
-        return render_template("comparativo.html", inventario=inv, user=session.get("user"))
-    finally:
-        db.close()
-
-@app.route("/api/estoque/sincronizar", methods=["POST"])
-@login_required
-def sincronizar_estoque_api():
-    db = Session()
-    try:
-        if not API_ESTOQUE_URL:
-            return jsonify({"erro": "URL da API de Estoque não configurada no .env"}), 500
-
-        print(f"🔄 [SYNC] Iniciando sincronização com {API_ESTOQUE_URL}")
+    inv = obter_db().get(Inventario, inv_id)
+    if not inv:
+        flash("Inventário não encontrado", "danger")
+        return redirect(url_for("inventarios"))
+    return render_template("comparativo.html", inventario=inv, user=session.get("user"))
 
-        headers = {
-            "Authorization": f"Bearer {API_TOKEN}",
-            "Content-Type": "application/json"
-        }
-        params = {"Chave": API_ESTOQUE_CHAVE}
+@contextmanager
+def _baixar_estoque(a_partir_de=0):
+    # GET sem paginação: o sincronizador não é retomável e sempre pede do início
+    params = {"Chave": API_ESTOQUE_CHAVE}
 
-        response = requests.get(API_ESTOQUE_URL, headers=headers, params=params, timeout=30)
-        
+    # stream=True: os registros vão para a staging à medida que chegam
+    # (a latência medida vai até o cabeçalho; o download entra na duração do job)
+    response = cliente_focco.requisitar(OP_ESTOQUE, "GET", API_ESTOQUE_URL, params=params, stream=True)
+    with response:
         if response.status_code != 200:
-            return jsonify({"erro": f"Erro API Externa: {response.status_code} - {response.text}"}), 502
-
-        dados_retorno = response.json()
-        
-        lista_estoque = []
-        if isinstance(dados_retorno, list):
-            lista_estoque = dados_retorno
-        elif isinstance(dados_retorno, dict):
-             if 'value' in dados_retorno: lista_estoque = dados_retorno['value']
-             elif 'data' in dados_retorno: lista_estoque = dados_retorno['data']
-
-        if not lista_estoque:
-             return jsonify({"mensagem": "API retornou lista vazia. Estoque não atualizado."}), 200
+            metricas.focco_erros.inc(endpoint="estoque", tipo=f"http_{response.status_code}")
+            raise RuntimeError(f"Erro API Externa: {response.status_code} - {response.text[:300]}")
+        response.encoding = response.encoding or "utf-8"
+        yield iter_json_array(
+            response.iter_content(chunk_size=64 * 1024, decode_unicode=True), ("value", "data")
+        )
 
-        db.query(EstoqueInventario).delete()
-        
-        novos_registros = []
-        for item in lista_estoque:
-            if not item.get('cod_item'): continue
-            
-            q_almox = item.get('almox15')
-            if q_almox is None:
-                 q_almox = item.get('qtde') or 0
-            
-            novo = EstoqueInventario(
-                cod_emp=item.get('cod_emp'),
-                cod_item=str(item.get('cod_item')).strip(),
-                mascara=item.get('mascara'),
-                id_mascara=int(item.get('id_mascara') or 0), 
-                qtd_almox15=int(float(q_almox)), 
-                desc_tecnica=item.get('desc_tecnica')
-            )
-            novos_registros.append(novo)
+sincronizador_estoque = SincronizadorEstoque(engine, Session, _baixar_estoque)
 
-        db.add_all(novos_registros)
-        db.commit()
-        
-        qtd_total = len(novos_registros)
-        print(f"✅ [SYNC] Sucesso! {qtd_total} itens atualizados.")
-        return jsonify({"sucesso": True, "mensagem": f"{qtd_total} itens sincronizados com sucesso."}), 200
+@app.route("/api/estoque/sincronizar", methods=["POST"])
+@login_required
+def sincronizar_estoque_api():
+    """Inicia a sincronização em segundo plano e devolve o job na hora.
 
+    Se já houver uma rodando, devolve a mesma (não dispara outra); se a
+    última falhou, ela é retomada (o download recomeça do início).
+    """
+    if not API_ESTOQUE_URL:
+        return jsonify({"erro": "URL da API de Estoque não configurada no .env"}), 500
+    try:
+        job, novo = sincronizador_estoque.iniciar()
     except Exception as e:
-        db.rollback()
-        print(f"❌ [SYNC] Erro: {e}")
+        log_sync.exception("Erro ao iniciar a sincronização")
         return jsonify({"erro": f"Exceção interna: {str(e)}"}), 500
-    finally:
-        db.close()
-
-def _calcular_dados_comparativo(db, inv_id):
-    itens_lidos = db.query(
-        ItemInventario.cod_item,
-        ItemInventario.tmasc_item_id,
-        func.max(ItemInventario.desc_tecnica).label('descricao'),
-        func.sum(ItemInventario.quantidade).label('total')
-    ).filter_by(inventario_id=inv_id).group_by(ItemInventario.cod_item, ItemInventario.tmasc_item_id).all()
-
-    dict_lidos = {
-        (item.cod_item, item.tmasc_item_id): {'qtd': item.total, 'desc': item.descricao} 
-        for item in itens_lidos
-    }
+    if job is None:
+        return jsonify({"erro": "Sincronização concorrente, tente novamente"}), 409
+    if novo:
+        log_sync.info("Sincronização iniciada", extra=logs.campos(job_id=job["id"], tentativa=job["tentativas"]))
+    return jsonify({"job": job, "em_andamento": not novo}), 202
 
-    estoque_sistema = db.query(EstoqueInventario).all()
-    dict_sistema = {
-        (e.cod_item, e.id_mascara): {'qtd': e.qtd_almox15, 'desc': e.desc_tecnica, 'mascara': e.mascara}
-        for e in estoque_sistema
-    }
-
-    chaves_lidas = set(dict_lidos.keys())
-    resultado = []
-    
-    for chave in chaves_lidas:
-        cod_item_atual = chave[0]
-        id_mascara_atual = chave[1]
-        
-        dados_lido = dict_lidos.get(chave)
-        dados_sis = dict_sistema.get(chave, {'qtd': 0, 'desc': '', 'mascara': ''})
+@app.route("/api/estoque/sincronizar", methods=["GET"])
+@login_required
+def ultima_sincronizacao():
+    db = obter_db()
+    job = db.query(JobSincronizacao).order_by(JobSincronizacao.id.desc()).first()
+    return jsonify({"job": progresso(job) if job else None})
 
-        qtd_lida = float(dados_lido['qtd'])
-        qtd_sistema = float(dados_sis['qtd'])
-        
-        descricao = dados_sis['desc'] if dados_sis['desc'] else dados_lido['desc']
-        mascara = dados_sis['mascara']
+@app.route("/api/estoque/sincronizar/<int:job_id>", methods=["GET"])
+@login_required
+def progresso_sincronizacao(job_id):
+    db = obter_db()
+    job = db.get(JobSincronizacao, job_id)
+    if not job:
+        return jsonify({"erro": "Sincronização não encontrada"}), 404
+    return jsonify({"job": progresso(job)})
 
-        diferenca = qtd_lida - qtd_sistema
-        
-        if diferenca == 0: status = "ok"
-        elif diferenca < 0: status = "falta"
-        else: status = "sobra"
-
-        resultado.append({
-            "cod_item": cod_item_atual,
-            "id_mascara": id_mascara_atual,
-            "mascara": mascara,
-            "descricao": descricao,
-            "qtd_lida": qtd_lida,
-            "qtd_sistema": qtd_sistema,
-            "diferenca": diferenca,
-            "status": status
-        })
+@app.route("/api/catalogo/atualizar", methods=["POST"])
+@login_required
+def atualizar_catalogo():
+    """Força uma carga do espelho do catálogo (ou devolve a que está rodando)."""
+    if not API_CODIGO_BARRAS_URL:
+        return jsonify({"erro": "URL da API de Códigos não configurada no .env"}), 500
+    carga, nova = catalogo_codigos.iniciar(forcar=True)
+    if carga is None:
+        return jsonify({"erro": "Carga concorrente, tente novamente"}), 409
+    return jsonify({"carga": carga, "em_andamento": not nova}), 202
 
-    resultado.sort(key=lambda x: (x['diferenca'] == 0, x['cod_item']))
-    return resultado
+@app.route("/api/catalogo", methods=["GET"])
+@login_required
+def estado_catalogo():
+    return jsonify(catalogo_codigos.estado_atual(obter_db()))
 
 @app.route("/api/inventarios/<int:inv_id>/comparativo", methods=["GET"])
 @login_required
 def get_dados_comparativo(inv_id):
-    db = Session()
+    """Comparativo paginado no banco: ?status=falta&busca=...&pagina=3
+    (`page` também é aceito; por_pagina=todos devolve tudo)."""
+    status = request.args.get("status") or None
+    if status == "todos":
+        status = None
+    if status and status not in STATUS_COMPARATIVO:
+        return jsonify({"erro": f"Status inválido: {status}"}), 400
+
+    try:
+        pagina = int(request.args.get("pagina", request.args.get("page", 1)))
+        por_pagina = _ler_por_pagina()
+    except ValueError:
+        return jsonify({"erro": "Paginação inválida"}), 400
+
+    db = obter_db()
     try:
-        resultado = _calcular_dados_comparativo(db, inv_id)
+        resultado = comparar(
+            db, inv_id, status=status, busca=request.args.get("busca", "").strip(),
+            pagina=pagina, por_pagina=por_pagina,
+        )
         return jsonify(resultado), 200
     except Exception as e:
         return jsonify({"erro": str(e)}), 500
-    finally:
+
+COLUNAS_EXPORTACAO_COMPARATIVO = {
+    'cod_item': 'Código Item',
+    'id_mascara': 'ID Máscara',
+    'mascara': 'Máscara',
+    'descricao': 'Descrição',
+    'qtd_lida': 'Qtd. Lida',
+    'qtd_sistema': 'Qtd. Sistema',
+    'diferenca': 'Diferença',
+    'status': 'Status'
+}
+
+COLUNAS_EXPORTACAO_ITENS = {
+    'cod_barra_ord': 'Código de Barras',
+    'cod_item': 'Código Item',
+    'etiq_id': 'Etiqueta',
+    'desc_tecnica': 'Descrição',
+    'tmasc_item_id': 'ID Máscara',
+    'mascara': 'Máscara',
+    'quantidade': 'Quantidade',
+    'timestamp': 'Lido em',
+}
+
+def _resposta_exportacao(db, registros, colunas, nome, nome_planilha):
+    """Resposta em streaming (?formato=xlsx|csv) sobre um gerador de dicts.
+
+    A sessão fica aberta enquanto o arquivo é gerado e é fechada no fim do
+    download; a primeira linha é lida antes, para responder 404 se não houver
+    nada a exportar.
+    """
+    formato = request.args.get("formato", "xlsx")
+    if formato not in ("xlsx", "csv"):
+        db.close()
+        return f"Formato inválido: {formato}", 400
+
+    registros = iter(registros)
+    primeiro = next(registros, None)
+    if primeiro is None:
         db.close()
+        return "Nenhum dado para exportar", 404
+
+    def todos():
+        yield primeiro
+        yield from registros
+
+    def gerar():
+        try:
+            yield from gerar_arquivo(formato, colunas, todos(), nome_planilha)
+        except Exception:
+            log.exception("Erro na exportação", extra=logs.campos(arquivo=nome))
+            raise
+        finally:
+            db.close()
+
+    return Response(
+        gerar(),
+        mimetype=MIMETYPES_EXPORTACAO[formato],
+        headers={"Content-Disposition": f"attachment; filename*=UTF-8''{quote(nome)}.{formato}"},
+    )
 
 @app.route("/api/inventarios/<int:inv_id>/comparativo/exportar", methods=["GET"])
 @login_required
@@ -475,66 +994,128 @@ def exportar_comparativo_excel(inv_id):
     try:
         inv = db.query(Inventario).filter_by(id=inv_id).first()
         if not inv:
+            db.close()
             return "Inventário não encontrado", 404
 
-        dados = _calcular_dados_comparativo(db, inv_id)
-        
-        if not dados:
-            return "Nenhum dado para exportar", 404
-
-        df = pd.DataFrame(dados)
-        
-        colunas_exportar = {
-            'cod_item': 'Código Item',
-            'id_mascara': 'ID Máscara',
-            'mascara': 'Máscara',
-            'descricao': 'Descrição',
-            'qtd_lida': 'Qtd. Lida',
-            'qtd_sistema': 'Qtd. Sistema',
-            'diferenca': 'Diferença',
-            'status': 'Status'
-        }
-        
-        df = df[list(colunas_exportar.keys())].rename(columns=colunas_exportar)
+        return _resposta_exportacao(
+            db, iter_comparativo(db, inv_id), COLUNAS_EXPORTACAO_COMPARATIVO,
+            f"comparativo_Inventario_{nome_arquivo(inv.nome)}", "Comparativo",
+        )
+    except Exception as e:
+        db.close()
+        log.exception("Erro na exportação", extra=logs.campos(inventario_id=inv_id))
+        return f"Erro ao gerar Excel: {str(e)}", 500
 
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, index=False, sheet_name='Comparativo')
-        
-        output.seek(0)
-        
-        nome_seguro = "".join([c for c in inv.nome if c.isalnum() or c in (' ', '-', '_', '.', '(', ')')]).strip()
-        
-        filename = f"comparativo_Inventario_{nome_seguro}.xlsx"
+@app.route("/api/inventarios/<int:inv_id>/itens/exportar", methods=["GET"])
+@login_required
+def exportar_itens(inv_id):
+    db = Session()
+    try:
+        inv = db.query(Inventario).filter_by(id=inv_id).first()
+        if not inv:
+            db.close()
+            return "Inventário não encontrado", 404
 
-        return send_file(
-            output,
-            download_name=filename,
-            as_attachment=True,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        itens = (
+            db.query(ItemInventario).filter_by(inventario_id=inv_id)
+            .order_by(ItemInventario.id).yield_per(1000)
+        )
+        return _resposta_exportacao(
+            db, (i.to_dict() for i in itens), COLUNAS_EXPORTACAO_ITENS,
+            f"itens_Inventario_{nome_arquivo(inv.nome)}", "Itens",
         )
-
     except Exception as e:
-        print(f"Erro exportação: {e}")
-        return f"Erro ao gerar Excel: {str(e)}", 500
-    finally:
         db.close()
+        log.exception("Erro na exportação", extra=logs.campos(inventario_id=inv_id))
+        return f"Erro ao gerar exportação: {str(e)}", 500
 
 @app.route("/api/admin/status", methods=["GET"])
 @login_required
 def api_admin_status():
+    db = obter_db()
+    invs = db.query(Inventario).count()
+    itens = db.query(ItemInventario).count()
+    snapshot = None
+    status_file = os.path.join(basedir, "result_status.json")
+    if os.path.exists(status_file):
+        with open(status_file, "r", encoding="utf-8") as f:
+            snapshot = json.load(f)
+    return jsonify({
+        "inventarios": invs,
+        "itens_lidos": itens,
+        "cache": cache_codigos.estatisticas(),
+        "snapshot": snapshot,
+        "status": "OK"
+    }), 200
+
+@app.route("/api/admin/cache-codigos/<path:codigo>", methods=["DELETE"])
+@login_required
+def invalidar_codigo_cache(codigo):
+    """Descarta a resposta guardada de um código (ex.: etiqueta cadastrada
+    depois da primeira leitura), para a próxima leitura consultar a API."""
+    cache_codigos.invalidar(codigo.strip())
+    return jsonify({"sucesso": True}), 200
+
+# ============ MÉTRICAS ============
+
+# Token do coletor (Prometheus); sem ele, /metrics só responde a quem está logado
+METRICAS_TOKEN = os.getenv("METRICAS_TOKEN", "")
+
+@metricas.registrar_coletor
+def _coletar_pool():
+    pool = engine.pool
+    if hasattr(pool, "checkedout"):
+        metricas.pool_conexoes.definir(pool.checkedout(), estado="em_uso")
+        metricas.pool_conexoes.definir(pool.checkedin(), estado="livres")
+        metricas.pool_conexoes.definir(max(pool.overflow(), 0), estado="overflow")
+
+@metricas.registrar_coletor
+def _coletar_cache_codigos():
+    stats = cache_codigos.estatisticas()
+    for tipo in ("hits", "misses", "evictions", "vencidos_servidos", "entradas", "negativas"):
+        metricas.cache_codigos.definir(stats[tipo], tipo=tipo)
+    if stats["hit_ratio"] is not None:
+        metricas.cache_codigos_hit_ratio.definir(stats["hit_ratio"])
+
+@metricas.registrar_coletor
+def _coletar_sincronizacao():
+    # Lido do banco: vale para syncs rodadas em qualquer processo
     db = Session()
     try:
-        invs = db.query(Inventario).count()
-        itens = db.query(ItemInventario).count()
-        info = consultar_codigo_api_individual.cache_info()
-        return jsonify({
-            "inventarios": invs,
-            "itens_lidos": itens,
-            "cache": {"hits": info.hits, "misses": info.misses},
-            "status": "OK"
-        }), 200
-    finally: db.close()
+        job = db.query(JobSincronizacao).filter(
+            JobSincronizacao.relatorio.isnot(None)
+        ).order_by(JobSincronizacao.id.desc()).first()
+    finally:
+        db.close()
+    if job:
+        for fase, segundos in json.loads(job.relatorio).get("tempos", {}).items():
+            metricas.sincronizacao_ultima.definir(segundos, fase=fase.removesuffix("_s"))
+
+@metricas.registrar_coletor
+def _coletar_snapshot():
+    status_file = os.path.join(basedir, "result_status.json")
+    if not os.path.exists(status_file):
+        return
+    with open(status_file, "r", encoding="utf-8") as f:
+        status = json.load(f)
+    metricas.snapshot.definir(status.get("duracao_s", 0), campo="duracao_segundos")
+    metricas.snapshot.definir(status.get("total", 0), campo="linhas")
+    metricas.snapshot.definir(
+        datetime.strptime(status["atualizado_em"], "%Y-%m-%d %H:%M:%S").timestamp(), campo="atualizado_em"
+    )
+    for endpoint, t in (status.get("exportacoes") or {}).items():
+        metricas.snapshot_exportacao.definir(t.get("seconds", 0), endpoint=endpoint)
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Métricas no formato do Prometheus, para usuários logados (como as
+    demais rotas de administração) ou para o coletor, que não passa pelo
+    login: com METRICAS_TOKEN definido, aceita `Authorization: Bearer <token>`."""
+    autorizacao = request.headers.get("Authorization", "")
+    por_token = bool(METRICAS_TOKEN) and hmac.compare_digest(autorizacao.encode(), f"Bearer {METRICAS_TOKEN}".encode())
+    if not por_token and not session.get("user"):
+        return Response("Não autorizado\n", status=401, mimetype="text/plain")
+    return Response(metricas.renderizar(), content_type=metricas.CONTENT_TYPE)
 
 if __name__ == "__main__":
     app.run(debug=True, port=8050)
\ No newline at end of file
@@ -0,0 +1,181 @@
+"""Métricas no formato texto do Prometheus, sem dependências externas.
+
+Os valores ficam em memória por processo: com mais de um worker do
+gunicorn, cada um expõe os seus (raspe cada processo ou use um worker
+gevent). Registrar uma observação custa um lock e uma busca binária.
+"""
+import threading
+from bisect import bisect_left
+
+import logs
+
+# Segundos: de leituras de código (ms) até sincronizações (minutos)
+BUCKETS_PADRAO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+_registro = []
+_coletores = []
+
+log = logs.obter("metricas")
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _rotulos(nomes, valores, extra=""):
+    pares = [f'{n}="{_escapar(v)}"' for n, v in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+def _numero(valor):
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class _Metrica:
+    tipo = None
+
+    def __init__(self, nome, ajuda, rotulos=()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self._valores = {}
+        self._lock = threading.Lock()
+        _registro.append(self)
+
+    def _chave(self, rotulos):
+        return tuple(str(rotulos.get(n, "")) for n in self.rotulos)
+
+    def linhas(self):
+        yield f"# HELP {self.nome} {self.ajuda}"
+        yield f"# TYPE {self.nome} {self.tipo}"
+        with self._lock:
+            valores = dict(self._valores)
+        for chave, valor in sorted(valores.items()):
+            yield from self._amostras(chave, valor)
+
+    def _amostras(self, chave, valor):
+        yield f"{self.nome}{_rotulos(self.rotulos, chave)} {_numero(valor)}"
+
+
+class Contador(_Metrica):
+    tipo = "counter"
+
+    def inc(self, valor=1, **rotulos):
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+
+class Medidor(_Metrica):
+    tipo = "gauge"
+
+    def definir(self, valor, **rotulos):
+        with self._lock:
+            self._valores[self._chave(rotulos)] = valor
+
+
+class Histograma(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nome, ajuda, rotulos=(), buckets=BUCKETS_PADRAO):
+        super().__init__(nome, ajuda, rotulos)
+        self.buckets = tuple(sorted(buckets))
+
+    def observar(self, valor, **rotulos):
+        chave = self._chave(rotulos)
+        indice = bisect_left(self.buckets, valor)
+        with self._lock:
+            estado = self._valores.get(chave)
+            if estado is None:
+                # Contagem por bucket (não acumulada) + soma + total
+                estado = self._valores[chave] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            estado[0][indice] += 1
+            estado[1] += valor
+            estado[2] += 1
+
+    def _amostras(self, chave, valor):
+        contagens, soma, total = valor[0][:], valor[1], valor[2]
+        acumulado = 0
+        for limite, quantidade in zip(self.buckets + (float("inf"),), contagens):
+            acumulado += quantidade
+            le = 'le="' + _numero(limite if limite == float("inf") else float(limite)) + '"'
+            yield f"{self.nome}_bucket{_rotulos(self.rotulos, chave, le)} {acumulado}"
+        yield f"{self.nome}_sum{_rotulos(self.rotulos, chave)} {_numero(soma)}"
+        yield f"{self.nome}_count{_rotulos(self.rotulos, chave)} {total}"
+
+
+def registrar_coletor(funcao):
+    """`funcao()` roda a cada raspagem para atualizar medidores caros de
+    manter em tempo real (contagens no banco, arquivos de status)."""
+    _coletores.append(funcao)
+    return funcao
+
+
+def renderizar():
+    for coletor in _coletores:
+        try:
+            coletor()
+        except Exception as e:
+            log.warning("Coletor falhou", extra=logs.campos(coletor=coletor.__name__, erro=str(e)))
+    return "\n".join(linha for metrica in _registro for linha in metrica.linhas()) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# ============ MÉTRICAS DO OLIVAR ============
+
+http_requisicao = Histograma(
+    "olivar_http_requisicao_segundos", "Latência das requisições por rota",
+    ("rota", "metodo", "status"),
+)
+focco_chamada = Histograma(
+    "olivar_focco_chamada_segundos", "Latência das chamadas à API Focco por endpoint", ("endpoint",),
+)
+focco_erros = Contador(
+    "olivar_focco_erros_total", "Falhas nas chamadas à API Focco por endpoint", ("endpoint", "tipo"),
+)
+focco_circuito = Medidor(
+    "olivar_focco_circuito", "Disjuntor da API Focco por endpoint (0 fechado, 1 meio aberto, 2 aberto)",
+    ("endpoint",),
+)
+pool_espera = Histograma(
+    "olivar_db_pool_espera_segundos", "Espera para obter uma conexão do pool do banco",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30),
+)
+pool_conexoes = Medidor(
+    "olivar_db_pool_conexoes", "Conexões do pool por estado", ("estado",),
+)
+cache_codigos = Medidor(
+    "olivar_cache_codigos", "Contadores do cache de códigos de barras (compartilhado entre processos)",
+    ("tipo",),
+)
+catalogo_consultas = Contador(
+    "olivar_catalogo_consultas_total", "Leituras de código resolvidas (ou não) pelo espelho local do catálogo",
+    ("resultado",),
+)
+cache_codigos_hit_ratio = Medidor(
+    "olivar_cache_codigos_hit_ratio", "Proporção de consultas de código respondidas pelo cache",
+)
+sincronizacao = Histograma(
+    "olivar_sincronizacao_estoque_segundos", "Duração das sincronizações de estoque por fase", ("fase",),
+)
+sincronizacao_ultima = Medidor(
+    "olivar_sincronizacao_estoque_ultima_segundos", "Duração da última sincronização concluída por fase",
+    ("fase",),
+)
+snapshot = Medidor(
+    "olivar_snapshot", "Última atualização do snapshot do dashboard (result_status.json)", ("campo",),
+)
+snapshot_exportacao = Medidor(
+    "olivar_snapshot_exportacao_segundos", "Tempo de download de cada exportação Focco na última atualização",
+    ("endpoint",),
+)
+logs_descartados = Medidor(
+    "olivar_logs_descartados", "Registros de log descartados por fila cheia desde o início do processo",
+)
+registrar_coletor(lambda: logs_descartados.definir(logs.descartados()))
@@ -1,5 +1,5 @@
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
-from sqlalchemy import Column, Integer, String, DateTime, Enum as SQLEnum, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, Float, Enum as SQLEnum, ForeignKey, Index, text
 from sqlalchemy.sql import func
 from datetime import datetime
 import enum
@@ -40,6 +40,12 @@ class Inventario(Base):
 
 class ItemInventario(Base):
     __tablename__ = 'itens_inventario'
+    __table_args__ = (
+        # Garante uma leitura por etiqueta em cada inventário (usado no ON CONFLICT)
+        Index('ux_itens_inventario_codigo', 'inventario_id', 'cod_barra_ord', unique=True),
+        # Paginação por cursor (id) dentro do inventário
+        Index('ix_itens_inventario_inv_id', 'inventario_id', 'id'),
+    )
     
     id = Column(Integer, primary_key=True)
     inventario_id = Column(Integer, ForeignKey('inventarios.id'), nullable=False, index=True)
@@ -66,8 +72,28 @@ class ItemInventario(Base):
             'timestamp': self.timestamp.strftime('%d/%m/%Y %H:%M:%S') if self.timestamp else '-'
         }
 
+class ContagemInventario(Base):
+    """Soma e número de leituras por item/máscara de cada inventário.
+
+    Atualizada na mesma transação que insere ou remove itens_inventario
+    (ver contagens.py); o comparativo lê daqui em vez de reagrupar as leituras.
+    """
+    __tablename__ = 'contagens_inventario'
+
+    inventario_id = Column(Integer, ForeignKey('inventarios.id'), primary_key=True)
+    cod_item = Column(String(50), primary_key=True)
+    tmasc_item_id = Column(Integer, primary_key=True)
+    quantidade = Column(Integer, nullable=False, default=0)
+    leituras = Column(Integer, nullable=False, default=0)
+    descricao = Column(String(300), nullable=True)
+
 class EstoqueInventario(Base):
     __tablename__ = 'estoque_inventario'
+    __table_args__ = (
+        # Chave da sincronização por diff (sincronizacao.CHAVE); cod_emp nulo
+        # entra como -1, a mesma expressão usada na comparação
+        Index('ix_estoque_inventario_chave_emp', 'cod_item', 'id_mascara', text('coalesce(cod_emp, -1)')),
+    )
     
     id = Column(Integer, primary_key=True)
     cod_emp = Column(Integer, nullable=True)
@@ -75,4 +101,124 @@ class EstoqueInventario(Base):
     mascara = Column(String(200), nullable=True)
     id_mascara = Column(Integer, nullable=False, index=True)
     qtd_almox15 = Column(Integer, nullable=True) # Campo vindo da API
-    desc_tecnica = Column(String(300), nullable=True)
\ No newline at end of file
+    desc_tecnica = Column(String(300), nullable=True)
+
+class EstoqueStaging(Base):
+    """Área de carga da sincronização; comparada com estoque_inventario no fim."""
+    __tablename__ = 'estoque_staging'
+    __table_args__ = (
+        Index('ix_estoque_staging_chave_emp', 'cod_item', 'id_mascara', text('coalesce(cod_emp, -1)')),
+    )
+
+    seq = Column(Integer, primary_key=True) # Ordem de chegada: a última linha de cada chave vence
+    cod_emp = Column(Integer, nullable=True)
+    cod_item = Column(String(50), nullable=False)
+    mascara = Column(String(200), nullable=True)
+    id_mascara = Column(Integer, nullable=False)
+    qtd_almox15 = Column(Integer, nullable=True)
+    desc_tecnica = Column(String(300), nullable=True)
+
+class StatusLeitura(enum.Enum):
+    PENDENTE = "Pendente"
+    PROCESSANDO = "Processando"
+    ADICIONADO = "Adicionado"
+    DUPLICADO = "Duplicado"
+    NAO_ENCONTRADO = "Não encontrado"
+    INVALIDO = "Inválido"
+    INDISPONIVEL = "Indisponível"
+    ERRO = "Erro"
+
+class LeituraPendente(Base):
+    __tablename__ = 'leituras_pendentes'
+
+    id = Column(Integer, primary_key=True)
+    inventario_id = Column(Integer, ForeignKey('inventarios.id'), nullable=False, index=True)
+    cod_barra_ord = Column(String(50), nullable=False)
+    status = Column(SQLEnum(StatusLeitura), default=StatusLeitura.PENDENTE, nullable=False, index=True)
+    mensagem = Column(String(300), nullable=True)
+    item_id = Column(Integer, ForeignKey('itens_inventario.id'), nullable=True)
+    criado_em = Column(DateTime, default=func.now())
+    processado_em = Column(DateTime, nullable=True)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'inventario_id': self.inventario_id,
+            'cod_barra_ord': self.cod_barra_ord,
+            'status': self.status.value,
+            'mensagem': self.mensagem,
+            'item_id': self.item_id,
+            'criado_em': self.criado_em.strftime('%d/%m/%Y %H:%M:%S') if self.criado_em else '-',
+            'processado_em': self.processado_em.strftime('%d/%m/%Y %H:%M:%S') if self.processado_em else '-'
+        }
+
+
+class EventoInventario(Base):
+    __tablename__ = 'eventos_inventario'
+
+    id = Column(Integer, primary_key=True)
+    # Sem FK: o evento de exclusão sobrevive ao inventário excluído
+    inventario_id = Column(Integer, nullable=False, index=True)
+    tipo = Column(String(30), nullable=False)
+    dados = Column(Text, nullable=False) # JSON enviado aos assinantes
+    criado_em = Column(DateTime, default=func.now(), index=True)
+
+
+class StatusSincronizacao(enum.Enum):
+    EXECUTANDO = "Executando"
+    CONCLUIDO = "Concluído"
+    ERRO = "Erro"
+
+class JobSincronizacao(Base):
+    __tablename__ = 'jobs_sincronizacao'
+
+    id = Column(Integer, primary_key=True)
+    status = Column(SQLEnum(StatusSincronizacao), default=StatusSincronizacao.EXECUTANDO, nullable=False)
+    # True enquanto executa, NULL depois: o índice único garante um job ativo por vez
+    ativo = Column(Boolean, nullable=True, unique=True)
+    fase = Column(String(20), nullable=False, default='download')
+    recebidos = Column(Integer, nullable=False, default=0) # Registros lidos da API (ponto de retomada)
+    ignorados = Column(Integer, nullable=False, default=0)
+    estimados = Column(Integer, nullable=True) # Registros da última sincronização, para o ETA
+    download_concluido = Column(Boolean, nullable=False, default=False)
+    tentativas = Column(Integer, nullable=False, default=1)
+    tentativa_em = Column(DateTime, nullable=True) # Início da tentativa atual, para o ritmo do ETA
+    recebidos_inicio = Column(Integer, nullable=False, default=0) # recebidos quando a tentativa começou
+    relatorio = Column(Text, nullable=True) # JSON do relatório final
+    erro = Column(String(500), nullable=True)
+    iniciado_em = Column(DateTime, nullable=True)
+    atualizado_em = Column(DateTime, nullable=True) # Batimento: job parado há muito tempo morreu
+    finalizado_em = Column(DateTime, nullable=True)
+
+
+class CatalogoCodigo(Base):
+    """Espelho local do catálogo de etiquetas da API (cod_barra_ord -> item)."""
+    __tablename__ = 'catalogo_codigos'
+
+    cod_barra_ord = Column(String(50), primary_key=True)
+    cod_emp = Column(Integer, nullable=True)
+    etiq_id = Column(Integer, nullable=True)
+    cod_item = Column(String(50), nullable=False)
+    desc_tecnica = Column(String(300), nullable=True)
+    mascara = Column(String(200), nullable=True)
+    tmasc_item_id = Column(Integer, nullable=False, default=0)
+    qtde = Column(Float, nullable=True)
+    carga_id = Column(Integer, nullable=False, index=True) # Última carga que viu a etiqueta
+    atualizado_em = Column(DateTime, nullable=False) # Última mudança nos valores
+
+class CargaCatalogo(Base):
+    __tablename__ = 'cargas_catalogo'
+
+    id = Column(Integer, primary_key=True)
+    status = Column(SQLEnum(StatusSincronizacao), default=StatusSincronizacao.EXECUTANDO, nullable=False)
+    # Mesmo esquema de jobs_sincronizacao: uma carga ativa por vez
+    ativo = Column(Boolean, nullable=True, unique=True)
+    paginas = Column(Integer, nullable=False, default=0)
+    recebidos = Column(Integer, nullable=False, default=0)
+    inseridos = Column(Integer, nullable=False, default=0)
+    atualizados = Column(Integer, nullable=False, default=0)
+    removidos = Column(Integer, nullable=False, default=0)
+    erro = Column(String(500), nullable=True)
+    iniciado_em = Column(DateTime, nullable=True)
+    atualizado_em = Column(DateTime, nullable=True)
+    finalizado_em = Column(DateTime, nullable=True)
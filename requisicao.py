@@ -0,0 +1,87 @@
+import os
+from time import perf_counter
+
+from flask import g, has_app_context, request
+from sqlalchemy import event
+
+import logs
+import metricas
+from database import Session, engine
+
+# Acima disso a requisição é registrada como suspeita (provável N+1)
+ORCAMENTO_CONSULTAS = int(os.getenv("SQL_ORCAMENTO_CONSULTAS", "20"))
+LOG_REQUISICOES = os.getenv("SQL_LOG_REQUISICOES", "1").lower() not in ("0", "false", "nao", "não")
+
+log = logs.obter("sql")
+
+
+def obter_db():
+    """Sessão da requisição atual: criada no primeiro uso e fechada no
+    teardown do app context, então a rota não precisa de try/finally."""
+    if "db" not in g:
+        g.db = Session()
+    return g.db
+
+
+def _antes_da_consulta(conn, cursor, statement, parameters, context, executemany):
+    conn.info["sql_inicio"] = perf_counter()
+
+
+def _depois_da_consulta(conn, cursor, statement, parameters, context, executemany):
+    # Workers, SSE e streaming rodam fora do app context: não entram na conta
+    if not has_app_context():
+        return
+    g.sql_consultas = g.get("sql_consultas", 0) + 1
+    g.sql_tempo = g.get("sql_tempo", 0.0) + perf_counter() - conn.info.pop("sql_inicio", perf_counter())
+
+
+def _iniciar():
+    g.inicio_requisicao = perf_counter()
+    g.sql_consultas = 0
+    g.sql_tempo = 0.0
+
+
+def _registrar(resposta):
+    consultas = g.get("sql_consultas", 0)
+    sql_ms = g.get("sql_tempo", 0.0) * 1000
+    total_ms = (perf_counter() - g.get("inicio_requisicao", perf_counter())) * 1000
+
+    # Rota como template (/api/inventarios/<int:inv_id>/...) para não explodir rótulos
+    rota = request.url_rule.rule if request.url_rule else "(sem rota)"
+    metricas.http_requisicao.observar(
+        total_ms / 1000, rota=rota, metodo=request.method, status=resposta.status_code
+    )
+
+    resposta.headers["X-SQL-Consultas"] = str(consultas)
+    resposta.headers["X-SQL-Tempo-ms"] = f"{sql_ms:.1f}"
+    resposta.headers["Server-Timing"] = f'sql;dur={sql_ms:.1f};desc="{consultas} consultas", total;dur={total_ms:.1f}'
+
+    acima = consultas > ORCAMENTO_CONSULTAS
+    if acima or (LOG_REQUISICOES and consultas):
+        # Requisições normais passam pela amostragem; as acima do orçamento, não
+        extra = logs.campos(
+            amostrar=not acima, metodo=request.method, caminho=request.path, status=resposta.status_code,
+            consultas=consultas, sql_ms=round(sql_ms, 1), total_ms=round(total_ms, 1),
+            inventario_id=(request.view_args or {}).get("inv_id"),
+        )
+        if acima:
+            log.warning(f"Acima do orçamento de {ORCAMENTO_CONSULTAS} consultas", extra=extra)
+        else:
+            log.info("Requisição", extra=extra)
+    return resposta
+
+
+def _fechar_db(erro=None):
+    db = g.pop("db", None)
+    if db is not None:
+        db.close()
+
+
+def instalar(app):
+    """Liga a sessão por requisição e a contagem de SQL no app Flask."""
+    if not event.contains(engine, "before_cursor_execute", _antes_da_consulta):
+        event.listen(engine, "before_cursor_execute", _antes_da_consulta)
+        event.listen(engine, "after_cursor_execute", _depois_da_consulta)
+    app.before_request(_iniciar)
+    app.after_request(_registrar)
+    app.teardown_appcontext(_fechar_db)
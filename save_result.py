@@ -1,40 +1,311 @@
+import argparse
+import glob
 import json
-from time import sleep
-from datetime import datetime
 import os
+import tempfile
+from hashlib import sha256
+from threading import Lock
+from time import perf_counter, sleep
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # Parquet é opcional
+    pyarrow = None
+
+import logs
+from exportacao import gerar_arquivo
+from snapshot import SnapshotColunar, serializar_colunar
+from visualizacao_de_dados.api import get_main_data, timings
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULT_FILE = os.path.join(BASE_DIR, "result.json")
+COLUNAR_FILE = os.path.join(BASE_DIR, "result.col")
+DIFF_FILE = os.path.join(BASE_DIR, "result_diff.json")
+STATUS_FILE = os.path.join(BASE_DIR, "result_status.json")
+LOCK_FILE = os.path.join(BASE_DIR, "result.lock")
+EXPORT_DIR = os.path.join(BASE_DIR, "exportacoes")
+# Qual arquivo de cada formato corresponde ao snapshot atual
+EXPORT_MANIFEST = os.path.join(EXPORT_DIR, "atual.json")
+
+INTERVALO_HORAS = float(os.getenv("SNAPSHOT_INTERVALO_HORAS", "12"))
+# "json" mantém o result.json para compatibilidade; "colunar" gera o result.col
+FORMATOS = {f.strip() for f in os.getenv("SNAPSHOT_FORMATOS", "json,colunar").split(",") if f.strip()}
+
+# Exportações prontas do dashboard, geradas uma vez por snapshot
+EXPORTACOES = {
+    f.strip() for f in os.getenv("SNAPSHOT_EXPORTACOES", "xlsx,csv,parquet").split(",") if f.strip()
+}
+
+# Colunas que identificam uma linha do snapshot entre duas atualizações
+CHAVE_LINHA = ("COD EMP", "COD ITEM", "ID MASCARA", "VOLUME")
+
+_lock_local = Lock()
+
+log = logs.obter("snapshot")
+
+
+def agora():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def escrever_atomico(caminho, conteudo):
+    """Grava em arquivo temporário na mesma pasta e troca com os.replace.
+
+    Quem lê o caminho vê o arquivo antigo ou o novo inteiro, nunca pela metade.
+    `conteudo` pode ser bytes ou um iterável de pedaços de bytes.
+    """
+    pasta = os.path.dirname(caminho)
+    fd, temporario = tempfile.mkstemp(dir=pasta, prefix=".tmp_", suffix=os.path.basename(caminho))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            if isinstance(conteudo, (bytes, bytearray, memoryview)):
+                f.write(conteudo)
+            else:
+                for pedaco in conteudo:
+                    f.write(pedaco)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporario, caminho)
+    except BaseException:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        raise
+
+
+def escrever_json(caminho, dados):
+    escrever_atomico(caminho, json.dumps(dados, ensure_ascii=False).encode("utf-8"))
+
+
+def carregar_snapshot(caminho=None):
+    if caminho is None and os.path.exists(COLUNAR_FILE):
+        try:
+            return SnapshotColunar(COLUNAR_FILE).linhas()
+        except ValueError:
+            pass
+    caminho = caminho or RESULT_FILE
+    if not os.path.exists(caminho):
+        return []
+    try:
+        with open(caminho, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except ValueError:
+        return []
+
+
+def indexar_linhas(linhas):
+    """Mapeia cada linha pela sua chave; repetições ganham um contador."""
+    indice = {}
+    for linha in linhas:
+        chave = tuple(linha.get(c) for c in CHAVE_LINHA)
+        ocorrencia = 0
+        while (chave, ocorrencia) in indice:
+            ocorrencia += 1
+        indice[(chave, ocorrencia)] = linha
+    return indice
+
+
+def calcular_diff(anterior, atual):
+    antes = indexar_linhas(anterior)
+    depois = indexar_linhas(atual)
+    inseridas = [linha for chave, linha in depois.items() if chave not in antes]
+    removidas = [linha for chave, linha in antes.items() if chave not in depois]
+    alteradas = [
+        linha for chave, linha in depois.items()
+        if chave in antes and antes[chave] != linha
+    ]
+    return {"inseridas": inseridas, "alteradas": alteradas, "removidas": removidas}
+
+
+def hash_conteudo(linhas):
+    """Hash do conteúdo do snapshot; nomeia os arquivos exportados."""
+    bruto = json.dumps(linhas, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return sha256(bruto.encode("utf-8")).hexdigest()[:16]
+
+
+def _coluna_parquet(valores):
+    try:
+        return pyarrow.array(valores)
+    except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+        # Coluna com tipos misturados vira texto
+        return pyarrow.array([None if v is None else str(v) for v in valores], pyarrow.string())
+
+
+def escrever_parquet(caminho, linhas):
+    colunas = list(linhas[0].keys()) if linhas else []
+    tabela = pyarrow.table({c: _coluna_parquet([l.get(c) for l in linhas]) for c in colunas})
+    pasta = os.path.dirname(caminho)
+    fd, temporario = tempfile.mkstemp(dir=pasta, prefix=".tmp_", suffix=os.path.basename(caminho))
+    os.close(fd)
+    try:
+        pyarrow.parquet.write_table(tabela, temporario, compression="zstd")
+        os.replace(temporario, caminho)
+    except BaseException:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        raise
+
+
+def gerar_exportacoes(linhas, hash_snapshot):
+    """Gera XLSX, CSV e Parquet (conforme SNAPSHOT_EXPORTACOES) do snapshot.
+
+    Os arquivos se chamam dashboard_<hash>.<formato>: um snapshot igual
+    reaproveita os existentes. O manifesto aponta para os atuais e os de
+    snapshots anteriores são apagados.
+    """
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    colunas = {c: c for c in (linhas[0].keys() if linhas else [])}
+    arquivos = {}
+    for formato in ("xlsx", "csv", "parquet"):
+        if formato not in EXPORTACOES:
+            continue
+        if formato == "parquet" and pyarrow is None:
+            log.warning("pyarrow não instalado: exportação Parquet ignorada")
+            continue
+        nome = f"dashboard_{hash_snapshot}.{formato}"
+        caminho = os.path.join(EXPORT_DIR, nome)
+        if not os.path.exists(caminho):
+            inicio = perf_counter()
+            if formato == "parquet":
+                escrever_parquet(caminho, linhas)
+            else:
+                escrever_atomico(caminho, gerar_arquivo(formato, colunas, linhas, "Estoque"))
+            log.info("Exportação gerada", extra=logs.campos(
+                formato=formato, segundos=round(perf_counter() - inicio, 3)
+            ))
+        arquivos[formato] = nome
+
+    manifesto = {"hash": hash_snapshot, "gerado_em": agora(), "linhas": len(linhas), "arquivos": arquivos}
+    escrever_json(EXPORT_MANIFEST, manifesto)
+
+    atuais = set(arquivos.values())
+    for caminho in glob.glob(os.path.join(EXPORT_DIR, "dashboard_*")):
+        if os.path.basename(caminho) not in atuais:
+            os.remove(caminho)
+    return manifesto
+
+
+class TravaSnapshot:
+    """Trava de arquivo que impede duas atualizações simultâneas.
+
+    Vale entre processos (loop agendado e uma execução manual) e é liberada
+    pelo sistema operacional se o processo morrer.
+    """
+
+    def __init__(self, caminho=None):
+        self.caminho = caminho or LOCK_FILE
+        self.arquivo = None
+
+    def adquirir(self):
+        if not _lock_local.acquire(blocking=False):
+            return False
+        self.arquivo = open(self.caminho, "a+")
+        try:
+            if fcntl:
+                fcntl.flock(self.arquivo.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                self.arquivo.seek(0)
+                msvcrt.locking(self.arquivo.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            self.arquivo.close()
+            self.arquivo = None
+            _lock_local.release()
+            return False
+        return True
+
+    def liberar(self):
+        if self.arquivo is None:
+            return
+        if fcntl:
+            fcntl.flock(self.arquivo.fileno(), fcntl.LOCK_UN)
+        else:
+            self.arquivo.seek(0)
+            msvcrt.locking(self.arquivo.fileno(), msvcrt.LK_UNLCK, 1)
+        self.arquivo.close()
+        self.arquivo = None
+        _lock_local.release()
 
-from visualizacao_de_dados.api import get_main_data
 
 def save_data():
-    """Busca dados da API e salva no result.json, substituindo completamente o arquivo anterior"""
+    """Busca dados da API e atualiza o result.json de forma atômica.
+
+    Só regrava o snapshot (JSON e/ou colunar, conforme SNAPSHOT_FORMATOS)
+    quando alguma linha mudou; o diff da atualização fica em
+    result_diff.json e as métricas em result_status.json.
+    """
+    trava = TravaSnapshot()
+    if not trava.adquirir():
+        log.info("Atualização já em andamento, ignorando esta execução")
+        return False
     try:
-        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Buscando dados da API...")
+        inicio = perf_counter()
+        log.info("Buscando dados da API")
         data = get_main_data()
-        
-        # Salva com encoding UTF-8 e sobrescreve o arquivo (modo 'w')
-        with open('result.json', 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        
-        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] ✓ Dados atualizados! Total de itens: {len(data)}")
+        for endpoint, t in timings.items():
+            log.info("Exportação Focco lida", extra=logs.campos(
+                endpoint=endpoint, segundos=t["seconds"], linhas=t["rows"], tentativas=t["attempts"]
+            ))
+
+        diff = calcular_diff(carregar_snapshot(), data)
+        mudou = any(diff.values())
+        if "json" in FORMATOS and (mudou or not os.path.exists(RESULT_FILE)):
+            escrever_json(RESULT_FILE, data)
+        if "colunar" in FORMATOS and (mudou or not os.path.exists(COLUNAR_FILE)):
+            escrever_atomico(COLUNAR_FILE, serializar_colunar(data))
+        if mudou:
+            escrever_json(DIFF_FILE, {"gerado_em": agora(), **diff})
+        exportacoes = gerar_exportacoes(data, hash_conteudo(data)) if EXPORTACOES else None
+
+        status = {
+            "atualizado_em": agora(),
+            "duracao_s": round(perf_counter() - inicio, 3),
+            "total": len(data),
+            "inseridas": len(diff["inseridas"]),
+            "alteradas": len(diff["alteradas"]),
+            "removidas": len(diff["removidas"]),
+            "regravado": mudou,
+            "exportacoes": dict(timings),
+            "arquivos_exportados": exportacoes,
+        }
+        escrever_json(STATUS_FILE, status)
+
+        log.info("Dados atualizados", extra=logs.campos(**{
+            c: status[c] for c in ("duracao_s", "total", "inseridas", "alteradas", "removidas", "regravado")
+        }))
         return True
-    except Exception as e:
-        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] ✗ Erro ao buscar/salvar dados: {e}")
-        import traceback
-        print(traceback.format_exc())
+    except Exception:
+        log.exception("Erro ao buscar/salvar dados")
         return False
+    finally:
+        trava.liberar()
 
-if __name__ == "__main__":
-    print("=" * 60)
-    print("SERVIÇO DE ATUALIZAÇÃO DE DADOS - OLIVAR")
-    print("=" * 60)
-    print(f"Intervalo de atualização: 12 horas")
-    print(f"Iniciado em: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    print("=" * 60)
-    
-    # Primeira execução imediata
-    save_data()
-    
-    # Loop infinito com atualização a cada 12 horas
+
+def executar_agendado(intervalo_horas):
+    """Atualiza agora e depois a cada `intervalo_horas`, sem acumular atrasos."""
+    intervalo = intervalo_horas * 60 * 60
     while True:
-        sleep(12 * 60 * 60)  # 12 horas
-        save_data()
\ No newline at end of file
+        inicio = perf_counter()
+        save_data()
+        sleep(max(0, intervalo - (perf_counter() - inicio)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serviço de atualização do snapshot do dashboard")
+    parser.add_argument("--intervalo", type=float, default=INTERVALO_HORAS, help="intervalo em horas")
+    parser.add_argument("--agora", action="store_true", help="executa uma única atualização e sai")
+    args = parser.parse_args()
+    logs.configurar()
+
+    if args.agora:
+        raise SystemExit(0 if save_data() else 1)
+
+    log.info("Serviço de atualização de dados iniciado", extra=logs.campos(intervalo_horas=args.intervalo))
+
+    executar_agendado(args.intervalo)
@@ -0,0 +1,316 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from time import perf_counter
+
+from sqlalchemy import and_, delete, exists, func, insert, literal_column, or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+import logs
+import metricas
+from models import EstoqueInventario, EstoqueStaging, JobSincronizacao, StatusSincronizacao
+
+TAMANHO_LOTE = 5000
+
+# Identifica uma linha de estoque entre duas sincronizações
+CHAVE = ('cod_emp', 'cod_item', 'id_mascara')
+# cod_emp nulo na comparação das chaves (mesmo valor dos índices em models.py)
+SEM_EMPRESA = -1
+VALORES = ('mascara', 'qtd_almox15', 'desc_tecnica')
+
+estoque = EstoqueInventario.__table__
+staging = EstoqueStaging.__table__
+jobs = JobSincronizacao.__table__
+
+log = logs.obter("sync")
+
+
+def normalizar_item(item):
+    """Converte um registro da API de estoque; None para linhas sem cod_item."""
+    if not item.get('cod_item'): return None
+
+    q_almox = item.get('almox15')
+    if q_almox is None:
+        q_almox = item.get('qtde') or 0
+
+    return {
+        'cod_emp': item.get('cod_emp'),
+        'cod_item': str(item.get('cod_item')).strip(),
+        'mascara': item.get('mascara'),
+        'id_mascara': int(item.get('id_mascara') or 0),
+        'qtd_almox15': int(float(q_almox)),
+        'desc_tecnica': item.get('desc_tecnica'),
+    }
+
+
+def _chave(colunas):
+    # coalesce em vez de IS NOT DISTINCT FROM (cod_emp pode ser nulo): a
+    # igualdade simples usa os índices de expressão das duas tabelas
+    return [func.coalesce(colunas.cod_emp, literal_column(str(SEM_EMPRESA))), colunas.cod_item, colunas.id_mascara]
+
+
+def _mesma_chave(a, b):
+    return and_(*(x == y for x, y in zip(_chave(a), _chave(b))))
+
+
+def carregar_staging(engine, registros, tamanho_lote=TAMANHO_LOTE, ao_gravar=None,
+                     recebidos=0, ignorados=0):
+    """Grava os registros na staging em lotes (executemany), um commit por lote.
+
+    Nenhum lote segura a trava de escrita por muito tempo e só um lote fica
+    em memória. Para continuar uma carga interrompida, passe os contadores já
+    gravados e só os registros que faltam (a fonte é quem retoma).
+    `ao_gravar(conn, recebidos, ignorados)` roda na transação de cada lote.
+    Retorna (recebidos, ignorados).
+    """
+    lote = []
+
+    def gravar():
+        with engine.begin() as conn:
+            if lote:
+                conn.execute(insert(staging), lote)
+            if ao_gravar:
+                ao_gravar(conn, recebidos, ignorados)
+        lote.clear()
+
+    for item in registros:
+        recebidos += 1
+        linha = normalizar_item(item)
+        if linha is None:
+            ignorados += 1
+            continue
+        lote.append(linha)
+        if len(lote) >= tamanho_lote:
+            gravar()
+    gravar()
+    return recebidos, ignorados
+
+
+def aplicar_diff(engine):
+    """Aplica inserções, atualizações e remoções numa única transação curta."""
+    with engine.begin() as conn:
+        # Se a API repetir uma chave, vale a última linha recebida
+        ultimas = select(func.max(staging.c.seq)).group_by(*_chave(staging.c))
+        conn.execute(delete(staging).where(staging.c.seq.not_in(ultimas)))
+
+        # Chaves repetidas deixadas pela carga antiga (delete + add_all)
+        primeiras = select(func.min(estoque.c.id)).group_by(*_chave(estoque.c))
+        removidos = conn.execute(delete(estoque).where(estoque.c.id.not_in(primeiras))).rowcount
+
+        removidos += conn.execute(
+            delete(estoque).where(~exists().where(_mesma_chave(staging.c, estoque.c)))
+        ).rowcount
+
+        diferente = or_(*(staging.c[c].is_distinct_from(estoque.c[c]) for c in VALORES))
+        atualizados = conn.execute(
+            update(estoque)
+            .where(exists().where(and_(_mesma_chave(staging.c, estoque.c), diferente)))
+            .values({
+                c: select(staging.c[c]).where(_mesma_chave(staging.c, estoque.c)).scalar_subquery()
+                for c in VALORES
+            })
+        ).rowcount
+
+        colunas = list(CHAVE + VALORES)
+        inseridos = conn.execute(
+            insert(estoque).from_select(
+                colunas,
+                select(*(staging.c[c] for c in colunas))
+                .where(~exists().where(_mesma_chave(estoque.c, staging.c)))
+                .order_by(staging.c.seq),
+            )
+        ).rowcount
+
+        total = conn.execute(select(func.count()).select_from(staging)).scalar()
+        conn.execute(delete(staging))
+    return {"inseridos": inseridos, "atualizados": atualizados, "removidos": removidos, "total": total}
+
+
+def progresso(job, agora=None):
+    """Estado do job para a API: fase, registros processados e ETA."""
+    agora = agora or datetime.now()
+    processados = job.recebidos or 0
+    percentual = eta = None
+    if job.status == StatusSincronizacao.CONCLUIDO:
+        percentual = 100
+    elif job.fase == 'download' and job.estimados:
+        percentual = min(99, round(100 * processados / job.estimados))
+        # Ritmo medido só na tentativa atual; uma retomada começa do meio
+        feitos = processados - (job.recebidos_inicio or 0)
+        decorrido = (agora - job.tentativa_em).total_seconds() if job.tentativa_em else 0
+        if feitos > 0 and decorrido > 0:
+            eta = round(max(job.estimados - processados, 0) * decorrido / feitos)
+    elif job.fase == 'aplicacao':
+        percentual = 99
+
+    return {
+        'id': job.id,
+        'status': job.status.value,
+        'fase': job.fase,
+        'processados': processados,
+        'ignorados': job.ignorados or 0,
+        'estimados': job.estimados,
+        'percentual': percentual,
+        'eta_s': eta,
+        'tentativas': job.tentativas,
+        'erro': job.erro,
+        'relatorio': json.loads(job.relatorio) if job.relatorio else None,
+        'iniciado_em': job.iniciado_em.strftime('%d/%m/%Y %H:%M:%S') if job.iniciado_em else '-',
+        'finalizado_em': job.finalizado_em.strftime('%d/%m/%Y %H:%M:%S') if job.finalizado_em else '-',
+    }
+
+
+class SincronizadorEstoque:
+    """Roda a sincronização do estoque como job em segundo plano.
+
+    Só um job executa por vez, mesmo entre processos: o índice único em
+    `jobs_sincronizacao.ativo` barra o segundo, e quem pedir uma sincronização
+    nesse meio tempo recebe o job em andamento. O progresso é gravado no job
+    junto com cada lote da staging. Um job que falhou é retomado no próximo
+    pedido (se falhou há menos de `retomar_ate`): se o download tinha
+    terminado, só o diff é reaplicado; senão o download recomeça do zero.
+
+    `baixar(a_partir_de)` devolve um context manager com o iterável de
+    registros da API a partir daquela posição. Só com `retomavel=True` (fonte
+    paginada em ordem estável, ex.: Skip sobre uma chave ordenada) o download
+    continua de onde parou; uma fonte sem paginação sempre recebe 0, porque
+    nada garante que devolva os registros na mesma ordem.
+    """
+
+    def __init__(self, engine, session_factory, baixar, tamanho_lote=TAMANHO_LOTE,
+                 travado_apos=timedelta(minutes=5), retomar_ate=timedelta(hours=1), retomavel=False):
+        self.engine = engine
+        self.Session = session_factory
+        self.baixar = baixar
+        self.retomavel = retomavel
+        self.tamanho_lote = tamanho_lote
+        self.travado_apos = travado_apos
+        self.retomar_ate = retomar_ate
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sincronizacao")
+
+    def _liberar_travado(self, db, agora):
+        # Job "ativo" sem batimento há muito tempo: o processo dele morreu
+        db.query(JobSincronizacao).filter(
+            JobSincronizacao.ativo.is_(True),
+            JobSincronizacao.atualizado_em < agora - self.travado_apos,
+        ).update({
+            "status": StatusSincronizacao.ERRO, "ativo": None, "finalizado_em": agora,
+            "erro": "Interrompido (processo encerrado durante a sincronização)",
+        }, synchronize_session=False)
+        db.commit()
+
+    def iniciar(self):
+        """Inicia (ou retoma) um job. Retorna (progresso, novo); se já havia
+        um em andamento, `novo` é False e o progresso é o dele."""
+        db = self.Session()
+        try:
+            agora = datetime.now()
+            self._liberar_travado(db, agora)
+            ativo = self.job_ativo(db)
+            if ativo:
+                return progresso(ativo), False
+
+            ultimo = db.query(JobSincronizacao).order_by(JobSincronizacao.id.desc()).first()
+            inicio = {"ativo": True, "status": StatusSincronizacao.EXECUTANDO, "erro": None,
+                      "atualizado_em": agora, "tentativa_em": agora, "finalizado_em": None}
+            try:
+                if (ultimo and ultimo.status == StatusSincronizacao.ERRO
+                        and ultimo.finalizado_em and agora - ultimo.finalizado_em < self.retomar_ate):
+                    # UPDATE condicional: outro processo pode estar retomando o mesmo job
+                    retomado = db.query(JobSincronizacao).filter(
+                        JobSincronizacao.id == ultimo.id,
+                        JobSincronizacao.status == StatusSincronizacao.ERRO,
+                    ).update({**inicio, "tentativas": JobSincronizacao.tentativas + 1,
+                              "recebidos_inicio": JobSincronizacao.recebidos},
+                             synchronize_session=False)
+                    job_id = ultimo.id if retomado else None
+                else:
+                    anterior = db.query(JobSincronizacao.recebidos).filter(
+                        JobSincronizacao.status == StatusSincronizacao.CONCLUIDO
+                    ).order_by(JobSincronizacao.id.desc()).first()
+                    job = JobSincronizacao(iniciado_em=agora, estimados=anterior[0] if anterior else None,
+                                           **inicio)
+                    db.add(job)
+                    db.flush()
+                    job_id = job.id
+                db.commit()
+            except IntegrityError:
+                db.rollback()
+                job_id = None
+
+            if job_id is None:
+                ativo = self.job_ativo(db)
+                return (progresso(ativo) if ativo else None), False
+
+            self._executor.submit(self._executar, job_id)
+            return progresso(db.get(JobSincronizacao, job_id)), True
+        finally:
+            db.close()
+
+    def job_ativo(self, db):
+        return db.query(JobSincronizacao).filter(JobSincronizacao.ativo.is_(True)).first()
+
+    def _atualizar(self, conn, job_id, **valores):
+        conn.execute(
+            update(jobs).where(jobs.c.id == job_id).values(atualizado_em=datetime.now(), **valores)
+        )
+
+    def _executar(self, job_id):
+        inicio = perf_counter()
+        carga = 0
+        try:
+            with self.engine.connect() as conn:
+                job = conn.execute(select(jobs).where(jobs.c.id == job_id)).one()
+            recebidos, ignorados = job.recebidos, job.ignorados
+
+            if not job.download_concluido:
+                if not self.retomavel:
+                    recebidos = ignorados = 0
+                log.info("Download do estoque iniciado", extra=logs.campos(job_id=job_id, a_partir_de=recebidos))
+                with self.engine.begin() as conn:
+                    if recebidos == 0:
+                        conn.execute(delete(staging))
+                    self._atualizar(conn, job_id, fase='download', recebidos=recebidos, ignorados=ignorados,
+                                    recebidos_inicio=recebidos)
+
+                def ao_gravar(conn, recebidos, ignorados):
+                    self._atualizar(conn, job_id, recebidos=recebidos, ignorados=ignorados)
+
+                with self.baixar(recebidos) as registros:
+                    recebidos, ignorados = carregar_staging(
+                        self.engine, registros, self.tamanho_lote, ao_gravar,
+                        recebidos=recebidos, ignorados=ignorados,
+                    )
+                carga = perf_counter() - inicio
+                with self.engine.begin() as conn:
+                    self._atualizar(conn, job_id, fase='aplicacao', download_concluido=True)
+
+            relatorio = {"recebidos": recebidos, "ignorados": ignorados}
+            if recebidos == ignorados:
+                # Nada válido chegou: o estoque atual é mantido
+                relatorio.update(inseridos=0, atualizados=0, removidos=0, total=None, aplicado=False)
+            else:
+                relatorio.update(aplicar_diff(self.engine), aplicado=True)
+            relatorio["tempos"] = {
+                "download_e_carga_s": round(carga, 3),
+                "aplicacao_s": round(perf_counter() - inicio - carga, 3),
+                "total_s": round(perf_counter() - inicio, 3),
+            }
+
+            with self.engine.begin() as conn:
+                if not relatorio["aplicado"]:
+                    conn.execute(delete(staging))
+                self._atualizar(conn, job_id, status=StatusSincronizacao.CONCLUIDO, ativo=None,
+                                fase='concluido', relatorio=json.dumps(relatorio),
+                                finalizado_em=datetime.now())
+            for fase, segundos in relatorio["tempos"].items():
+                metricas.sincronizacao.observar(segundos, fase=fase.removesuffix("_s"))
+            log.info("Sincronização concluída", extra=logs.campos(job_id=job_id, **relatorio))
+        except Exception as e:
+            log.exception("Sincronização falhou", extra=logs.campos(job_id=job_id))
+            try:
+                with self.engine.begin() as conn:
+                    self._atualizar(conn, job_id, status=StatusSincronizacao.ERRO, ativo=None,
+                                    erro=str(e)[:500], finalizado_em=datetime.now())
+            except Exception:
+                log.exception("Não foi possível registrar a falha do job", extra=logs.campos(job_id=job_id))
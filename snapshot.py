@@ -0,0 +1,297 @@
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from hashlib import sha1
+from threading import Lock
+
+
+class Snapshot:
+    """Linhas do snapshot: lista de dicts (result.json) ou, vindo do formato
+    colunar, o próprio SnapshotColunar, de onde `consultar` lê só as colunas
+    de que precisa."""
+
+    def __init__(self, linhas, versao, colunar=None):
+        self.linhas = linhas
+        self.versao = versao
+        self.colunar = colunar
+        if colunar is not None:
+            self.colunas = colunar.colunas
+            self.total = colunar.total
+        else:
+            self.colunas = list(linhas[0].keys()) if linhas else []
+            self.total = len(linhas)
+
+
+class SnapshotCache:
+    """Mantém o result.json já interpretado em memória.
+
+    O arquivo só é relido quando o mtime (ou o tamanho) muda, então as
+    requisições não pagam mais o json.load a cada acesso. Se houver um
+    snapshot colunar mais recente que o JSON, ele é lido no lugar.
+    """
+
+    def __init__(self, caminho, caminho_colunar=None):
+        self.caminho = caminho
+        self.caminho_colunar = caminho_colunar
+        self._snapshot = Snapshot([], None)
+        self._assinatura = None
+        self._lock = Lock()
+
+    def _assinatura_atual(self):
+        candidatos = []
+        for caminho in (self.caminho_colunar, self.caminho):
+            if not caminho:
+                continue
+            try:
+                st = os.stat(caminho)
+            except FileNotFoundError:
+                continue
+            candidatos.append((st.st_mtime_ns, st.st_size, caminho))
+        # O mais recente vence; no empate, o colunar (primeiro da lista)
+        return max(candidatos, key=lambda c: c[0], default=None)
+
+    def obter(self):
+        assinatura = self._assinatura_atual()
+        if assinatura == self._assinatura:
+            return self._snapshot
+        with self._lock:
+            if assinatura != self._assinatura:
+                self._snapshot = self._carregar(assinatura)
+                self._assinatura = assinatura
+        return self._snapshot
+
+    def _carregar(self, assinatura):
+        if assinatura is None:
+            return Snapshot([], None)
+        mtime, tamanho, caminho = assinatura
+        versao = "%x-%x" % (mtime, tamanho)
+        if caminho == self.caminho_colunar:
+            return Snapshot(None, versao, colunar=SnapshotColunar(caminho))
+        with open(caminho, "r", encoding="utf-8") as f:
+            linhas = json.load(f)
+        if not isinstance(linhas, list):
+            linhas = []
+        return Snapshot(linhas, versao)
+
+
+def _texto(valor):
+    return "" if valor is None else str(valor).lower()
+
+
+def _chave_valor(valor):
+    if valor is None or valor == "":
+        return (2, 0, "")
+    if isinstance(valor, (int, float)):
+        return (0, valor, "")
+    return (1, 0, str(valor).lower())
+
+
+def _chave_ordenacao(coluna):
+    def chave(linha):
+        return _chave_valor(linha.get(coluna))
+    return chave
+
+
+def consultar(snapshot, filtros=None, busca="", ordenar=None, decrescente=False,
+              pagina=1, por_pagina=100):
+    """Filtra, ordena e pagina as linhas do snapshot.
+
+    `filtros` mapeia coluna -> texto (contém, sem diferenciar maiúsculas);
+    `busca` procura o texto em qualquer coluna. `por_pagina=0` devolve tudo.
+    """
+    filtros = {c: v.lower() for c, v in (filtros or {}).items() if v and c in snapshot.colunas}
+    busca = (busca or "").lower()
+    if snapshot.colunar is not None:
+        filtrados, linhas = _consultar_colunar(
+            snapshot.colunar, filtros, busca, ordenar, decrescente, pagina, por_pagina
+        )
+        return _resultado(snapshot, filtrados, pagina, por_pagina, linhas)
+
+    linhas = snapshot.linhas
+    if filtros:
+        linhas = [
+            l for l in linhas
+            if all(v in _texto(l.get(c)) for c, v in filtros.items())
+        ]
+    if busca:
+        linhas = [
+            l for l in linhas
+            if any(busca in _texto(valor) for valor in l.values())
+        ]
+    if ordenar in snapshot.colunas:
+        linhas = sorted(linhas, key=_chave_ordenacao(ordenar), reverse=decrescente)
+
+    filtrados = len(linhas)
+    if por_pagina:
+        inicio = (max(pagina, 1) - 1) * por_pagina
+        linhas = linhas[inicio:inicio + por_pagina]
+    return _resultado(snapshot, filtrados, pagina, por_pagina, linhas)
+
+
+def _consultar_colunar(colunar, filtros, busca, ordenar, decrescente, pagina, por_pagina):
+    """Mesma consulta sobre o SnapshotColunar, por índices de linha: cada
+    filtro lê só a sua coluna, a ordenação só a coluna ordenada, e as linhas
+    completas são montadas só para a página pedida."""
+    indices = range(colunar.total)
+    for coluna, texto in filtros.items():
+        indices = colunar.contendo(coluna, texto, indices)
+    if busca:
+        achados = set()
+        restantes = indices
+        for coluna in colunar.colunas:
+            achados.update(colunar.contendo(coluna, busca, restantes))
+            restantes = [i for i in restantes if i not in achados]
+        indices = [i for i in indices if i in achados]
+    if ordenar in colunar.colunas:
+        pares = sorted(
+            zip(indices, colunar.valores(ordenar, indices)),
+            key=lambda par: _chave_valor(par[1]),
+            reverse=decrescente,
+        )
+        indices = [i for i, _ in pares]
+
+    filtrados = len(indices)
+    if por_pagina:
+        inicio = (max(pagina, 1) - 1) * por_pagina
+        indices = indices[inicio:inicio + por_pagina]
+    return filtrados, colunar.linhas_em(indices)
+
+
+def _resultado(snapshot, filtrados, pagina, por_pagina, linhas):
+    return {
+        "total": snapshot.total,
+        "filtrados": filtrados,
+        "pagina": pagina,
+        "por_pagina": por_pagina,
+        "colunas": snapshot.colunas,
+        "linhas": linhas,
+    }
+
+
+def etag_consulta(snapshot, query_string):
+    """ETag de uma consulta: muda quando o snapshot ou os parâmetros mudam."""
+    return sha1(f"{snapshot.versao}|{query_string}".encode("utf-8")).hexdigest()
+
+
+# ============ FORMATO COLUNAR ============
+#
+# Layout do arquivo (.col):
+#   MAGIC | uint32 tamanho do cabeçalho | cabeçalho JSON | blocos das colunas
+# Cada coluna é um array contínuo alinhado em 8 bytes:
+#   "int"   -> int64 ('q')
+#   "float" -> float64 ('d')
+#   "dict"  -> códigos uint32 ('I') que indexam o dicionário do cabeçalho
+# Colunas numéricas são lidas como memoryview direto do mmap, sem cópia.
+
+MAGIC = b"OLVCOL1\n"
+_TIPOS = {"int": "q", "float": "d", "dict": "I"}
+
+
+def _tipo_coluna(valores):
+    if valores and all(type(v) is int for v in valores):
+        if all(-2**63 <= v < 2**63 for v in valores):
+            return "int"
+    if valores and all(type(v) is float for v in valores):
+        return "float"
+    return "dict"
+
+
+def serializar_colunar(linhas):
+    """Converte a lista de linhas (dicts) no formato colunar, em bytes."""
+    nomes = list(linhas[0].keys()) if linhas else []
+    blocos = []
+    colunas = []
+    deslocamento = 0
+    for nome in nomes:
+        valores = [linha.get(nome) for linha in linhas]
+        tipo = _tipo_coluna(valores)
+        info = {"nome": nome, "tipo": tipo}
+        if tipo == "dict":
+            # Chave inclui o tipo para não fundir 1, 1.0 e True
+            codigos = {}
+            dicionario = []
+            dados = array("I")
+            for v in valores:
+                chave = (type(v), v)
+                codigo = codigos.get(chave)
+                if codigo is None:
+                    codigo = codigos[chave] = len(dicionario)
+                    dicionario.append(v)
+                dados.append(codigo)
+            info["dicionario"] = dicionario
+        else:
+            dados = array(_TIPOS[tipo], valores)
+        bruto = dados.tobytes()
+        info["offset"] = deslocamento
+        info["bytes"] = len(bruto)
+        preenchimento = -len(bruto) % 8
+        blocos.append(bruto + b"\0" * preenchimento)
+        deslocamento += len(bruto) + preenchimento
+        colunas.append(info)
+
+    cabecalho = json.dumps(
+        {"linhas": len(linhas), "ordem_bytes": sys.byteorder, "colunas": colunas},
+        ensure_ascii=False,
+    ).encode("utf-8")
+    cabecalho += b" " * (-(len(MAGIC) + 4 + len(cabecalho)) % 8)
+    return b"".join([MAGIC, struct.pack("<I", len(cabecalho)), cabecalho, *blocos])
+
+
+class SnapshotColunar:
+    """Leitor do formato colunar sobre mmap; cada coluna é lida sob demanda."""
+
+    def __init__(self, caminho):
+        with open(caminho, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buf = memoryview(self._mmap)
+        if buf[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{caminho} não é um snapshot colunar")
+        inicio = len(MAGIC) + 4
+        (tamanho,) = struct.unpack("<I", buf[len(MAGIC):inicio])
+        cabecalho = json.loads(bytes(buf[inicio:inicio + tamanho]))
+        if cabecalho["ordem_bytes"] != sys.byteorder:
+            raise ValueError("Snapshot colunar gerado com outra ordem de bytes")
+        self._dados = buf[inicio + tamanho:]
+        self.total = cabecalho["linhas"]
+        self._colunas = {c["nome"]: c for c in cabecalho["colunas"]}
+        self.colunas = [c["nome"] for c in cabecalho["colunas"]]
+
+    def _bruto(self, nome):
+        info = self._colunas[nome]
+        return info, self._dados[info["offset"]:info["offset"] + info["bytes"]].cast(_TIPOS[info["tipo"]])
+
+    def coluna(self, nome):
+        info, valores = self._bruto(nome)
+        if info["tipo"] == "dict":
+            dicionario = info["dicionario"]
+            return [dicionario[c] for c in valores]
+        return valores
+
+    def valores(self, nome, indices):
+        """Valores da coluna só nas linhas `indices`."""
+        info, valores = self._bruto(nome)
+        if info["tipo"] == "dict":
+            dicionario = info["dicionario"]
+            return [dicionario[valores[i]] for i in indices]
+        return [valores[i] for i in indices]
+
+    def contendo(self, nome, texto, indices):
+        """Linhas de `indices` cuja coluna contém `texto` (minúsculo). Nas
+        colunas de dicionário o texto é procurado uma vez por valor distinto."""
+        info, valores = self._bruto(nome)
+        if info["tipo"] == "dict":
+            contem = [texto in _texto(v) for v in info["dicionario"]]
+            return [i for i in indices if contem[valores[i]]]
+        return [i for i in indices if texto in _texto(valores[i])]
+
+    def linhas_em(self, indices):
+        colunas = [self.valores(nome, indices) for nome in self.colunas]
+        return [dict(zip(self.colunas, linha)) for linha in zip(*colunas)]
+
+    def linhas(self, colunas=None):
+        nomes = self.colunas if colunas is None else [c for c in self.colunas if c in colunas]
+        valores = [self.coluna(nome) for nome in nomes]
+        return [dict(zip(nomes, linha)) for linha in zip(*valores)]
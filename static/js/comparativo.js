@@ -1,12 +1,42 @@
 // ========== CONFIGURAÇÃO DE ROTA (FIX VPS) ==========
 const BASE_URL = window.location.pathname.substring(0, window.location.pathname.indexOf('/inventarios'));
 
-let dadosOriginais = [];
+// Filtro, busca e paginação rodam no servidor
+const ITENS_POR_PAGINA = 100;
+let paginaAtual = 1;
+let buscaAgendada = null;
 
 document.addEventListener('DOMContentLoaded', () => {
     carregarComparativo();
+    assinarEventos();
+    retomarAcompanhamentoSync();
 });
 
+// === ATUALIZAÇÃO AO VIVO (SSE) ===
+// Recarrega o comparativo quando chegam leituras, no máximo a cada 2s
+let recargaAgendada = null;
+
+function assinarEventos() {
+    if (!window.EventSource) return;
+    const fonte = new EventSource(`${BASE_URL}/api/inventarios/${INVENTARIO_ID}/eventos`);
+
+    fonte.addEventListener('item', () => {
+        if (recargaAgendada) return;
+        recargaAgendada = setTimeout(() => {
+            recargaAgendada = null;
+            carregarComparativo();
+        }, 2000);
+    });
+    fonte.addEventListener('status', (e) => {
+        const inv = JSON.parse(e.data);
+        mostrarAlert(`Inventário ${inv.status.toLowerCase()}`, 'warning');
+    });
+    fonte.addEventListener('removido', () => {
+        fonte.close();
+        mostrarAlert('Este inventário foi excluído', 'danger');
+    });
+}
+
 function mostrarAlert(mensagem, tipo = 'danger') {
     const alert = document.getElementById('alert');
     if(alert) {
@@ -19,49 +49,119 @@ function mostrarAlert(mensagem, tipo = 'danger') {
 }
 
 // === FUNÇÃO DE EXPORTAÇÃO ===
-function exportarExcel() {
-    window.location.href = `${BASE_URL}/api/inventarios/${INVENTARIO_ID}/comparativo/exportar`;
+function exportarExcel(formato = 'xlsx') {
+    window.location.href = `${BASE_URL}/api/inventarios/${INVENTARIO_ID}/comparativo/exportar?formato=${formato}`;
 }
 
-async function sincronizarEstoque() {
-    const btn = document.getElementById('btnSync');
-    if(!confirm("Atenção: Isso irá apagar os dados locais de estoque e baixar novamente da API.\nDeseja continuar?")) return;
+// === SINCRONIZAÇÃO EM SEGUNDO PLANO ===
+// O POST devolve o job na hora; o progresso é consultado a cada segundo
+const INTERVALO_PROGRESSO_MS = 1000;
+let textoOriginalSync = null;
+let acompanhandoSync = null;
 
-    const textoOriginal = btn.innerHTML;
-    btn.disabled = true;
-    btn.innerHTML = '⏳ Sincronizando...';
+async function sincronizarEstoque() {
+    if(!confirm("Atenção: Isso irá atualizar os dados locais de estoque com os da API.\nDeseja continuar?")) return;
 
     try {
         const response = await fetch(`${BASE_URL}/api/estoque/sincronizar`, { method: 'POST' });
         const data = await response.json();
 
         if (response.ok) {
-            mostrarAlert(data.mensagem, 'success');
-            carregarComparativo(); 
+            if (data.em_andamento) mostrarAlert('Já existe uma sincronização em andamento', 'warning');
+            acompanharSync(data.job);
         } else {
             mostrarAlert(data.erro || 'Erro ao sincronizar', 'danger');
         }
     } catch (err) {
         mostrarAlert('Erro de conexão: ' + err.message, 'danger');
-    } finally {
-        btn.disabled = false;
-        btn.innerHTML = textoOriginal;
     }
 }
 
-async function carregarComparativo() {
+// Ao abrir a página, continua mostrando uma sincronização já em andamento
+async function retomarAcompanhamentoSync() {
+    if (!document.getElementById('btnSync')) return;
+    try {
+        const response = await fetch(`${BASE_URL}/api/estoque/sincronizar`);
+        const data = await response.json();
+        if (data.job && data.job.status === 'Executando') acompanharSync(data.job, false);
+    } catch (err) {
+        console.error('Erro ao consultar sincronização:', err);
+    }
+}
+
+function textoProgressoSync(job) {
+    if (job.fase === 'aplicacao') return '⏳ Aplicando alterações...';
+    let texto = `⏳ Baixando ${job.processados} registros`;
+    if (job.percentual !== null) texto += ` (${job.percentual}%`;
+    if (job.eta_s !== null) texto += `, ~${job.eta_s}s`;
+    if (job.percentual !== null) texto += ')';
+    return texto;
+}
+
+function acompanharSync(job, avisarFim = true) {
+    const btn = document.getElementById('btnSync');
+    if (!btn || acompanhandoSync) return;
+    textoOriginalSync = textoOriginalSync || btn.innerHTML;
+    btn.disabled = true;
+    btn.innerHTML = textoProgressoSync(job);
+
+    const finalizar = () => {
+        clearInterval(acompanhandoSync);
+        acompanhandoSync = null;
+        btn.disabled = false;
+        btn.innerHTML = textoOriginalSync;
+    };
+
+    acompanhandoSync = setInterval(async () => {
+        try {
+            const response = await fetch(`${BASE_URL}/api/estoque/sincronizar/${job.id}`);
+            if (!response.ok) return finalizar();
+            const atual = (await response.json()).job;
+
+            if (atual.status === 'Executando') {
+                btn.innerHTML = textoProgressoSync(atual);
+                return;
+            }
+            finalizar();
+            if (atual.status === 'Erro') {
+                mostrarAlert(`Falha na sincronização: ${atual.erro}. Tente novamente para retomar.`, 'danger');
+                return;
+            }
+            const r = atual.relatorio;
+            if (avisarFim) {
+                mostrarAlert(r.aplicado
+                    ? `${r.total} itens sincronizados (${r.inseridos} novos, ${r.atualizados} alterados, ${r.removidos} removidos).`
+                    : 'API retornou lista vazia. Estoque não atualizado.',
+                    r.aplicado ? 'success' : 'warning');
+            }
+            carregarComparativo();
+        } catch (err) {
+            console.error('Erro ao consultar progresso:', err);
+        }
+    }, INTERVALO_PROGRESSO_MS);
+}
+
+async function carregarComparativo(pagina = paginaAtual) {
     const tbody = document.getElementById('tbodyComparativo');
     tbody.innerHTML = '<tr><td colspan="7" style="text-align:center; padding:20px;">Carregando dados...</td></tr>';
 
+    const params = new URLSearchParams({
+        pagina,
+        por_pagina: ITENS_POR_PAGINA,
+        status: document.getElementById('filterStatus').value,
+        busca: document.getElementById('searchInput').value.trim(),
+    });
+
     try {
-        const response = await fetch(`${BASE_URL}/api/inventarios/${INVENTARIO_ID}/comparativo`);
+        const response = await fetch(`${BASE_URL}/api/inventarios/${INVENTARIO_ID}/comparativo?${params}`);
         const data = await response.json();
         
         if (!response.ok) throw new Error(data.erro || "Erro ao carregar");
 
-        dadosOriginais = data;
-        renderizarTabela(dadosOriginais);
-        atualizarResumo(dadosOriginais);
+        paginaAtual = data.pagina;
+        renderizarTabela(data.linhas);
+        atualizarResumo(data.resumo);
+        renderizarPaginacao(data);
 
     } catch (err) {
         tbody.innerHTML = `<tr><td colspan="7" style="text-align:center; color:red;">Erro: ${err.message}</td></tr>`;
@@ -103,32 +203,32 @@ function renderizarTabela(dados) {
     }).join('');
 }
 
-function atualizarResumo(dados) {
-    const total = dados.length;
-    const divergentes = dados.filter(d => d.diferenca !== 0).length;
-    const corretos = total - divergentes;
+function atualizarResumo(resumo) {
+    const divergentes = resumo.falta + resumo.sobra;
 
-    document.getElementById('totalItens').innerText = total;
+    document.getElementById('totalItens').innerText = divergentes + resumo.ok;
     document.getElementById('totalDivergente').innerText = divergentes;
-    document.getElementById('totalCorreto').innerText = corretos;
+    document.getElementById('totalCorreto').innerText = resumo.ok;
 }
 
-function filtrarTabela() {
-    const termo = document.getElementById('searchInput').value.toLowerCase();
-    const status = document.getElementById('filterStatus').value;
-
-    const filtrados = dadosOriginais.filter(item => {
-        const matchTermo = 
-            item.cod_item.toLowerCase().includes(termo) || 
-            (item.descricao && item.descricao.toLowerCase().includes(termo)) ||
-            (item.mascara && item.mascara.toLowerCase().includes(termo));
-        
-        let matchStatus = true;
-        if (status === 'divergente') matchStatus = item.diferenca !== 0;
-        if (status === 'ok') matchStatus = item.diferenca === 0;
-
-        return matchTermo && matchStatus;
-    });
+function renderizarPaginacao(data) {
+    const div = document.getElementById('paginacao');
+    const paginas = Math.max(1, Math.ceil(data.filtrados / data.por_pagina));
+    if (paginas === 1) {
+        div.innerHTML = '';
+        return;
+    }
+    div.innerHTML = `
+        <button class="btn btn-secondary" ${data.pagina <= 1 ? 'disabled' : ''}
+            onclick="carregarComparativo(${data.pagina - 1})">Anterior</button>
+        <span>Página ${data.pagina} de ${paginas} (${data.filtrados} itens)</span>
+        <button class="btn btn-secondary" ${data.pagina >= paginas ? 'disabled' : ''}
+            onclick="carregarComparativo(${data.pagina + 1})">Próxima</button>
+    `;
+}
 
-    renderizarTabela(filtrados);
-}
\ No newline at end of file
+// A busca espera o usuário parar de digitar antes de consultar
+function filtrarTabela() {
+    clearTimeout(buscaAgendada);
+    buscaAgendada = setTimeout(() => carregarComparativo(1), 300);
+}
@@ -2,6 +2,19 @@
 const inventarioId = window.location.pathname.split('/')[2];
 let alertTimeout = null; // Para controlar o tempo do alerta no topo
 
+// Leituras enviadas (202) que ainda aguardam resolução no servidor
+const leiturasPendentes = new Set();
+let pollingAtivo = false;
+const POLLING_INTERVALO_MS = 700;
+// Com o feed SSE conectado o polling vira só uma rede de segurança
+const POLLING_INTERVALO_SSE_MS = 5000;
+let sseConectado = false;
+
+// Últimos itens exibidos e maior id já recebido (cursor para ?since=)
+const ITENS_EXIBIDOS = 3;
+let ultimosItens = [];
+let cursorItens = null;
+
 // ========== FUNÇÕES UTILITÁRIAS ==========
 
 // 1. Alerta no Topo da Tela
@@ -41,6 +54,10 @@ function mostrarScanStatus(tipo) {
     status.textContent = '⚠ Código já lido!';
     status.classList.add('warning'); // Laranja (NOVO)
   }
+  else if (tipo === 'pending') {
+    status.textContent = '⏳ Enviado';
+    status.classList.add('pending'); // Cinza
+  }
   else {
     status.textContent = '✕ Código inválido'; 
     status.classList.add('error');   // Vermelho
@@ -58,21 +75,32 @@ function mostrarScanStatus(tipo) {
 }
 
 // ========== CARREGAR ITENS SALVOS ==========
+// Busca só o que é novo desde o último cursor, não a lista inteira
 async function carregarItensSalvos() {
   try {
-    const response = await fetch(`/api/inventarios/${inventarioId}/itens`);
+    const params = new URLSearchParams({ limite: ITENS_EXIBIDOS });
+    if (cursorItens !== null) params.set('since', cursorItens);
+
+    const response = await fetch(`/api/inventarios/${inventarioId}/itens?${params}`, { cache: 'no-cache' });
     
     if (!response.ok) throw new Error("Falha ao buscar itens");
 
-    const itens = await response.json();
-    
-    // Apenas passamos a lista completa; o filtro de 3 itens ocorre no renderizarTabela
-    if (itens.length === 0) {
+    const pagina = await response.json();
+    cursorItens = pagina.cursor;
+
+    // Junta os novos com os já exibidos (sem repetir ids) e mantém os mais recentes
+    const idsNovos = new Set(pagina.itens.map(i => i.id));
+    ultimosItens = pagina.itens
+      .concat(ultimosItens.filter(i => !idsNovos.has(i.id)))
+      .sort((a, b) => b.id - a.id)
+      .slice(0, ITENS_EXIBIDOS);
+
+    if (ultimosItens.length === 0) {
       renderizarTabelaVazia();
       return;
     }
     
-    renderizarTabela(itens);
+    renderizarTabela(ultimosItens);
   } catch (err) {
     console.error(err); // Log silencioso ao carregar para não poluir a tela inicial
   }
@@ -91,8 +119,9 @@ async function adicionarItem() {
     return;
   }
 
+  // Envia a leitura bruta; o servidor responde 202 e resolve em segundo plano
   try {
-    const response = await fetch(`/api/inventarios/${inventarioId}/itens`, {
+    const response = await fetch(`/api/inventarios/${inventarioId}/leituras`, {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
       body: JSON.stringify({ cod_barra_ord: codigo })
@@ -105,46 +134,98 @@ async function adicionarItem() {
         throw new Error("Erro de comunicação com o servidor.");
     }
 
-    // === TRATAMENTO DE RESPOSTAS ===
-    if (!response.ok) {
-      
-      // CASO 1: Item Duplicado (Status 409 Conflict)
-      if (response.status === 409) {
-        mostrarScanStatus('duplicate'); // Mostra amarelo "Já lido"
-        mostrarAlert(resultado.erro, 'warning'); // Alerta amarelo no topo
-      } 
-      // CASO 2: Outros Erros (404 Não encontrado, 500 Erro server)
-      else {
-        mostrarScanStatus('error'); // Mostra vermelho "Inválido"
-        mostrarAlert(resultado.erro || 'Erro desconhecido', 'danger');
-      }
-
-      // Limpa e foca imediatamente para não travar a operação
-      codigoInput.value = ''; 
-      codigoInput.focus();
-      return;
+    if (response.status !== 202) {
+      mostrarScanStatus('error');
+      mostrarAlert(resultado.erro || 'Erro desconhecido', 'danger');
+    } else {
+      mostrarScanStatus('pending');
+      leiturasPendentes.add(resultado.id);
+      iniciarPolling();
     }
+  } catch (err) {
+    // Erro de Rede/Fetch
+    mostrarScanStatus('error');
+    mostrarAlert('Erro: ' + err.message, 'danger');
+  }
 
-    // === SUCESSO ===
-    mostrarScanStatus('success');
-
-    const msgSucesso = `Sucesso: ${resultado.dados.desc_tecnica}`;
-    mostrarAlert(msgSucesso, 'success');
+  // Limpa e foca imediatamente: o operador não espera a consulta à API
+  codigoInput.value = '';
+  codigoInput.focus();
+}
 
-    // Atualiza tabela
-    carregarItensSalvos();
-    
-    // Limpa e foca para o próximo
-    codigoInput.value = '';
-    codigoInput.focus();
+// ========== ACOMPANHAMENTO DAS LEITURAS ==========
+function iniciarPolling() {
+  if (pollingAtivo) return;
+  pollingAtivo = true;
+  setTimeout(verificarPendentes, POLLING_INTERVALO_MS);
+}
 
+async function verificarPendentes() {
+  if (!leiturasPendentes.size) {
+    pollingAtivo = false;
+    return;
+  }
+  try {
+    const ids = Array.from(leiturasPendentes).join(',');
+    const response = await fetch(`/api/inventarios/${inventarioId}/leituras?ids=${ids}`);
+    if (response.ok) {
+      const leituras = await response.json();
+      let adicionou = false;
+      leituras.forEach(leitura => {
+        if (tratarLeituraResolvida(leitura)) adicionou = true;
+      });
+      if (adicionou) carregarItensSalvos();
+    }
   } catch (err) {
-    // Erro de Rede/Fetch
+    console.error(err);
+  }
+  setTimeout(verificarPendentes, sseConectado ? POLLING_INTERVALO_SSE_MS : POLLING_INTERVALO_MS);
+}
+
+// Mostra o resultado de uma leitura enviada por este coletor; retorna true se adicionou
+function tratarLeituraResolvida(leitura) {
+  if (leitura.status === 'Pendente' || leitura.status === 'Processando') return false;
+  if (!leiturasPendentes.has(leitura.id)) return false;
+  leiturasPendentes.delete(leitura.id);
+  if (leitura.status === 'Adicionado') {
+    mostrarScanStatus('success');
+    mostrarAlert(`Sucesso: ${leitura.mensagem.replace(/^Adicionado: /, '')}`, 'success');
+    return true;
+  }
+  if (leitura.status === 'Duplicado') {
+    mostrarScanStatus('duplicate');
+    mostrarAlert(`${leitura.cod_barra_ord}: ${leitura.mensagem}`, 'warning');
+  } else {
     mostrarScanStatus('error');
-    mostrarAlert('Erro: ' + err.message, 'danger');
-    codigoInput.value = '';
-    codigoInput.focus();
+    mostrarAlert(`${leitura.cod_barra_ord}: ${leitura.mensagem || 'Erro desconhecido'}`, 'danger');
   }
+  return false;
+}
+
+// ========== FEED AO VIVO (SSE) ==========
+// Vários itens em sequência (ex.: lote) viram uma única busca incremental
+let recargaItens = null;
+function agendarRecargaItens() {
+  if (recargaItens) return;
+  recargaItens = setTimeout(() => {
+    recargaItens = null;
+    carregarItensSalvos();
+  }, 300);
+}
+
+// Recebe o resultado das próprias leituras e os itens lidos por outros coletores
+function assinarEventos() {
+  if (!window.EventSource) return;
+  const fonte = new EventSource(`/api/inventarios/${inventarioId}/eventos`);
+  fonte.onopen = () => { sseConectado = true; };
+  fonte.onerror = () => { sseConectado = false; };
+  fonte.addEventListener('leitura', (e) => tratarLeituraResolvida(JSON.parse(e.data)));
+  fonte.addEventListener('item', agendarRecargaItens);
+  // Ficou desconectado tempo demais para recuperar evento a evento
+  fonte.addEventListener('resync', agendarRecargaItens);
+  fonte.addEventListener('status', () => {
+    mostrarAlert('Inventário fechado: novas leituras serão recusadas', 'warning');
+  });
 }
 
 // ========== RENDERIZAÇÃO DA TABELA ==========
@@ -168,8 +249,8 @@ function renderizarTabela(itens) {
   }
 
   // === ALTERAÇÃO: Filtra apenas os 3 primeiros itens ===
-  // (Assumindo que a API já retorna ordenado por timestamp DESC)
-  const ultimos3 = itens.slice(0, 3);
+  // (Assumindo que a lista já vem ordenada do mais novo para o mais antigo)
+  const ultimos3 = itens.slice(0, ITENS_EXIBIDOS);
 
   tbody.innerHTML = ultimos3.map(item => `
     <tr class="last-scanned">
@@ -203,6 +284,7 @@ document.addEventListener('click', (e) => {
 // ========== INICIALIZAÇÃO ==========
 document.addEventListener('DOMContentLoaded', () => {
   carregarItensSalvos();
+  assinarEventos();
   
   // Pequeno delay para garantir foco no Android após renderizar
   setTimeout(() => {
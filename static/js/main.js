@@ -1,12 +1,45 @@
 document.addEventListener('DOMContentLoaded', function () {
-const data = window.initialData || [];
 const columns = window.columns || [];
 const visibilityKey = 'dt_col_visibility_v1';
 const filtersKey = 'dt_col_filters_v1';
 
 
+// Converte a requisição do DataTables para os parâmetros de /api/dashboard
+function dashboardParams(dt, porPagina) {
+const params = new URLSearchParams();
+params.set('pagina', String(Math.floor(dt.start / dt.length) + 1));
+params.set('por_pagina', porPagina || String(dt.length));
+if (dt.order && dt.order.length) {
+  params.set('ordenar', dt.columns[dt.order[0].column].data);
+  params.set('ordem', dt.order[0].dir);
+}
+if (dt.search && dt.search.value) params.set('busca', dt.search.value);
+dt.columns.forEach(c => {
+  if (c.search && c.search.value) params.set(`filtro[${c.data}]`, c.search.value);
+});
+return params;
+}
+
+async function fetchDashboard(params) {
+// O navegador revalida com If-None-Match e reaproveita a resposta em caso de 304
+const response = await fetch(`/api/dashboard?${params.toString()}`, { cache: 'no-cache' });
+if (!response.ok) throw new Error('Falha ao carregar dados');
+return response.json();
+}
+
 const table = $('#tabela').DataTable({
-data: data,
+serverSide: true,
+processing: true,
+ajax: function (dt, callback) {
+fetchDashboard(dashboardParams(dt))
+  .then(res => callback({
+    draw: dt.draw,
+    recordsTotal: res.total,
+    recordsFiltered: res.filtrados,
+    data: res.linhas
+  }))
+  .catch(() => callback({ draw: dt.draw, recordsTotal: 0, recordsFiltered: 0, data: [] }));
+},
 columns: columns.map(c => ({ 
   data: c, 
   title: c,
@@ -86,8 +119,16 @@ table.fixedColumns().update();
 });
 
 // Exporta Excel respeitando filtros e colunas visíveis
-document.getElementById('export-btn').addEventListener('click', function () {
-const filtered = table.rows({ search: 'applied' }).data().toArray();
+document.getElementById('export-btn').addEventListener('click', async function () {
+// Com paginação no servidor, busca todas as linhas filtradas de uma vez
+let filtered = [];
+try {
+  const res = await fetchDashboard(dashboardParams(table.ajax.params(), 'todos'));
+  filtered = res.linhas;
+} catch (e) {
+  alert('Erro ao buscar dados para exportar.');
+  return;
+}
 if (!filtered.length) {
 alert('Não há dados para exportar.');
 return;
@@ -1,20 +1,158 @@
-from httpx import get
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from time import perf_counter, sleep
+
+from httpx import Client, HTTPError, Limits, Timeout
 
 from visualizacao_de_dados.config import config
+from visualizacao_de_dados.join import (
+    build_rows,
+    group_nfs,
+    group_orders,
+    group_pdv,
+    group_stock,
+)
+from visualizacao_de_dados.stream import iter_json_array
+
+BASE_URL = 'https://olivar.foccoerp.com.br/FoccoIntegrador/api/v1/Exportacao/'
+TIMEOUT = config.get('TIMEOUT', 600)
+# Pelo menos uma tentativa, mesmo com 0 ou negativo no .config.toml
+MAX_RETRIES = max(1, int(config.get('MAX_RETRIES', 4)))
+BACKOFF = config.get('BACKOFF', 2)
+# Com PAGE_SIZE definido as exportações são lidas em páginas Skip/Take;
+# sem ele, o array 'value' é lido em streaming da resposta única.
+PAGE_SIZE = config.get('PAGE_SIZE')
+
+MAIN_ENDPOINTS = (
+    'dados_volumes',
+    'dados_pdv',
+    'dados_estoque',
+    'dados_ordens',
+    'dados_nfs',
+)
+
+# Só os volumes viram linhas do resultado; as demais exportações são
+# agregadas registro a registro, sem guardar a lista inteira.
+MAIN_REDUCERS = {
+    'dados_volumes': list,
+    'dados_pdv': group_pdv,
+    'dados_estoque': group_stock,
+    'dados_ordens': group_orders,
+    'dados_nfs': group_nfs,
+}
+
+# Duração, tentativas e linhas da última busca de cada exportação
+timings = {}
+
+_client = None
+_client_lock = Lock()
+
+
+class ExportError(Exception):
+    pass
+
+
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = Client(
+                base_url=BASE_URL,
+                headers={'Authorization': f'Bearer {config["TOKEN"]}'},
+                timeout=Timeout(TIMEOUT, connect=30),
+                limits=Limits(
+                    max_connections=len(MAIN_ENDPOINTS),
+                    max_keepalive_connections=len(MAIN_ENDPOINTS),
+                ),
+            )
+        return _client
+
+
+def _iter_stream(endpoint):
+    with get_client().stream(
+        'GET', endpoint, params={'Chave': config['KEY']}
+    ) as response:
+        response.raise_for_status()
+        yield from iter_json_array(response.iter_text())
+
+
+def _iter_pages(endpoint, page_size):
+    # Só a página vazia encerra: a API pode limitar o Take abaixo de
+    # page_size, e uma página curta no meio não significa o fim
+    skip = 0
+    while True:
+        response = get_client().get(
+            endpoint,
+            params={'Chave': config['KEY'], 'Skip': skip, 'Take': page_size},
+        )
+        response.raise_for_status()
+        page = response.json()['value']
+        if not page:
+            return
+        yield from page
+        skip += len(page)
+
+
+def iter_data(endpoint, page_size=None):
+    """Gera os registros de uma exportação sem carregá-la inteira.
+
+    A memória fica limitada a uma página (ou a um registro, em streaming).
+    """
+    page_size = page_size or PAGE_SIZE
+    if page_size:
+        return _iter_pages(endpoint, page_size)
+    return _iter_stream(endpoint)
+
+
+def fetch(endpoint, reduce=list):
+    """Aplica `reduce` aos registros de `endpoint`, com tentativas limitadas.
+
+    Cada tentativa refaz a leitura e a redução desde o início, então uma
+    falha no meio do download não duplica registros já agregados.
+    """
+    start = perf_counter()
+    last_error = None
+    for attempt in range(1, MAX_RETRIES + 1):
+        rows = 0
+
+        def counted(records):
+            nonlocal rows
+            for rows, record in enumerate(records, 1):
+                yield record
+
+        try:
+            data = reduce(counted(iter_data(endpoint)))
+        except (HTTPError, KeyError, ValueError) as error:
+            last_error = error
+            if attempt < MAX_RETRIES:
+                sleep(BACKOFF * 2 ** (attempt - 1))
+            continue
+        timings[endpoint] = {
+            'seconds': round(perf_counter() - start, 3),
+            'attempts': attempt,
+            'rows': rows,
+        }
+        return data
+    raise ExportError(
+        f'{endpoint}: falhou após {MAX_RETRIES} tentativas ({last_error!r})'
+    ) from last_error
 
 
 def get_data(endpoint):
-    try:
-        return get(
-            f'https://olivar.foccoerp.com.br/FoccoIntegrador/api/v1/Exportacao/{endpoint}',
-            headers={
-                'Authorization': f'Bearer {config["TOKEN"]}',
-            },
-            params={'Chave': config['KEY']},
-            timeout=10000,
-        ).json()['value']
-    except KeyError:
-        return get_data(endpoint)
+    return fetch(endpoint)
+
+
+def fetch_all(reducers):
+    """Busca e reduz as exportações em paralelo sobre o mesmo client.
+
+    O tempo total passa a ser o da exportação mais lenta, não a soma.
+    """
+    with ThreadPoolExecutor(max_workers=len(reducers)) as executor:
+        futures = {
+            endpoint: executor.submit(fetch, endpoint, reduce)
+            for endpoint, reduce in reducers.items()
+        }
+        return {endpoint: future.result() for endpoint, future in futures.items()}
 
 
 def get_volume_data():
@@ -42,85 +180,11 @@ def get_charge_data():
 
 
 def get_main_data():
-    data = get_volume_data()
-    result = []
-    pdv_data = get_pdv_data()
-    stock_data = get_stock_data()
-    order_data = get_order_data()
-    nfs_data = get_nfs_data()
-    for item in data:
-        fat_stock = sum(
-            [
-                int(d['almox15'])
-                for d in stock_data
-                if d['cod_item'] == item['codigo_produto']
-                and d['mascara'] == item['mascara']
-            ]
-        )
-        emp_1 = sum(
-            int(d['almox5'])
-            for d in stock_data
-            if d['cod_item'] == item['codigo_produto']
-            and d['mascara'] == item['mascara']
-        )
-        emp_2 = sum(
-            int(d['almoxtodos'])
-            for d in stock_data
-            if d['cod_item'] == item['codigo_produto']
-            and d['mascara'] == item['mascara']
-        )
-        general_stock = fat_stock + emp_1 + emp_2
-        pdv_amount = sum(
-            [
-                d['qtde']
-                for d in pdv_data
-                if d['cod_item'] == item['codigo_produto']
-                and d['mascara'] == item['mascara']
-            ]
-        )
-        order_amount = sum(
-            [
-                d['qtde_pendente']
-                for d in order_data
-                if d['cod_item'] == item['codigo_produto']
-                and d['mascara'] == item['mascara']
-            ]
-        )
-        monthly_average = sum(
-            [
-                d['media']
-                for d in nfs_data
-                if d['cod_item'] == item['codigo_produto']
-                and d['mascara'] == item['mascara']
-            ]
-        )
-        result.append(
-            {
-                'COD EMP': item['codigo_empresa'],
-                'COD ITEM': item['codigo_produto'],
-                'DESC TECNICA': item['produto'],
-                'CONFIGURACAO': item['mascara'],
-                'VOLUME': item['vol'],
-                'ID MASCARA': item['tmasc_item_id'],
-                'EM LINHA': item['em_linha'],
-                'QTDE PDV': pdv_amount,
-                'ESTOQUE FAT': fat_stock,
-                'ESTOQUE GERAL': general_stock,
-                'DISPONIVEL': general_stock - pdv_amount,
-                'QTDE ORDEM': order_amount,
-                'DISPONIVEL PREVISTO': general_stock
-                - pdv_amount
-                + order_amount,
-                'MEDIA MENSAL': monthly_average,
-                'NECESSIDADE': general_stock
-                - pdv_amount
-                + order_amount
-                - monthly_average,
-                'SUGESTÃO': 'Produzir'
-                if general_stock - pdv_amount + order_amount - monthly_average
-                < 0
-                else '',
-                'PRODUZIR CALCULADO': '',
-            }
-        )
-    return result
+    data = fetch_all(MAIN_REDUCERS)
+    return build_rows(
+        data['dados_volumes'],
+        data['dados_pdv'],
+        data['dados_estoque'],
+        data['dados_ordens'],
+        data['dados_nfs'],
+    )
@@ -0,0 +1,107 @@
+from collections import defaultdict
+from operator import itemgetter
+
+
+def item_key(row):
+    return (row['cod_item'], row['mascara'])
+
+
+def group_sums(rows, *fields, convert=None, floats=False):
+    """Agrupa `rows` uma única vez por (cod_item, mascara) somando `fields`.
+
+    A ordem das somas é a mesma da varredura linear original. Com
+    `floats=True` os valores de cada chave são guardados e somados com sum()
+    no fim, como no original: para floats, o sum() do Python 3.12+ usa soma
+    compensada, que `+=` não reproduz. Campos inteiros somam direto.
+    """
+    if floats:
+        return _group_float_sums(rows, fields, convert)
+    totals = {}
+    size = len(fields)
+    for row in rows:
+        key = item_key(row)
+        acc = totals.get(key)
+        if acc is None:
+            acc = totals[key] = [0] * size
+        for index, field in enumerate(fields):
+            value = row[field]
+            acc[index] += value if convert is None else convert(value)
+    return totals
+
+
+def _group_float_sums(rows, fields, convert):
+    values = defaultdict(list)
+    pick = itemgetter(*fields)
+    for row in rows:
+        values[item_key(row)].append(pick(row))
+
+    def total(column):
+        return sum(column if convert is None else map(convert, column))
+
+    if len(fields) == 1:
+        return {key: [total(column)] for key, column in values.items()}
+    return {key: [total(column) for column in zip(*picked)] for key, picked in values.items()}
+
+
+def group_stock(rows):
+    return group_sums(rows, 'almox15', 'almox5', 'almoxtodos', convert=int)
+
+
+def group_pdv(rows):
+    return group_sums(rows, 'qtde', floats=True)
+
+
+def group_orders(rows):
+    return group_sums(rows, 'qtde_pendente')
+
+
+def group_nfs(rows):
+    return group_sums(rows, 'media', floats=True)
+
+
+def join_main_data(volume_data, pdv_data, stock_data, order_data, nfs_data):
+    return build_rows(
+        volume_data,
+        group_pdv(pdv_data),
+        group_stock(stock_data),
+        group_orders(order_data),
+        group_nfs(nfs_data),
+    )
+
+
+def build_rows(volume_data, pdv, stock, orders, nfs):
+    no_stock = (0, 0, 0)
+    no_amount = (0,)
+    result = []
+    for item in volume_data:
+        key = (item['codigo_produto'], item['mascara'])
+        fat_stock, emp_1, emp_2 = stock.get(key, no_stock)
+        general_stock = fat_stock + emp_1 + emp_2
+        pdv_amount = pdv.get(key, no_amount)[0]
+        order_amount = orders.get(key, no_amount)[0]
+        monthly_average = nfs.get(key, no_amount)[0]
+        available = general_stock - pdv_amount
+        expected = available + order_amount
+        need = expected - monthly_average
+        result.append(
+            {
+                'COD EMP': item['codigo_empresa'],
+                'COD ITEM': item['codigo_produto'],
+                'DESC TECNICA': item['produto'],
+                'CONFIGURACAO': item['mascara'],
+                'VOLUME': item['vol'],
+                'ID MASCARA': item['tmasc_item_id'],
+                'EM LINHA': item['em_linha'],
+                'QTDE PDV': pdv_amount,
+                'ESTOQUE FAT': fat_stock,
+                'ESTOQUE GERAL': general_stock,
+                'DISPONIVEL': available,
+                'QTDE ORDEM': order_amount,
+                'DISPONIVEL PREVISTO': expected,
+                'MEDIA MENSAL': monthly_average,
+                'NECESSIDADE': need,
+                'SUGESTÃO': 'Produzir' if need < 0 else '',
+                'PRODUZIR CALCULADO': '',
+            }
+        )
+    return result
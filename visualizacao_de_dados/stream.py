@@ -0,0 +1,102 @@
+from json import JSONDecodeError, JSONDecoder
+
+_decoder = JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+# Caracteres que, no fim do pedaço, ainda podem continuar um número (1. 1e 1e+)
+_NUMBER_CONTINUATION = '.eE+-'
+
+
+class _Buffer:
+    """Texto lido sob demanda de um iterador de pedaços (chunks)."""
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.text = ''
+        self.pos = 0
+        self.done = False
+
+    def more(self):
+        for chunk in self.chunks:
+            if chunk:
+                # Descarta o que já foi consumido para manter o buffer pequeno
+                self.text = self.text[self.pos:] + chunk
+                self.pos = 0
+                return True
+        self.done = True
+        return False
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self.more():
+                raise ValueError('JSON terminou antes do esperado')
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f'Esperado {char!r} na posição {self.pos}')
+        self.pos += 1
+
+    def decode(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.text, self.pos)
+            except JSONDecodeError:
+                if not self.more():
+                    raise
+                continue
+            # Um número pode estar cortado no fim do pedaço atual: terminando
+            # nele ou seguido só de '.', 'e' ou sinal de expoente
+            if not self.done and self._may_continue(value, end) and self.more():
+                continue
+            self.pos = end
+            return value
+
+    def _may_continue(self, value, end):
+        rest = len(self.text) - end
+        if rest == 0:
+            return True
+        if rest > 2 or isinstance(value, bool) or not isinstance(value, (int, float)):
+            return False
+        return all(c in _NUMBER_CONTINUATION for c in self.text[end:])
+
+
+def _iter_array(buffer):
+    buffer.expect('[')
+    if buffer.peek() == ']':
+        buffer.pos += 1
+        return
+    while True:
+        yield buffer.decode()
+        if buffer.peek() == ']':
+            buffer.pos += 1
+            return
+        buffer.expect(',')
+
+
+def iter_json_array(chunks, key='value'):
+    """Percorre `chunks` de um objeto JSON e gera cada item de `obj[key]`.
+
+    `key` pode ser uma tupla de chaves aceitas (vale a primeira encontrada);
+    se o documento já for um array, seus itens são gerados diretamente.
+    Só o item atual fica em memória, não o corpo nem a lista inteira.
+    """
+    keys = (key,) if isinstance(key, str) else tuple(key)
+    buffer = _Buffer(chunks)
+    if buffer.peek() == '[':
+        yield from _iter_array(buffer)
+        return
+    buffer.expect('{')
+    while buffer.peek() != '}':
+        name = buffer.decode()
+        buffer.expect(':')
+        if name in keys:
+            yield from _iter_array(buffer)
+            return
+        buffer.decode()
+        if buffer.peek() == ',':
+            buffer.pos += 1
+    raise KeyError(keys[0] if len(keys) == 1 else keys)